@@ -1,5 +1,30 @@
-import os
+import base64
+import sys
+import zlib
+from urllib.parse import urlparse
+
+
+def read_runner(event):
+    # With a payload store the runner is read from it (runner_uri), otherwise
+    # it is sent inline with the task.
+    if 'runner_uri' not in event:
+        return zlib.decompress(base64.b64decode(event['runner']))
+    parsed_uri = urlparse(event['runner_uri'])
+    if parsed_uri.scheme in ('', 'file'):
+        with open(parsed_uri.path, 'rb') as runner_file:
+            return zlib.decompress(runner_file.read())
+    import boto3
+    return zlib.decompress(boto3.client('s3', endpoint_url=event.get('endpoint_url', None)).get_object(
+        Bucket=parsed_uri.netloc, Key=parsed_uri.path.lstrip('/'))['Body'].read())
+
+
 def handler(event, context):
-    response = exec(event['python_str'])
-    print('CLOUDWATCHER',os.environ['AWS_LAMBDA_LOG_STREAM_NAME'],event['hash'],'OBTAINED_CLOUDWATCHER')
-    return response
\ No newline at end of file
+    # The TwinGraph runner is sent along with the task unless it is installed
+    # in the image (lambda_config "runner_installed"), it is loaded once per
+    # Lambda execution environment.
+    if 'twingraph.runner' not in sys.modules:
+        try:
+            import twingraph.runner
+        except ImportError:
+            exec(read_runner(event), {})
+    return sys.modules['twingraph.runner'].handle_lambda_event(event)
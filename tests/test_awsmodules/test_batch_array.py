@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import pytest
+from twingraph.awsmodules import clients
+from twingraph.awsmodules.batch import submit_batch_job, job_poller
+from twingraph.orchestration.orchestration_utils import run_aws_batch_array
+
+SOURCE_CODE = '''
+def Func_C_subtract(input_1: float, input_2: float) -> NamedTuple:
+    from collections import namedtuple
+    outputs = namedtuple("outputs", ["subtraction"])
+    return outputs(input_1 - input_2)
+'''
+
+ROOT_DIR = os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
+
+
+class BatchStandIn:
+    """Local stand-in for the Batch and CloudWatch Logs APIs, array children run the submitted command."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.logs = {}
+        self.submit_calls = 0
+        self.log_calls = 0
+
+    def client(self, service_name, region_name=None, endpoint_url=None):
+        assert endpoint_url == 'http://localhost:4566'
+        return self
+
+    def submit_job(self, jobName, jobQueue, jobDefinition, containerOverrides, arrayProperties=None):
+        self.submit_calls += 1
+        job_id = 'array-' + str(self.submit_calls)
+        size = arrayProperties['size']
+        env = dict(os.environ, **{variable['name']: variable['value']
+                   for variable in containerOverrides['environment']})
+        for index in range(size):
+            env['AWS_BATCH_JOB_ARRAY_INDEX'] = str(index)
+            output = subprocess.run(containerOverrides['command'], cwd=ROOT_DIR, env=env,
+                                    stdout=subprocess.PIPE).stdout.decode()
+            log_stream = jobName + '/default/' + str(index)
+            self.logs[log_stream] = output.split('\n')
+            self.jobs[job_id + ':' + str(index)] = {'jobId': job_id + ':' + str(index), 'status': 'SUCCEEDED', 'arrayProperties': {
+                'index': index}, 'container': {'logStreamName': log_stream}}
+        self.jobs[job_id] = {'jobId': job_id, 'status': 'SUCCEEDED',
+                             'arrayProperties': {'size': size}}
+        return {'jobId': job_id}
+
+    def describe_jobs(self, jobs):
+        assert len(jobs) <= 100
+        return {'jobs': [self.jobs[job_id] for job_id in jobs]}
+
+    def get_log_events(self, logGroupName, logStreamName, startFromHead=True, nextToken=None):
+        # pages of 2 events, read from the tail
+        self.log_calls += 1
+        events = [{'message': line} for line in self.logs[logStreamName]]
+        end = len(events) if nextToken is None else int(nextToken)
+        start = max(0, end - 2)
+        return {'events': events[start:end], 'nextBackwardToken': str(start)}
+
+
+def test_batch_array_job(monkeypatch):
+    """Test that a fan-out is submitted as one array job and each index gets its own outputs."""
+    stand_in = BatchStandIn()
+    monkeypatch.setattr(clients, 'create_client', stand_in.client)
+    monkeypatch.setattr(clients, '_clients', {})
+    monkeypatch.setattr(job_poller, '_pollers', {})
+    monkeypatch.setattr(submit_batch_job, 'exponential_backoff',
+                        lambda base_delay, exponent, try_id: 0)
+
+    batch_config = {'region_name': 'us-east-1', 'jobQueue': 'queue', 'logGroupName': '/aws/batch/job',
+                    'endpoint_url': 'http://localhost:4566', 'logs_endpoint_url': 'http://localhost:4566'}
+    input_dicts = [{'input_1': 10, 'input_2': n} for n in range(3)]
+    attributes_list = [{'Name': 'Func_C_subtract', 'Hash': 'hash_' + str(n),
+                        'Source Code': SOURCE_CODE} for n in range(3)]
+    ioutputs_list = run_aws_batch_array(input_dicts, attributes_list, batch_config, runner_config={
+                                        'python': sys.executable, 'installed': True})
+
+    assert stand_in.submit_calls == 1
+    assert stand_in.log_calls == 3
+    assert [ioutputs.subtraction for ioutputs in ioutputs_list] == [10, 9, 8]
+    assert [attributes['AWS Batch Array Index']
+            for attributes in attributes_list] == [0, 1, 2]
+
+
+def test_split_result_frame():
+    """Test that a result frame split across CloudWatch events is joined again."""
+    from collections import namedtuple
+    from twingraph.runner import encode_result, decode_result
+    outputs = namedtuple('outputs', ['subtraction'])
+    frame = encode_result(outputs(7))[0]
+    stand_in = BatchStandIn()
+    stand_in.logs['stream'] = ['starting', frame[:30],
+                               frame[30:40], frame[40:], 'exiting']
+    assert decode_result(submit_batch_job.find_result_event(
+        stand_in, '/aws/batch/job', 'stream'))[0].subtraction == 7
+
+    stand_in.logs['stream'] = ['starting', frame[30:40], frame[40:]]
+    with pytest.raises(Exception, match='incomplete'):
+        submit_batch_job.find_result_event(
+            stand_in, '/aws/batch/job', 'stream')
+
+
+def test_batch_array_over_limit(monkeypatch):
+    """Test that an inline array over the Batch request limit fails before it is submitted."""
+    stand_in = BatchStandIn()
+    monkeypatch.setattr(clients, 'create_client', stand_in.client)
+    monkeypatch.setattr(clients, '_clients', {})
+
+    batch_config = {'region_name': 'us-east-1', 'jobQueue': 'queue', 'logGroupName': '/aws/batch/job',
+                    'endpoint_url': 'http://localhost:4566'}
+    input_dicts = [{'input_1': os.urandom(8192).hex(), 'input_2': n}
+                   for n in range(3)]
+    attributes_list = [{'Name': 'Func_C_subtract', 'Hash': 'hash_' + str(n),
+                        'Source Code': SOURCE_CODE} for n in range(3)]
+    with pytest.raises(Exception, match='limit'):
+        run_aws_batch_array(input_dicts, attributes_list,
+                            batch_config, runner_config={'installed': True})
+    assert stand_in.submit_calls == 0
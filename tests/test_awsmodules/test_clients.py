@@ -0,0 +1,19 @@
+import threading
+from twingraph.awsmodules import clients
+
+
+def test_cached_clients(monkeypatch):
+    """Test that one client is created per service, region and endpoint, also from many threads."""
+    monkeypatch.setattr(clients, '_clients', {})
+    created = []
+    client_a = clients.get_client('batch', 'us-east-1')
+    threads = [threading.Thread(target=lambda: created.append(
+        clients.get_client('batch', 'us-east-1'))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(client is client_a for client in created)
+    assert clients.get_client('batch', 'us-west-2') is not client_a
+    assert client_a.meta.config.retries['mode'] == 'standard'
+    assert client_a.meta.config.max_pool_connections == clients._config['max_pool_connections']
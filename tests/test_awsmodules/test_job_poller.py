@@ -0,0 +1,64 @@
+import pytest
+import time
+from twingraph.awsmodules import clients
+from twingraph.awsmodules.batch.job_poller import BatchJobPoller
+
+
+class DescribeJobsStandIn:
+    """Batch stand-in whose jobs succeed after a number of DescribeJobs rounds."""
+
+    def __init__(self, rounds):
+        self.rounds = rounds
+        self.calls = []
+
+    def client(self, service_name, region_name=None, endpoint_url=None):
+        return self
+
+    def describe_jobs(self, jobs):
+        self.calls.append(len(jobs))
+        status = 'SUCCEEDED' if len(self.calls) > self.rounds else 'RUNNING'
+        return {'jobs': [{'jobId': job_id, 'status': status} for job_id in jobs]}
+
+
+def test_shared_poller(monkeypatch):
+    """Test that all jobs in flight are described 100 at a time by one poller."""
+    stand_in = DescribeJobsStandIn(rounds=3)
+    monkeypatch.setattr(clients, 'create_client', stand_in.client)
+    monkeypatch.setattr(clients, '_clients', {})
+    poller = BatchJobPoller('us-east-1', min_interval=0.01)
+    futures = [poller.watch('job-' + str(n)) for n in range(250)]
+    assert all(future.result(timeout=10)['status'] == 'SUCCEEDED' for future in futures)
+    assert max(stand_in.calls) == 100
+    assert len(stand_in.calls) <= 3 * 4
+    assert poller.poll_interval(250) == 1.5
+    assert poller.poll_interval(10000) == 50.0
+
+
+class FailingDescribeJobs(DescribeJobsStandIn):
+    """Batch stand-in which rejects the job id 'bad' and never returns 'lost'."""
+
+    def describe_jobs(self, jobs):
+        self.calls.append(len(jobs))
+        if 'bad' in jobs:
+            raise Exception('Invalid job id bad')
+        return {'jobs': [{'jobId': job_id, 'status': 'SUCCEEDED' if len(self.calls) > self.rounds else 'RUNNING'}
+                         for job_id in jobs if job_id != 'lost']}
+
+
+def test_failed_jobs(monkeypatch):
+    """Test that jobs which cannot be described fail their futures without failing the others."""
+    stand_in = FailingDescribeJobs(rounds=1)
+    monkeypatch.setattr(clients, 'create_client', stand_in.client)
+    monkeypatch.setattr(clients, '_clients', {})
+    poller = BatchJobPoller('us-east-1', min_interval=0.01,
+                            max_interval=0.01, max_failures=3, not_found_timeout=0.5)
+    start_time = time.time()
+    good, bad, lost = [poller.watch(job_id) for job_id in ('good', 'bad', 'lost')]
+    assert good.result(timeout=10)['status'] == 'SUCCEEDED'
+    with pytest.raises(Exception, match='Invalid job id bad'):
+        bad.result(timeout=10)
+    with pytest.raises(Exception, match='lost was not found'):
+        lost.result(timeout=10)
+    # missing from DescribeJobs for many rounds, but only failed after the timeout
+    assert time.time() - start_time >= 0.5
+    assert len(stand_in.calls) > 10
@@ -0,0 +1,52 @@
+import json
+import zlib
+import pytest
+from twingraph import runner
+from twingraph.orchestration import orchestration_utils
+from twingraph.storage.object_store import resolve_uri
+
+SOURCE_CODE = '''
+def Func_A_sum(values: list) -> NamedTuple:
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1"])
+    return poutput(sum(values))
+'''
+
+
+class InvokeStandIn:
+    """Lambda stand-in which runs the event with the runner in this process."""
+
+    def __init__(self):
+        self.events = []
+
+    def invoke(self, function_name, payload, region, invocation_type='RequestResponse'):
+        self.events.append(json.loads(payload))
+        return runner.handle_lambda_event(self.events[-1])['result']
+
+
+def test_lambda_runner_and_inputs_in_store(tmp_path, monkeypatch):
+    """Test that with a payload store the runner and the inputs above the Event limit are sent by URI."""
+    stand_in = InvokeStandIn()
+    monkeypatch.setattr(orchestration_utils.lambd_functions, 'invoke_lambd_function', stand_in.invoke)
+    monkeypatch.setattr(orchestration_utils, '_stored_bootstrap_uris', {})
+    payload_store_config = {'uri': 'file://' + str(tmp_path), 'threshold_bytes': 1024 ** 3}
+    values = list(range(100000))
+    for invocation_type in ['Event', 'RequestResponse']:
+        ioutputs = orchestration_utils.run_lambda({'values': values}, {'Name': 'Func_A_sum', 'Hash': 'hash_' + invocation_type, 'Source Code': SOURCE_CODE}, {
+            'region_name': 'us-east-1', 'invocation_type': invocation_type, 'timeout': 5}, {}, payload_store_config)
+        assert ioutputs.output_1 == sum(values)
+    event, request = stand_in.events
+    assert 'runner' not in event and 'inputs_uri' in runner.decode_envelope(event['task'])
+    assert 'runner' not in request and 'inputs' in runner.decode_envelope(request['task'])
+    assert zlib.decompress(resolve_uri(event['runner_uri'])).decode() == runner.bootstrap_source()
+    assert len(json.dumps(event)) < orchestration_utils.LAMBDA_EVENT_LIMIT
+
+
+def test_lambda_payload_limit(monkeypatch):
+    """Test that an event over the Lambda payload limit fails before it is sent."""
+    stand_in = InvokeStandIn()
+    monkeypatch.setattr(orchestration_utils.lambd_functions, 'invoke_lambd_function', stand_in.invoke)
+    with pytest.raises(Exception, match='payload_store_config'):
+        orchestration_utils.run_lambda({'values': list(range(2000000))}, {'Name': 'Func_A_sum', 'Hash': 'hash_a', 'Source Code': SOURCE_CODE}, {
+            'region_name': 'us-east-1'})
+    assert stand_in.events == []
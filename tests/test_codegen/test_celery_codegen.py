@@ -0,0 +1,186 @@
+import ast
+import os
+import subprocess
+import sys
+import textwrap
+from twingraph.orchestration.celery_codegen import cached_modules, codegen_key, component_names, include_module_names, is_decorated, remote_component_names, rewrite_include, rewrite_pipeline
+
+DECORATOR = "@app.task(trail=True, queue='demo',routing_key='demo@localhost')"
+
+INCLUDE_SOURCE = textwrap.dedent('''\
+    from twingraph import component, pipeline
+    from components.component_1 import helper
+
+
+    def utility(x):
+        return x
+
+
+    @component()
+    def Func_A(input_1: float) -> NamedTuple:
+        from collections import namedtuple
+        outputs_namedtuple = namedtuple('outputs', ['sum'])
+        return outputs_namedtuple(input_1)
+
+
+    @pipeline(celery_pipeline=True)
+    def demo():
+        Func_A(1)
+
+
+    demo()
+    if __name__ == '__main__':
+        demo()
+    ''')
+
+
+def test_rewrite_include():
+    """Test that the task decorator is added to components and the pipeline is removed."""
+    source, components, functions = rewrite_include(
+        INCLUDE_SOURCE, DECORATOR, ['demo'], include_module_names(['components/component_1.py'], '.'))
+    assert components == ['Func_A']
+    assert functions == ['utility', 'Func_A']
+    assert DECORATOR + '\n@component()\ndef Func_A' in source
+    assert 'def demo' not in source and 'demo()' not in source
+    assert 'components.component_1' not in source
+    assert "namedtuple('outputs', ['sum'])" in source
+
+
+def test_io_routing():
+    """Test that components on remote backends get the I/O task decorator and map chunk task."""
+    source = textwrap.dedent('''\
+        @component(batch_task=True, batch_config=config)
+        def Func_A(x):
+            pass
+
+
+        @component(docker_id='python:3.11')
+        def Func_B(x):
+            pass
+
+
+        @component(kubernetes_task=False, docker_id='NotProvided')
+        def Func_C(x):
+            pass
+
+
+        @component()
+        def Func_D(x):
+            pass
+        ''')
+    io_decorator = "@app.task(queue='demo.io')"
+    rewritten, components, _ = rewrite_include(
+        source, DECORATOR, ['demo'], set(), io_decorator)
+    assert remote_component_names(source) == ['Func_A', 'Func_B']
+    assert rewritten.count(io_decorator + '\n@component(') == 2
+    assert rewritten.count(DECORATOR + '\n@component(') == 2
+    assert io_decorator + '\n@component(docker_id=' in rewritten
+
+    pipeline_source = rewrite_pipeline(
+        'def demo():\n    Func_A.map(elements)\n    Func_C.map(elements)\n', 'demo', components, ['Func_A', 'Func_B'])
+    assert "celery_map(twingraph_map_chunk_io, 'Func_A', elements)" in pipeline_source
+    assert "celery_map(twingraph_map_chunk, 'Func_C', elements)" in pipeline_source
+
+
+def test_rewrite_pipeline_scoping():
+    """Test that only calls of components which are not rebound in the pipeline are rewritten."""
+    source = textwrap.dedent('''\
+        @pipeline(celery_pipeline=True)
+        def demo():
+            result_1 = Func_A(1)
+            results = Func_A.map([{'input_1': 2}])
+            tools.Func_A(3)
+            Func_C = print
+            Func_C('Func_A(')
+        ''')
+    pipeline_source = rewrite_pipeline(
+        source, 'demo', ['Func_A', 'Func_B', 'Func_C'])
+    assert '@pipeline' not in pipeline_source
+    assert 'result_1 = celery_submit(Func_A, 1)' in pipeline_source
+    assert "celery_map(twingraph_map_chunk, 'Func_A', [{'input_1': 2}])" in pipeline_source
+    assert 'tools.Func_A(3)' in pipeline_source
+    assert "Func_C('Func_A(')" in pipeline_source
+
+
+def test_rewrite_pipeline_references():
+    """Test that results passed to components become references and other reads are fetched in the driver."""
+    source = textwrap.dedent('''\
+        def demo():
+            a = Func_A(1)
+            b = Func_B(a['outputs']['sum'], [a['outputs'][1:2]], input_2=float(a['outputs']['sum']), parent_hash=[a['hash']])
+            print(b['outputs']['product'])
+            parent_hash = [a['hash'], b.hash, b['outputs']['hash']]
+            Func_B(1, parent_hash=parent_hash)
+        ''')
+    pipeline_source = rewrite_pipeline(source, 'demo', ['Func_A', 'Func_B'])
+    assert "b = celery_submit(Func_B, result_ref(a, 'outputs', 'sum'), [result_value(a)['outputs'][1:2]], input_2=float(result_value(a)['outputs']['sum']), parent_hash=[result_ref(a, 'hash')])" in pipeline_source
+    assert "print(result_value(b)['outputs']['product'])" in pipeline_source
+    assert "parent_hash = [result_ref(a, 'hash'), result_ref(b, 'hash'), result_value(b)['outputs']['hash']]" in pipeline_source
+
+
+def test_rewrite_pipeline_map_references():
+    """Test that results passed to a map, also within comprehensions, become references."""
+    source = textwrap.dedent('''\
+        def demo():
+            a = Func_A.map([{'input_1': n} for n in range(3)])
+            b = Func_B.map([{'input_1': a_k['outputs']['sum'], 'input_2': n} for n, a_k in enumerate(a)], parent_hash=[a[0].hash])
+        ''')
+    pipeline_source = rewrite_pipeline(source, 'demo', ['Func_A', 'Func_B'])
+    assert "b = celery_map(twingraph_map_chunk, 'Func_B', [{'input_1': result_ref(a_k, 'outputs', 'sum'), 'input_2': n} for n, a_k in enumerate(a)], parent_hash=[result_ref(a[0], 'hash')])" in pipeline_source
+
+
+def test_rewrite_pipeline_output_fields():
+    """Test that output fields read as attributes of the results become references too."""
+    source = textwrap.dedent('''\
+        def demo():
+            a = Func_A(1)
+            b = Func_B(a.outputs.sum, a.outputs['sum'], parent_hash=a.hash)
+            print(b.outputs.product, config.outputs)
+        ''')
+    pipeline_source = rewrite_pipeline(source, 'demo', ['Func_A', 'Func_B'])
+    assert "b = celery_submit(Func_B, result_ref(a, 'outputs', 'sum'), result_ref(a, 'outputs', 'sum'), parent_hash=result_ref(a, 'hash'))" in pipeline_source
+    assert "print(result_value(b)['outputs']['product'], config.outputs)" in pipeline_source
+
+
+def test_examples_hash_references():
+    """Test that the hashes read in the Celery example pipelines are never fetched in the driver."""
+    example_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'examples', 'orchestration_demos')
+    pipeline_sources = {}
+    for demo in sorted(os.listdir(example_dir)):
+        for file_name in sorted(os.listdir(os.path.join(example_dir, demo))):
+            if not file_name.endswith('.py'):
+                continue
+            with open(os.path.join(example_dir, demo, file_name)) as source_file:
+                source = source_file.read()
+            if 'celery_pipeline=True' not in source:
+                continue
+            tree = ast.parse(source)
+            components = component_names(tree)
+            for component_file in ['components/component_1.py', 'components/component_2.py']:
+                if component_file in source:
+                    with open(os.path.join(example_dir, demo, component_file)) as component_source:
+                        components += component_names(ast.parse(component_source.read()))
+            for node in tree.body:
+                if is_decorated(node, 'pipeline'):
+                    pipeline_sources[demo, node.name] = rewrite_pipeline(source, node.name, components)
+    assert len(pipeline_sources) == 7
+    assert "parent_hash = [result_ref(func_A, 'hash'), result_ref(func_B, 'hash')]" in pipeline_sources['demo_4_celery_backend', 'test_orchestration']
+    for pipeline_source in pipeline_sources.values():
+        assert "['hash']" not in pipeline_source
+
+
+def test_cached_modules(tmp_path):
+    """Test that the generated modules are written once per key and run from their bytecode."""
+    key = codegen_key('demo', INCLUDE_SOURCE)
+    assert key == codegen_key('demo', INCLUDE_SOURCE)
+    assert key != codegen_key('demo', INCLUDE_SOURCE + '\n')
+    cache_dir = str(tmp_path / ('demo_' + key[:32]))
+    modules = {'tasks_demo.py': 'VALUE = 1\n', 'components.json': '[]'}
+    assert cached_modules(cache_dir, modules) == (cache_dir, False)
+    assert cached_modules(cache_dir, {'tasks_demo.py': 'VALUE = 2\n'}) == (cache_dir, True)
+    assert sorted(os.listdir(cache_dir)) == ['__pycache__', 'components.json', 'tasks_demo.py']
+
+    output = subprocess.check_output([sys.executable, '-c', 'import tasks_demo; print(tasks_demo.VALUE, tasks_demo.__cached__)'],
+                                     env=dict(os.environ, PYTHONPATH=cache_dir, PYTHONDONTWRITEBYTECODE='1')).decode().split()
+    assert output[0] == '1'
+    assert os.path.exists(output[1])
@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from twingraph.orchestration import celery_fleet, run_context
+from twingraph.orchestration.celery_codegen import cached_modules
+
+
+def test_fleet_identity():
+    """Test that pipelines with the same broker and settings share one fleet."""
+    key = celery_fleet.fleet_key('memory://', 'cache+memory://', 8)
+    assert key == celery_fleet.fleet_key('memory://', 'cache+memory://', 8)
+    assert key != celery_fleet.fleet_key('memory://', 'cache+memory://', 16)
+    assert key != celery_fleet.fleet_key('memory://', 'cache+memory://', 8, io_pool='gevent')
+    assert celery_fleet.fleet_node(key) == 'twingraph-fleet-' + key + '@localhost'
+    assert celery_fleet.fleet_node(key, role='io') == 'twingraph-fleet-io-' + key + '@localhost'
+
+
+def test_fleet_tasks(tmp_path, monkeypatch):
+    """Test that calls of the driver run the component of the tasks module on the fleet task."""
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    (work_dir / 'inputs.txt').write_text('3')
+    cache_dir, _ = cached_modules(str(tmp_path / 'demo_0123'), {'tasks_demo.py': 'from twingraph.orchestration.run_context import current_run_id\n\ndef Func_A(x, scale=1):\n  return {"outputs": (int(open("inputs.txt").read()) + x) * scale, "run": current_run_id()}\n'})
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    monkeypatch.chdir(work_dir)
+    monkeypatch.setenv('TWINGRAPH_RUN_ID', 'run-1')
+    monkeypatch.setattr(run_context, '_context', threading.local())
+    Func_A, Func_B = celery_fleet.fleet_tasks(os.path.join(cache_dir, 'tasks_demo.py'), 'twingraph.demo_0123', ['Func_A', 'Func_B'],
+                                              'memory://', 'cache+memory://', io_names=['Func_B'])
+    signature = Func_A.s(1, scale=2)
+    assert signature.task == celery_fleet.RUN_COMPONENT
+    assert signature.options['queue'] == 'twingraph.demo_0123'
+    assert Func_B.s(1).options['queue'] == 'twingraph.demo_0123.io'
+
+    Func_A.app.conf.task_always_eager = True
+    monkeypatch.chdir(tmp_path)
+    assert Func_A.delay(1, scale=2).get() == {'outputs': 8, 'run': 'run-1'}
+    assert os.getcwd() == str(work_dir)
+
+
+def test_task_dir_on_threads(tmp_path, monkeypatch):
+    """Test that tasks on worker threads resolve paths against their own directory without changing the process state."""
+    cache_dir, _ = cached_modules(str(tmp_path / 'demo_4567'), {'tasks_demo.py': 'from twingraph.orchestration.run_context import task_path\n\ndef Func_A(name):\n  return task_path(name)\n'})
+    monkeypatch.setattr(sys, 'path', list(sys.path))
+    monkeypatch.setattr(run_context, '_context', threading.local())
+    monkeypatch.chdir(tmp_path)
+    module_path = os.path.join(cache_dir, 'tasks_demo.py')
+    results = []
+
+    def call(n):
+        results.append(celery_fleet.run_component(module_path, 'Func_A', ['inputs.txt'], {}, '/work/run-' + str(n)))
+
+    path_size = len(sys.path)
+    threads = [threading.Thread(target=call, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == ['/work/run-' + str(n) + '/inputs.txt' for n in range(4)]
+    assert os.getcwd() == str(tmp_path)
+    assert len(sys.path) == path_size + 1
@@ -0,0 +1,109 @@
+import pytest
+from celery import Celery
+from twingraph.orchestration import celery_refs
+from twingraph.orchestration.celery_refs import ResultRefTask, ResultNotReady, celery_submit, result_ref, result_value, resolve_refs, wait_submitted
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(celery_refs, '_submitted', [])
+    monkeypatch.setattr(celery_refs, '_values', {})
+    app = Celery('test_celery_refs', broker='memory://',
+                 backend='cache+memory://')
+    app.conf.update(task_always_eager=True, task_store_eager_result=True)
+    return app
+
+
+def test_references_resolved_on_worker(app):
+    """Test that results passed to components are resolved by the worker."""
+    @app.task(base=ResultRefTask)
+    def Func_A(input_1, input_2):
+        return {'hash': 'hash_a', 'outputs': {'sum': input_1 + input_2}}
+
+    @app.task(base=ResultRefTask)
+    def Func_B(input_1, result, parent_hash=[]):
+        return {'hash': 'hash_b', 'outputs': {'product': input_1 * result['outputs']['sum'], 'parents': parent_hash}}
+
+    a = celery_submit(Func_A, 1, 2)
+    b = celery_submit(Func_B, result_ref(a, 'outputs', 'sum'),
+                      a, parent_hash=[result_ref(a, 'hash')])
+    wait_submitted()
+    assert result_value(b)['outputs'] == {'product': 9, 'parents': ['hash_a']}
+    assert result_ref({'outputs': {'sum': 3}}, 'outputs', 'sum') == 3
+    assert sorted(celery_refs._values) == sorted([a.id, b.id])
+
+
+def test_references_recorded_as_parents(app):
+    """Test that the results passed to a component are added to its parent_hash."""
+    @app.task(base=ResultRefTask)
+    def Func_A(input_1):
+        return {'hash': 'hash_a' + str(input_1), 'outputs': {'sum': input_1}}
+
+    @app.task(base=ResultRefTask)
+    def Func_B(input_1, parent_hash=[]):
+        return {'hash': 'hash_b', 'outputs': {'parents': sorted(parent_hash)}}
+
+    a_1 = celery_submit(Func_A, 1)
+    a_2 = celery_submit(Func_A, 2)
+    b = celery_submit(Func_B, [result_ref(a_1, 'outputs', 'sum'), result_ref(
+        a_1, 'outputs')], parent_hash=[a_2, 'hash_c'])
+    assert result_value(b)['outputs']['parents'] == [
+        'hash_a1', 'hash_a2', 'hash_c']
+
+
+def test_reference_not_ready(app):
+    """Test that a reference to an unfinished task is reported as not ready."""
+    with pytest.raises(ResultNotReady):
+        resolve_refs([{celery_refs.REF_KEY: 'unknown-task', 'path': []}], app)
+
+
+def test_inputs_never_ready(app):
+    """Test that a task whose inputs do not finish fails once its retries are used up."""
+    @app.task(base=ResultRefTask, max_retries=2)
+    def Func_B(result):
+        return result
+
+    with pytest.raises(Exception, match='not ready after 2 retries'):
+        Func_B.delay({celery_refs.REF_KEY: 'unknown-task', 'path': []}).get()
+
+
+def test_map_items(app):
+    """Test that the elements of a map refer to their chunk task without waiting for it."""
+    @app.task(base=ResultRefTask)
+    def twingraph_map_chunk(component_name, elements):
+        return [{'hash': element[3], 'outputs': {'sum': element[1]['input_1'] + 1}} for element in elements]
+
+    @app.task(base=ResultRefTask)
+    def Func_B(input_1, parent_hash=[]):
+        return {'hash': 'hash_b', 'outputs': {'product': input_1 * 2, 'parents': parent_hash}}
+
+    from twingraph.orchestration.orchestration_tools import celery_map
+    items = celery_map(twingraph_map_chunk, 'Func_A', [
+                       {'input_1': n} for n in range(3)], chunk_size=2)
+    assert [type(item) for item in items] == [celery_refs.MapItem] * 3
+    b = celery_submit(Func_B, result_ref(
+        items[2], 'outputs', 'sum'), parent_hash=[result_ref(items[2], 'hash')])
+    wait_submitted()
+    assert result_value(b)['outputs'] == {
+        'product': 6, 'parents': [items[2].hash]}
+    assert result_value(items[1])['outputs'] == {'sum': 2}
+    assert len(celery_refs._submitted) == 3
+
+
+def test_map_element_references(app):
+    """Test that the results in the elements of a map are resolved by the chunk task and recorded as parents."""
+    @app.task(base=ResultRefTask)
+    def Func_A(input_1):
+        return {'hash': 'hash_a', 'outputs': {'sum': input_1}}
+
+    @app.task(base=ResultRefTask)
+    def twingraph_map_chunk(component_name, elements):
+        return [{'hash': element[3], 'outputs': {'product': element[1]['input_1'] * element[1]['input_2']['outputs']['sum'], 'parents': element[2]}} for element in elements]
+
+    from twingraph.orchestration.orchestration_tools import celery_map
+    a = celery_submit(Func_A, 3)
+    items = celery_map(twingraph_map_chunk, 'Func_B', [
+                       {'input_1': result_ref(a, 'outputs', 'sum'), 'input_2': a} for n in range(2)], parent_hash=[a])
+    wait_submitted()
+    assert [result_value(item)['outputs'] for item in items] == [
+        {'product': 9, 'parents': ['hash_a']}] * 2
@@ -0,0 +1,131 @@
+import itertools
+import os
+import subprocess
+import sys
+import threading
+from twingraph.docker.container_pool import ContainerPool, POOL_HOST_LABEL, POOL_LABEL
+from twingraph.docker.host_resources import HostResources
+from twingraph.orchestration import orchestration_utils
+
+SOURCE_CODE = '''
+def Func_A_add(inp_1: float, inp_2: float) -> NamedTuple:
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1"])
+    return poutput(inp_1 + inp_2)
+'''
+
+
+class ContainerStandIn:
+    """Container stand-in whose exec runs the command as a local process."""
+    ids = itertools.count()
+
+    def __init__(self, image, labels={}):
+        self.id = 'container-' + str(next(self.ids))
+        self.image = image
+        self.labels = labels
+        self.removed = False
+        self.execs = 0
+        self.cpusets = []
+
+    def update(self, cpuset_cpus):
+        self.cpusets.append(cpuset_cpus)
+
+    def exec_run(self, cmd, environment={}):
+        self.execs += 1
+        process = subprocess.run(cmd, env=dict(os.environ, **environment),
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return process.returncode, process.stdout
+
+    def remove(self, force=False):
+        self.removed = True
+
+
+class DockerStandIn:
+    def __init__(self):
+        self.containers = self
+        self.created = []
+
+    def run(self, image, entrypoint, volumes, detach, labels, **limits):
+        self.created.append(ContainerStandIn(image, labels))
+        self.created[-1].limits = limits
+        return self.created[-1]
+
+    def list(self, all, filters):
+        return [container for container in self.created if filters['label'] in container.labels]
+
+
+def test_pool_reuse_and_eviction():
+    """Test that idle containers are reused per image and the least recently used one is evicted when full."""
+    stand_in = DockerStandIn()
+    pool = ContainerPool(max_containers=2, client=stand_in)
+    container_a = pool.acquire('image-a')
+    pool.release(container_a)
+    assert pool.acquire('image-a') is container_a
+    container_b = pool.acquire('image-b')
+    pool.release(container_b)
+    pool.release(container_a)
+    container_c = pool.acquire('image-c')
+    assert container_b.removed and not container_a.removed
+    assert len(stand_in.created) == 3
+
+    # full with busy containers, the next call waits for a release
+    acquired = []
+    waiting = threading.Thread(target=lambda: acquired.append(pool.acquire('image-c')))
+    pool.acquire('image-a')
+    waiting.start()
+    waiting.join(timeout=0.2)
+    assert acquired == []
+    pool.release(container_c)
+    waiting.join(timeout=5)
+    assert acquired == [container_c]
+    pool.shutdown()
+
+
+def test_reap_orphaned_containers():
+    """Test that a new pool removes the pool containers on the host whose process has exited."""
+    stand_in = DockerStandIn()
+    pool = ContainerPool(client=stand_in)
+    live = pool.acquire('image-a')
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    orphaned = stand_in.run('image-a', None, {}, True, dict(live.labels, **{POOL_LABEL: str(exited.pid)}))
+    other_host = stand_in.run('image-a', None, {}, True, dict(
+        orphaned.labels, **{POOL_HOST_LABEL: 'other-host'}))
+    unrelated = stand_in.run('image-a', None, {}, True, {})
+    ContainerPool(client=stand_in)
+    assert orphaned.removed
+    assert not (live.removed or other_host.removed or unrelated.removed)
+
+
+def test_warm_docker_run(tmp_path, monkeypatch):
+    """Test that repeated Docker calls are executed in one warm container, with its limits and pinned CPUs when enabled."""
+    stand_in = DockerStandIn()
+    pool = ContainerPool(max_containers=4, client=stand_in)
+    host_resources = HostResources(str(tmp_path / 'ledger.json'), cpus=[0, 1, 2, 3])
+    monkeypatch.setattr(orchestration_utils, 'get_container_pool', lambda *args: pool)
+    monkeypatch.setattr(orchestration_utils, 'get_host_resources', lambda: host_resources)
+    for n in range(3):
+        attributes = {'Name': 'Func_A_add', 'Hash': 'hash-' + str(n), 'Source Code': SOURCE_CODE}
+        ioutputs = orchestration_utils.run_docker_compose('runner-image', {'inp_1': n, 'inp_2': 1}, attributes, runner_config={
+            'python': sys.executable}, docker_config={'warm_pool': True, 'admission': True, 'cpus': 2, 'memory': '256m'})
+        assert ioutputs.output_1 == n + 1
+    assert len(stand_in.created) == 1 and stand_in.created[0].execs == 3
+    assert stand_in.created[0].limits == {'nano_cpus': 2000000000, 'mem_limit': 256 * 1024 ** 2}
+    # pinned for each call and unpinned when it returns to the pool
+    assert stand_in.created[0].cpusets == ['0,1', '0,1,2,3'] * 3
+    assert orchestration_utils.reserve_host_resources({}) is None
+    pool.shutdown()
+    assert stand_in.created[0].removed
+
+
+def test_host_admission(tmp_path):
+    """Test that reservations are admitted by free CPUs and memory and pinned to distinct CPUs."""
+    host_resources = HostResources(str(tmp_path / 'ledger.json'), cpus=[0, 1, 2], memory=1024 ** 3)
+    first = host_resources.try_reserve(cpus=2, memory='512m')
+    second = host_resources.try_reserve(cpus=0.5, memory='256m')
+    assert (first.cpuset, second.cpuset) == ('0,1', '2')
+    assert host_resources.try_reserve(cpus=1) is None
+    host_resources.release(first)
+    assert host_resources.try_reserve(cpus=1, memory='1g') is None
+    third = host_resources.try_reserve(cpus=1, memory='512m')
+    assert third.cpuset == '0'
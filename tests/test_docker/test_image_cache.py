@@ -0,0 +1,89 @@
+import threading
+import time
+import docker
+from twingraph.docker import docker_utils
+
+
+class ImageStandIn:
+    def __init__(self, client, labels, repo_digests=[]):
+        self.client = client
+        self.labels = labels
+        self.attrs = {'RepoDigests': repo_digests}
+
+    def tag(self, repository, tag=None):
+        self.client.tags.append(repository)
+
+
+class DockerImagesStandIn:
+    """Docker stand-in for image builds, registry lookups and pushes."""
+
+    def __init__(self):
+        self.images = self
+        self.built = []
+        self.tags = []
+        self.pushed = []
+        self.active_pushes = 0
+        self.max_active_pushes = 0
+        self.lock = threading.Lock()
+
+    def list(self, filters):
+        return [ImageStandIn(self, labels) for labels in self.built if docker_utils.CONTEXT_HASH_LABEL + '=' + labels[docker_utils.CONTEXT_HASH_LABEL] == filters['label']]
+
+    def build(self, path, dockerfile, tag, labels):
+        self.built.append(labels)
+
+    def get(self, image_name):
+        return ImageStandIn(self, {}, ['registry/pushed@sha256:1'])
+
+    def get_registry_data(self, reference):
+        if not reference.startswith('registry/pushed'):
+            raise docker.errors.NotFound('manifest unknown')
+        return type('RegistryData', (), {'id': 'sha256:1'})()
+
+    def push(self, repository, tag, stream, decode):
+        with self.lock:
+            self.active_pushes += 1
+            self.max_active_pushes = max(self.max_active_pushes, self.active_pushes)
+        time.sleep(0.1)
+        with self.lock:
+            self.active_pushes -= 1
+            self.pushed.append(repository)
+        return iter([{'status': 'Pushed'}])
+
+
+def test_build_cache(tmp_path, monkeypatch):
+    """Test that an image is only built again when its build context changes."""
+    stand_in = DockerImagesStandIn()
+    monkeypatch.setattr(docker_utils, 'get_client', lambda: stand_in)
+    (tmp_path / 'Dockerfile').write_text('FROM python:3.9\nCOPY app.py .\n')
+    (tmp_path / 'app.py').write_text('print(1)\n')
+    docker_utils.build_image(str(tmp_path), 'Dockerfile', 'demo')
+    docker_utils.build_image(str(tmp_path), 'Dockerfile', 'demo')
+    assert len(stand_in.built) == 1 and stand_in.tags == ['demo']
+    (tmp_path / 'app.py').write_text('print(2)\n')
+    docker_utils.build_image(str(tmp_path), 'Dockerfile', 'demo')
+    assert len(stand_in.built) == 2
+
+
+def test_context_hash_exceptions(tmp_path):
+    """Test that files re-included with ! in .dockerignore are part of the context hash."""
+    (tmp_path / 'Dockerfile').write_text('FROM python:3.9\nCOPY data/keep.txt .\n')
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'keep.txt').write_text('1')
+    (tmp_path / 'data' / 'skip.txt').write_text('1')
+    (tmp_path / '.dockerignore').write_text('# data files\ndata\n!data/keep.txt\n')
+    build_hash = docker_utils.context_hash(str(tmp_path), 'Dockerfile')
+    (tmp_path / 'data' / 'skip.txt').write_text('2')
+    assert docker_utils.context_hash(str(tmp_path), 'Dockerfile') == build_hash
+    (tmp_path / 'data' / 'keep.txt').write_text('2')
+    assert docker_utils.context_hash(str(tmp_path), 'Dockerfile') != build_hash
+
+
+def test_parallel_push(monkeypatch):
+    """Test that images are tagged and pushed concurrently, skipping images the registry already has."""
+    stand_in = DockerImagesStandIn()
+    monkeypatch.setattr(docker_utils, 'get_client', lambda: stand_in)
+    images = [('demo' + str(n), 'registry/demo' + str(n), 'latest') for n in range(4)]
+    docker_utils.tag_and_push_images(images + [('demo', 'registry/pushed', 'latest')])
+    assert sorted(stand_in.pushed) == ['registry/demo' + str(n) for n in range(4)]
+    assert stand_in.max_active_pushes > 1
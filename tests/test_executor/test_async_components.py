@@ -0,0 +1,47 @@
+import asyncio
+import threading
+import pytest
+from collections import namedtuple
+from typing import NamedTuple
+from twingraph import component, pipeline
+from twingraph.orchestration import orchestration_tools
+
+# both components need to be running at once to get past the barrier
+barrier = threading.Barrier(2, timeout=10)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    vertices = []
+    monkeypatch.setattr(orchestration_tools, 'init_reset_graph', lambda *args, **kwargs: None)
+    monkeypatch.setattr(orchestration_tools, 'add_vertex_connection', lambda gremlin_IP, attributes: vertices.append(attributes))
+    return vertices
+
+
+@component()
+def Func_meet(value: float) -> NamedTuple:
+    barrier.wait()
+    poutput = namedtuple('outputs', ['output_1'])
+    return poutput(value)
+
+
+@component()
+def Func_add(inp_1: float, inp_2: float) -> NamedTuple:
+    poutput = namedtuple('outputs', ['output_1'])
+    return poutput(inp_1 + inp_2)
+
+
+@pipeline(max_workers=2)
+async def pipeline_concurrent():
+    a, b = await asyncio.gather(Func_meet.aio(1.0), Func_meet.aio(2.0))
+    c = await Func_add.aio(a.outputs.output_1, b.outputs.output_1)
+    return a, b, c
+
+
+def test_aio_runs_concurrently(graph):
+    """Test that component calls gathered with Func.aio run at the same time and chain their handles."""
+    barrier.reset()
+    a, b, c = pipeline_concurrent()
+    assert c['outputs']['output_1'] == 3.0
+    assert [vertex['Name'] for vertex in graph] == ['Func_meet', 'Func_meet', 'Func_add']
+    assert sorted(eval(graph[2]['Parent Hash'])) == sorted([a['hash'], b['hash']])
@@ -0,0 +1,77 @@
+import threading
+import pytest
+from collections import namedtuple
+from typing import NamedTuple
+from twingraph import component, pipeline
+from twingraph.orchestration import orchestration_tools
+
+# both components need to be running at once to get past the barrier
+barrier = threading.Barrier(2, timeout=10)
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    vertices = []
+    monkeypatch.setattr(orchestration_tools, 'init_reset_graph', lambda *args, **kwargs: None)
+    monkeypatch.setattr(orchestration_tools, 'add_vertex_connection', lambda gremlin_IP, attributes: vertices.append(attributes))
+    return vertices
+
+
+@component()
+def Func_meet(value: float) -> NamedTuple:
+    barrier.wait()
+    poutput = namedtuple('outputs', ['output_1'])
+    return poutput(value)
+
+
+@component()
+def Func_add(inp_1: float, inp_2: float) -> NamedTuple:
+    poutput = namedtuple('outputs', ['output_1'])
+    return poutput(inp_1 + inp_2)
+
+
+@component()
+def Func_fail(value: float) -> NamedTuple:
+    raise ValueError(value)
+
+
+@pipeline(executor='threads', max_workers=2)
+def pipeline_parallel():
+    a = Func_meet(1.0)
+    b = Func_meet(2.0)
+    c = Func_add(a.outputs.output_1, b.outputs.output_1)
+    return a, b, c
+
+
+@pipeline(executor='threads', max_workers=2)
+def pipeline_failure():
+    a = Func_fail(1.0)
+    b = Func_add(a.outputs.output_1, 1.0)
+    c = Func_add(b.outputs.output_1, 1.0)
+
+
+def test_independent_components_run_in_parallel(graph):
+    """Test that components without dependencies between them run at the same time on the executor."""
+    barrier.reset()
+    a, b, c = pipeline_parallel()
+    assert c['outputs']['output_1'] == 3.0
+    assert graph[-1]['Name'] == 'Func_add'
+    assert sorted(eval(graph[-1]['Parent Hash'])) == sorted([a['hash'], b['hash']])
+
+
+def test_failure_propagates_to_dependents(graph):
+    """Test that a failed component fails its dependents and the pipeline instead of leaving them waiting."""
+    errors = []
+
+    def run():
+        try:
+            pipeline_failure()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert str(errors[0]) == 'Error with running function.'
+    assert graph == []
@@ -0,0 +1,38 @@
+import threading
+from twingraph.orchestration.local_executor import LocalExecutor
+from twingraph.orchestration.result_handles import ComponentResult
+
+
+def recorder(started, lock, name):
+    def fn():
+        with lock:
+            started.append(name)
+        return {'name': name}
+    return fn
+
+
+def test_deferred_longest_path_first():
+    """Test that a deferred executor starts the longest remaining path first, not the first call."""
+    started, lock = [], threading.Lock()
+    executor = LocalExecutor(max_workers=1, deferred=True, durations={'short': 1.0, 'long': 5.0})
+    executor.submit(recorder(started, lock, 'short_1'), [], 'short')
+    executor.submit(recorder(started, lock, 'short_2'), [], 'short')
+    long_1 = ComponentResult('hash_long_1', future=executor.submit(recorder(started, lock, 'long_1'), [], 'long'))
+    long_2 = ComponentResult('hash_long_2', future=executor.submit(recorder(started, lock, 'long_2'), [long_1], 'long'))
+    executor.submit(recorder(started, lock, 'long_3'), [long_2], 'long')
+    assert started == []
+    executor.wait()
+    executor.shutdown()
+    assert started[0] == 'long_1'
+    assert sorted(started) == ['long_1', 'long_2', 'long_3', 'short_1', 'short_2']
+    assert started.index('long_2') > started.index('long_1')
+
+
+def test_deferred_duration_mean():
+    """Test that the measured durations are averaged with the durations of previous runs."""
+    executor = LocalExecutor(max_workers=1, deferred=True, durations={'fast': 10.0})
+    executor.submit(lambda: {}, [], 'fast')
+    executor.submit(lambda: {}, [], 'fast')
+    executor.wait()
+    executor.shutdown()
+    assert 3.0 < executor.duration('fast') < 3.4
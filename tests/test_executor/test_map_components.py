@@ -0,0 +1,44 @@
+import threading
+import pytest
+from collections import namedtuple
+from typing import NamedTuple
+from twingraph import component
+from twingraph.orchestration import orchestration_tools
+
+# the first chunk is held until a result of a later chunk has been read
+release = threading.Event()
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    chunks = []
+    monkeypatch.setattr(orchestration_tools, 'add_vertices', lambda gremlin_IP, attributes_list: chunks.append(attributes_list))
+    return chunks
+
+
+@component()
+def Func_gate(value: float, hold: bool) -> NamedTuple:
+    if hold:
+        release.wait(timeout=10)
+    poutput = namedtuple('outputs', ['output_1', 'released'])
+    return poutput(value, release.is_set())
+
+
+def test_map_chunks(graph):
+    """Test that Func.map runs one graph write per chunk of chunk_size elements and returns the handles in order."""
+    release.set()
+    results = Func_gate.map([{'value': n, 'hold': False} for n in range(7)], chunk_size=3)
+    assert [result['outputs']['output_1'] for result in results] == list(range(7))
+    assert sorted(len(chunk) for chunk in graph) == [1, 3, 3]
+
+
+def test_map_unordered(graph):
+    """Test that Func.map(ordered=False) yields the chunks as they complete instead of in input order."""
+    release.clear()
+    results = Func_gate.map([{'value': n, 'hold': n < 2} for n in range(4)], chunk_size=2, ordered=False)
+    first = next(results)
+    assert first['outputs'] == {'output_1': 2, 'released': False}
+    release.set()
+    rest = list(results)
+    assert [result['outputs']['output_1'] for result in rest] == [3, 0, 1]
+    assert all(result['outputs']['released'] for result in rest[1:])
@@ -0,0 +1,49 @@
+import pytest
+from concurrent.futures import Future
+from twingraph.orchestration.result_handles import ComponentResult, ItemFuture, find_handles, resolve_handles, handle_hashes
+
+
+def test_handles_record_dependencies():
+    """Test that handles and output fields passed as arguments are found and resolved."""
+    a = ComponentResult('hash_a', outputs={'output_1': 1.5, 'output_2': [1, 2]})
+    b = ComponentResult('hash_b', outputs={'output_1': 'b'})
+    args = (a.outputs.output_1, [b.outputs['output_1'], 3])
+    kwargs = {'inp': a, 'plain': a['outputs']['output_2']}
+    assert sorted(handle_hashes(find_handles(args, kwargs))) == ['hash_a', 'hash_a', 'hash_b']
+    resolved_args, resolved_kwargs = resolve_handles(args, kwargs)
+    assert resolved_args == (1.5, ['b', 3])
+    assert resolved_kwargs == {'inp': {'outputs': {'output_1': 1.5, 'output_2': [1, 2]}, 'hash': 'hash_a'}, 'plain': [1, 2]}
+
+
+def test_pending_handle():
+    """Test that the hash of a pending handle is known before its outputs."""
+    future = Future()
+    a = ComponentResult('hash_a', future=future)
+    assert a['hash'] == 'hash_a'
+    assert not a.done()
+    future.set_result({'output_1': 2})
+    assert a['outputs']['output_1'] == 2
+    assert dict(a) == {'outputs': {'output_1': 2}, 'hash': 'hash_a'}
+
+
+def test_chunk_handles():
+    """Test that the handles of one map chunk resolve from the chunk future."""
+    future = Future()
+    handles = [ComponentResult('hash_' + str(index), future=ItemFuture(future, index)) for index in range(3)]
+    assert not any(handle.done() for handle in handles)
+    future.set_result([{'output_1': index * 2} for index in range(3)])
+    assert [handle['outputs']['output_1'] for handle in handles] == [0, 2, 4]
+    assert handles[1].get()['hash'] == 'hash_1'
+
+
+def test_map_pool():
+    """Test that maps share one thread pool per process and maps within a chunk run inline."""
+    from twingraph.orchestration import orchestration_tools
+    pool = orchestration_tools.get_map_pool()
+    assert orchestration_tools.get_map_pool() is pool
+    inside = pool.submit(orchestration_tools.run_map_chunk, lambda: getattr(
+        orchestration_tools._map_thread, 'active', False))
+    assert inside.result() is True
+    assert not getattr(orchestration_tools._map_thread, 'active', False)
+    failed = orchestration_tools.run_inline(lambda: 1 / 0)
+    assert failed.done() and isinstance(failed.exception(), ZeroDivisionError)
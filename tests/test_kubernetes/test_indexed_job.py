@@ -0,0 +1,83 @@
+import os
+import pytest
+from concurrent.futures import Future
+from kubernetes import client
+from twingraph import runner
+from twingraph.kubernetes import k8s_class
+from twingraph.orchestration import orchestration_utils
+
+SOURCE_CODE = '''
+def Func_A_add(inp_1: float, inp_2: float) -> NamedTuple:
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1"])
+    return poutput(inp_1 + inp_2)
+'''
+
+
+class KubernetesStandIn:
+    """Kubernetes stand-in running each index of an Indexed Job in process, with the result in the termination message."""
+
+    def __init__(self):
+        self.jobs = []
+        self.finished = {}
+        self.pods = []
+
+    def read_namespace(self, namespace):
+        return client.V1Namespace(metadata=client.V1ObjectMeta(name=namespace))
+
+    def watch(self, job_name):
+        self.finished[job_name] = Future()
+        return self.finished[job_name]
+
+    def create_namespaced_job(self, namespace, job):
+        self.jobs.append(job)
+        env = job.spec.template.spec.containers[0].env
+        for index in range(job.spec.completions):
+            envelope = runner.decode_envelope(env[0].value)
+            envelope['array_index'] = index
+            result_str, _ = runner.execute_envelope(runner.array_task(envelope))
+            terminated = client.V1ContainerStateTerminated(exit_code=0, message=result_str)
+            self.pods.append(client.V1Pod(
+                metadata=client.V1ObjectMeta(name=job.metadata.name + '-' + str(index), namespace=namespace, annotations={
+                    'batch.kubernetes.io/job-completion-index': str(index)}),
+                status=client.V1PodStatus(phase='Succeeded', container_statuses=[client.V1ContainerStatus(
+                    name='runner', image='runner', image_id='', ready=False, restart_count=0, state=client.V1ContainerState(terminated=terminated))])))
+        job.status = client.V1JobStatus(
+            conditions=[client.V1JobCondition(type='Complete', status='True')])
+        self.finished[job.metadata.name].set_result(job)
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        return client.V1PodList(items=list(reversed(self.pods)))
+
+
+def test_indexed_job(monkeypatch):
+    """Test that a fan-out is submitted as one Indexed Job and read back per completion index."""
+    stand_in = KubernetesStandIn()
+    monkeypatch.setattr(orchestration_utils, 'batch_api', stand_in)
+    monkeypatch.setattr(orchestration_utils, 'get_job_informer', lambda namespace: stand_in)
+    monkeypatch.setattr(k8s_class, 'core_api', stand_in)
+    monkeypatch.setattr(k8s_class, '_namespaces', set())
+    input_dicts = [{'inp_1': index, 'inp_2': 0.5} for index in range(5)]
+    attributes_list = [{'Name': 'Func_A_add', 'Hash': 'hash-' + str(index), 'Source Code': SOURCE_CODE}
+                       for index in range(5)]
+    ioutputs_list = orchestration_utils.run_kubernetes_indexed(
+        'runner-image', input_dicts, attributes_list, {'parallelism': 2})
+    assert [ioutputs.output_1 for ioutputs in ioutputs_list] == [0.5, 1.5, 2.5, 3.5, 4.5]
+    assert len(stand_in.jobs) == 1
+    spec = stand_in.jobs[0].spec
+    assert (spec.completion_mode, spec.completions, spec.parallelism) == ('Indexed', 5, 2)
+    assert [attributes['Kubernetes Completion Index'] for attributes in attributes_list] == list(range(5))
+
+
+def test_indexed_job_over_limit(monkeypatch):
+    """Test that an inline array over the Kubernetes object size fails before the job is created."""
+    stand_in = KubernetesStandIn()
+    monkeypatch.setattr(orchestration_utils, 'batch_api', stand_in)
+    monkeypatch.setattr(orchestration_utils, 'get_job_informer', lambda namespace: stand_in)
+    input_dicts = [{'inp_1': os.urandom(65536).hex(), 'inp_2': 0.5} for index in range(16)]
+    attributes_list = [{'Name': 'Func_A_add', 'Hash': 'hash-' + str(index), 'Source Code': SOURCE_CODE}
+                       for index in range(16)]
+    with pytest.raises(Exception, match='limit'):
+        orchestration_utils.run_kubernetes_indexed(
+            'runner-image', input_dicts, attributes_list, {})
+    assert stand_in.jobs == []
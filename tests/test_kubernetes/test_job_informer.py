@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kubernetes import client
+from twingraph.kubernetes.job_informer import JobInformer
+
+
+def job(name, condition=None):
+    conditions = [{'type': condition, 'status': 'True'}] if condition else []
+    return {'apiVersion': 'batch/v1', 'kind': 'Job', 'metadata': {'name': name, 'namespace': 'twingraph'},
+            'status': {'conditions': conditions}}
+
+
+class FakeJobsAPI(BaseHTTPRequestHandler):
+    """Kubernetes API server stand-in: job-0 has finished before the watch starts, the others finish while it runs."""
+    requests = []
+
+    def do_GET(self):
+        FakeJobsAPI.requests.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        if 'watch=true' not in self.path:
+            self.wfile.write(json.dumps({'apiVersion': 'batch/v1', 'kind': 'JobList', 'metadata': {'resourceVersion': '10'},
+                                         'items': [job('job-0', 'Complete'), job('job-1')]}).encode())
+            return
+        events = [('MODIFIED', job('job-1', 'Complete')), ('ADDED', job('job-2')),
+                  ('MODIFIED', job('job-2', 'Failed')), ('MODIFIED', job('job-3', 'Complete'))]
+        for event_type, event_job in events:
+            time.sleep(0.05)
+            self.wfile.write((json.dumps({'type': event_type, 'object': event_job}) + '\n').encode())
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_shared_informer():
+    """Test that the jobs of a namespace are followed through one list and one watch."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeJobsAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configuration = client.Configuration()
+    configuration.host = 'http://127.0.0.1:' + str(server.server_address[1])
+    informer = JobInformer('twingraph', client.BatchV1Api(
+        client.ApiClient(configuration)), retry_interval=0.05)
+    try:
+        futures = [informer.watch('job-' + str(n)) for n in range(4)]
+        states = [future.result(timeout=10).status.conditions[0].type for future in futures]
+    finally:
+        server.shutdown()
+    assert states == ['Complete', 'Complete', 'Failed', 'Complete']
+    assert len(FakeJobsAPI.requests) == 2
+    assert 'labelSelector=app.kubernetes.io/managed-by%3Dtwingraph' in FakeJobsAPI.requests[1]
+    assert 'resourceVersion=10' in FakeJobsAPI.requests[1]
+    for _ in range(100):
+        if informer.thread is None:
+            break
+        time.sleep(0.05)
+    assert informer.thread is None
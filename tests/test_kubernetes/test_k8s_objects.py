@@ -0,0 +1,50 @@
+from kubernetes import client
+from twingraph.kubernetes import k8s_class
+
+
+class CoreStandIn:
+    """Kubernetes stand-in recording namespace and job collection requests."""
+
+    def __init__(self):
+        self.calls = []
+
+    def read_namespace(self, namespace):
+        self.calls.append(('read', namespace))
+        raise client.exceptions.ApiException(status=404)
+
+    def create_namespace(self, body):
+        self.calls.append(('create', body.metadata.name))
+
+    def delete_collection_namespaced_job(self, namespace, label_selector, propagation_policy):
+        self.calls.append(('delete', namespace, label_selector))
+
+
+def test_namespace_cache(monkeypatch):
+    """Test that a namespace is looked up and created once per process."""
+    stand_in = CoreStandIn()
+    monkeypatch.setattr(k8s_class, 'core_api', stand_in)
+    monkeypatch.setattr(k8s_class, '_namespaces', set())
+    for _ in range(3):
+        assert k8s_class.create_namespace('twingraph') == 'twingraph'
+    assert stand_in.calls == [('read', 'twingraph'), ('create', 'twingraph')]
+
+    def forbidden(namespace):
+        raise client.exceptions.ApiException(status=403)
+
+    stand_in.read_namespace = forbidden
+    assert k8s_class.create_namespace('restricted') == 'restricted'
+    assert 'restricted' in k8s_class._namespaces
+
+
+def test_run_jobs(monkeypatch):
+    """Test that jobs carry a TTL and run labels, and are deleted by run in one request."""
+    stand_in = CoreStandIn()
+    monkeypatch.setattr(k8s_class, 'batch_api', stand_in)
+    job = k8s_class.create_job('job-hash', client.V1PodTemplateSpec(), labels=k8s_class.run_labels(
+        'Func_A', 'run-1'), ttl_seconds_after_finished=600)
+    assert job.spec.ttl_seconds_after_finished == 600
+    assert job.metadata.labels[k8s_class.RUN_ID_LABEL] == 'run-1'
+    assert job.metadata.labels[k8s_class.COMPONENT_LABEL] == 'Func_A'
+    k8s_class.delete_run_jobs('run-1', 'twingraph')
+    assert stand_in.calls == [
+        ('delete', 'twingraph', k8s_class.RUN_ID_LABEL + '=run-1')]
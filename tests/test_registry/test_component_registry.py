@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+from twingraph.orchestration import component_registry
+
+
+def test_single_provisioning(tmp_path, monkeypatch):
+    """Test that concurrent first calls create each component once and wait for it."""
+    monkeypatch.setattr(component_registry, '_provisioned', set())
+    list_path = str(tmp_path / 'components_list_batch.json')
+    json.dump(['Func_A', 'Func_B'], open(list_path, 'w'))
+    created = []
+    finished = []
+
+    def create():
+        time.sleep(0.2)
+        created.append('Func_A')
+
+    def call():
+        component_registry.ensure_component(list_path, 'Func_A', create)
+        finished.append(len(created))
+
+    threads = [threading.Thread(target=call) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert created == ['Func_A']
+    assert finished == [1] * 16
+    assert json.load(open(list_path)) == ['Func_B']
+
+
+def test_failed_provisioning(tmp_path, monkeypatch):
+    """Test that a failed creation is retried by the next call."""
+    monkeypatch.setattr(component_registry, '_provisioned', set())
+    list_path = str(tmp_path / 'components_list_lambda.json')
+    json.dump(['Func_A'], open(list_path, 'w'))
+
+    def fail():
+        raise Exception('Throttled')
+
+    try:
+        component_registry.ensure_component(list_path, 'Func_A', fail)
+        assert False
+    except Exception as e:
+        assert str(e) == 'Throttled'
+    created = []
+    component_registry.ensure_component(
+        list_path, 'Func_A', lambda: created.append('Func_A'))
+    assert created == ['Func_A']
+    assert json.load(open(list_path)) == []
+
+
+def test_lists_per_run(tmp_path, monkeypatch):
+    """Test that each run provisions from its own list, written atomically."""
+    monkeypatch.setattr(component_registry, '_provisioned', set())
+    monkeypatch.setenv('TWINGRAPH_RUN_ID', 'run_2')
+    run_1_path = component_registry.components_list_path(
+        str(tmp_path), 'batch', 'run_1')
+    run_2_path = component_registry.components_list_path(
+        str(tmp_path), 'batch')
+    assert run_2_path == str(tmp_path / 'components_list_batch_run_2.json')
+    component_registry.FileComponentRegistry(
+        run_1_path).write(['Func_A', 'Func_B'])
+    component_registry.FileComponentRegistry(run_2_path).write(['Func_A'])
+    created = []
+    component_registry.ensure_component(
+        run_2_path, 'Func_A', lambda: created.append('Func_A'))
+    assert created == ['Func_A']
+    assert json.load(open(run_1_path)) == ['Func_A', 'Func_B']
+    assert json.load(open(run_2_path)) == []
+    assert sorted(path.name for path in tmp_path.iterdir() if not path.name.endswith('.lock')) == [
+        'components_list_batch_run_1.json', 'components_list_batch_run_2.json']
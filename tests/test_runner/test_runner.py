@@ -0,0 +1,99 @@
+import json
+import os
+import pytest
+import subprocess
+import sys
+from twingraph import runner
+from twingraph.orchestration.orchestration_utils import create_task_envelope, parse_outputs
+
+SOURCE_CODE = '''
+def Func_A_add(inp_1: float, inp_2: float, name: str) -> NamedTuple:
+    print("logs printed by the component")
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1", "name"])
+    return poutput(inp_1 + inp_2, name + "'s")
+'''
+
+ROOT_DIR = os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.mark.parametrize('runner_config', [{}, {'installed': True}])
+def test_runner_entrypoint(tmp_path, runner_config):
+    """Test that the runner executes a task envelope read from a file."""
+    attributes = {'Name': 'Func_A_add', 'Source Code': SOURCE_CODE}
+    envelope = create_task_envelope(
+        {'inp_1': 1, 'inp_2': -3.5, 'name': 'twin"graph'}, attributes, {'format': 'pickle'})
+    task_file = tmp_path / 'twingraph_task'
+    task_file.write_text(runner.encode_envelope(envelope))
+    command = runner.runner_command(
+        dict(runner_config, python=sys.executable)) + ['--task-file', str(task_file)]
+    output_str = subprocess.check_output(
+        command, cwd=ROOT_DIR, env=dict(os.environ, TWINGRAPH_CODE_CACHE_DIR=str(tmp_path))).decode()
+    outputs = parse_outputs(output_str, attributes)
+    assert outputs.output_1 == -2.5
+    assert outputs.name == 'twin"graph\'s'
+    assert 'Output Serialization' in attributes
+
+
+def test_compiled_code_cache():
+    """Test that the compiled code is reused for the same source."""
+    envelope = {'name': 'Func_A_add', 'code': SOURCE_CODE}
+    assert runner.load_compiled_code(envelope) is runner.load_compiled_code(
+        {'name': 'Func_A_add', 'code_hash': runner.source_hash(SOURCE_CODE)})
+
+
+@pytest.mark.parametrize('output_channel', ['file', 'termination'])
+def test_result_channel(tmp_path, output_channel):
+    """Test that results are framed with their schema in the output file."""
+    source_code = SOURCE_CODE.replace(
+        'inp_1 + inp_2', '{"nested": [inp_1, {"inp_2": inp_2}]}')
+    output_path = str(tmp_path / 'twingraph_result')
+    envelope = create_task_envelope(
+        {'inp_1': 1, 'inp_2': [2, 3], 'name': 'twingraph'}, {'Name': 'Func_A_add', 'Source Code': source_code})
+    envelope.update({'output_channel': output_channel,
+                    'output_path': output_path})
+    with open(str(tmp_path / 'task'), 'w') as task_file:
+        task_file.write(runner.encode_envelope(envelope))
+    assert runner.main(['--task-file', str(tmp_path / 'task')]) == 0
+    with open(output_path) as result_file:
+        result = runner.decode_result(result_file.read())
+    assert result[0].output_1 == {'nested': [1, {'inp_2': [2, 3]}]}
+    assert result[2]['fields'] == ['output_1', 'name']
+
+
+def test_remote_error(tmp_path):
+    """Test that exceptions raised by the component reach the driver."""
+    envelope = create_task_envelope(
+        {'inp_1': 1, 'inp_2': 'two', 'name': 'twingraph'}, {'Name': 'Func_A_add', 'Source Code': SOURCE_CODE})
+    envelope.update({'output_channel': 'file',
+                    'output_path': str(tmp_path / 'twingraph_result')})
+    with open(str(tmp_path / 'task'), 'w') as task_file:
+        task_file.write(runner.encode_envelope(envelope))
+    assert runner.main(['--task-file', str(tmp_path / 'task')]) == 1
+    with open(str(tmp_path / 'twingraph_result')) as result_file:
+        with pytest.raises(Exception, match='TypeError'):
+            runner.decode_result(result_file.read())
+
+
+def test_array_task(monkeypatch):
+    """Test that an array child picks its inputs from AWS_BATCH_JOB_ARRAY_INDEX."""
+    envelope = {'name': 'Func_A_add', 'code': SOURCE_CODE,
+                'array': [{'inputs': 'first'}, {'inputs': 'second'}]}
+    monkeypatch.setenv('AWS_BATCH_JOB_ARRAY_INDEX', '1')
+    task = runner.array_task(envelope)
+    assert task['inputs'] == 'second'
+    assert 'array' not in task and task['code'] == SOURCE_CODE
+
+
+def test_lambda_app(tmp_path):
+    """Test that the example Lambda app loads the shipped runner and returns the outputs."""
+    app_path = os.path.join(ROOT_DIR, 'examples', 'orchestration_demos',
+                            'demo_7_lambda', 'lambda_docker_image', 'app', 'app.py')
+    attributes = {'Name': 'Func_A_add', 'Source Code': SOURCE_CODE}
+    envelope = create_task_envelope(
+        {'inp_1': 1, 'inp_2': 2, 'name': 'lambda'}, attributes)
+    event = {'task': runner.encode_envelope(envelope), 'runner': runner.bootstrap_blob()}
+    response = subprocess.check_output([sys.executable, '-c', 'import json, runpy, sys; print(json.dumps(runpy.run_path(sys.argv[1])["handler"](json.load(sys.stdin), None)))', app_path],
+                                       input=json.dumps(event).encode(), cwd=str(tmp_path)).decode()
+    assert parse_outputs(json.loads(response.splitlines()[-1])['result'], attributes).output_1 == 3
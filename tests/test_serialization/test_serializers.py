@@ -0,0 +1,50 @@
+import pytest
+import numpy
+from twingraph import runner
+from twingraph.serialization.serializers import encode_payload, decode_payload
+from twingraph.orchestration.orchestration_utils import create_task_envelope, parse_outputs
+
+SOURCE_CODE = '''
+def Func_A_add(inp_1: float, inp_2: list, name: str) -> NamedTuple:
+    output_1 = inp_1 + sum(inp_2)
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1", "name"])
+    return poutput(output_1, name + "'s")
+'''
+
+
+@pytest.mark.parametrize(('serialization_format', 'compression'), [
+    ('json', None),
+    ('msgpack', None),
+    ('pickle', None),
+    ('pickle', 'zlib'),
+])
+def test_round_trip(serialization_format, compression):
+    """Test that payloads survive an encode/decode round trip."""
+    payload = {'inp_1': 1.5, 'inp_2': [1, 2, 3], 'name': 'twin'}
+    frame, stats = encode_payload(payload, serialization_format, compression)
+    value, decode_stats = decode_payload(frame)
+    assert value == payload
+    assert stats.compressed_bytes < len(frame)
+    assert decode_stats.format == serialization_format
+
+
+@pytest.mark.parametrize('serialization_format', ['pickle', 'npy'])
+def test_arrays(serialization_format):
+    """Test that numpy arrays are stored in binary form."""
+    payload = {'inp_1': numpy.arange(10000, dtype=numpy.float64), 'inp_2': 3}
+    frame, stats = encode_payload(payload, serialization_format)
+    value = decode_payload(frame)[0]
+    assert numpy.array_equal(value['inp_1'], payload['inp_1'])
+    assert value['inp_2'] == 3
+    assert stats.bytes < 2 * payload['inp_1'].nbytes
+
+
+def test_lambda_event():
+    """Test that the Lambda handler returns the serialized outputs in its response."""
+    attributes = {'Name': 'Func_A_add', 'Source Code': SOURCE_CODE}
+    envelope = create_task_envelope(
+        {'inp_1': 1.5, 'inp_2': [1, 2, 3], 'name': 'twin'}, attributes, {'format': 'pickle', 'compression': 'zlib'})
+    response = runner.handle_lambda_event({'task': runner.encode_envelope(envelope)})
+    assert parse_outputs(response['result'], attributes).output_1 == 7.5
+    assert 'Input Serialization' in attributes
@@ -0,0 +1,84 @@
+import os
+import pytest
+import subprocess
+import sys
+from twingraph import runner
+from twingraph.storage.object_store import get_object_store, resolve_uri
+from twingraph.orchestration import orchestration_utils
+from twingraph.orchestration.orchestration_utils import create_task_envelope, parse_outputs, await_result
+
+SOURCE_CODE = '''
+def Func_A_sum(values: list) -> NamedTuple:
+    from collections import namedtuple
+    poutput = namedtuple("outputs", ["output_1"])
+    return poutput(sum(values))
+'''
+
+
+def test_content_addressed(tmp_path):
+    """Test that identical payloads are stored once and resolved by URI."""
+    store = get_object_store('file://' + str(tmp_path))
+    uri_1 = store.put(b'twingraph payload')
+    uri_2 = store.put(b'twingraph payload')
+    assert uri_1 == uri_2
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 1
+    assert resolve_uri(uri_1) == b'twingraph payload'
+
+
+def test_payload_by_reference(tmp_path):
+    """Test that inputs above the threshold are passed as a URI."""
+    attributes = {'Name': 'Func_A_sum', 'Source Code': SOURCE_CODE}
+    envelope = create_task_envelope(
+        {'values': list(range(1000))}, attributes, {}, {'uri': 'file://' + str(tmp_path), 'threshold_bytes': 1024})
+    assert attributes['Input URI'].startswith('file://' + str(tmp_path))
+    output_str = subprocess.check_output(runner.runner_command({'python': sys.executable}) + ['--stdin'],
+                                         input=runner.encode_envelope(envelope).encode(), cwd=str(tmp_path)).decode()
+    assert parse_outputs(output_str).output_1 == sum(range(1000))
+
+
+def test_posted_result(tmp_path):
+    """Test that asynchronous Lambda results are posted to and awaited from the result store."""
+    payload_store_config = {'uri': 'file://' + str(tmp_path)}
+    envelope = create_task_envelope(
+        {'values': [1, 2, 3]}, {'Name': 'Func_A_sum', 'Source Code': SOURCE_CODE}, {}, payload_store_config)
+    envelope['result_uri'] = get_object_store(payload_store_config['uri']).uri('result-hash_a')
+    runner.handle_lambda_event({'task': runner.encode_envelope(envelope)})
+    assert parse_outputs(await_result(envelope['result_uri'], payload_store_config, timeout=5)).output_1 == 6
+
+
+def test_stored_bootstrap(tmp_path, monkeypatch):
+    """Test that with a payload store the runner bootstrap is stored once and loaded by a short command."""
+    monkeypatch.setattr(orchestration_utils, '_stored_bootstrap_uris', {})
+    payload_store_config = {'uri': 'file://' + str(tmp_path / 'store')}
+    command = orchestration_utils.runner_command(
+        {'python': sys.executable}, payload_store_config)
+    assert command == orchestration_utils.runner_command(
+        {'python': sys.executable}, payload_store_config)
+    assert sum(len(part) for part in command) < 512
+    envelope = create_task_envelope(
+        {'values': [1, 2, 3]}, {'Name': 'Func_A_sum', 'Source Code': SOURCE_CODE}, {}, payload_store_config)
+    output_str = subprocess.check_output(command + ['--stdin'], input=runner.encode_envelope(
+        envelope).encode(), cwd=str(tmp_path)).decode()
+    assert parse_outputs(output_str).output_1 == 6
+
+
+def test_stored_code_per_store(tmp_path, monkeypatch):
+    """Test that the same component code is stored once in each payload store it is used with."""
+    monkeypatch.setattr(orchestration_utils, '_stored_code_uris', {})
+    for store_name in ['store_1', 'store_2', 'store_1']:
+        payload_store_config = {'uri': 'file://' + str(tmp_path / store_name)}
+        envelope = create_task_envelope(
+            {'values': [1, 2, 3]}, {'Name': 'Func_A_sum', 'Source Code': SOURCE_CODE}, {}, payload_store_config)
+        assert envelope['code_uri'].startswith(payload_store_config['uri'])
+        assert resolve_uri(envelope['code_uri']).decode() == SOURCE_CODE
+    assert len(orchestration_utils._stored_code_uris) == 2
+
+
+def test_task_size_limit():
+    """Test that a task over the request limit of its backend fails before it is submitted."""
+    command = orchestration_utils.runner_command({})
+    orchestration_utils.check_task_size(
+        command, 'x' * 1024, orchestration_utils.BATCH_REQUEST_LIMIT, 'AWS Batch')
+    with pytest.raises(Exception, match='payload_store_config'):
+        orchestration_utils.check_task_size(
+            command, 'x' * 30000, orchestration_utils.BATCH_REQUEST_LIMIT, 'AWS Batch')
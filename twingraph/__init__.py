@@ -1 +1,10 @@
-from twingraph.orchestration.orchestration_tools import component, pipeline
\ No newline at end of file
+# The orchestration tools are imported lazily so that light-weight modules
+# such as twingraph.runner can be used inside component images without the
+# orchestration dependencies (Celery, Gremlin, Kubernetes, boto3, ...).
+
+
+def __getattr__(name):
+    if name in ('component', 'pipeline'):
+        from twingraph.orchestration import orchestration_tools
+        return getattr(orchestration_tools, name)
+    raise AttributeError("module 'twingraph' has no attribute '" + name + "'")
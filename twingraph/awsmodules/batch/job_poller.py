@@ -0,0 +1,154 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# One poller thread per process and Batch endpoint tracks every job in
+# flight: job ids are described 100 at a time (the DescribeJobs limit) and
+# waiting tasks get the final job description through a future, instead of
+# each task polling its own job. A job that cannot be described (e.g. an
+# invalid id, which fails its whole DescribeJobs call) for max_failures
+# rounds fails its future, as does a job that is still not returned
+# not_found_timeout seconds after it was submitted - DescribeJobs is
+# eventually consistent, so a new job may be missing for a while.
+
+import threading
+import time
+from concurrent.futures import Future
+
+from twingraph.awsmodules.clients import get_client
+
+TERMINAL_STATUSES = ('SUCCEEDED', 'FAILED')
+DEFAULT_NOT_FOUND_TIMEOUT = 300.0
+
+
+class BatchJobPoller:
+    def __init__(self, regionName, endpointUrl=None, min_interval=2.0, max_interval=60.0, max_calls_per_second=2.0, max_failures=10, not_found_timeout=DEFAULT_NOT_FOUND_TIMEOUT):
+        self.batch = get_client('batch', regionName, endpointUrl)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_calls_per_second = max_calls_per_second
+        self.max_failures = max_failures
+        self.not_found_timeout = not_found_timeout
+        self.futures = {}
+        # consecutive rounds in which a job could not be described
+        self.failures = {}
+        # when each job was submitted, and how long it may be missing
+        self.deadlines = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.interval = min_interval
+
+    def watch(self, jobId, not_found_timeout=None):
+        with self.lock:
+            if jobId not in self.futures:
+                self.futures[jobId] = Future()
+                self.deadlines[jobId] = time.time() + (
+                    self.not_found_timeout if not_found_timeout is None else not_found_timeout)
+            future = self.futures[jobId]
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='twingraph-batch-poller', daemon=True)
+                self.thread.start()
+        return future
+
+    def forget(self, jobId):
+        with self.lock:
+            self.futures.pop(jobId, None)
+            self.failures.pop(jobId, None)
+            self.deadlines.pop(jobId, None)
+
+    def _finish(self, jobId, job=None, exception=None):
+        with self.lock:
+            future = self.futures.pop(jobId, None)
+            self.failures.pop(jobId, None)
+            self.deadlines.pop(jobId, None)
+        if future is None:
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(job)
+
+    def _missing(self, jobId):
+        with self.lock:
+            if jobId not in self.futures:
+                return
+            missing = time.time() >= self.deadlines[jobId]
+        if missing:
+            self._finish(jobId, exception=Exception(
+                'Batch job ' + jobId + ' was not found'))
+
+    def _describe(self, job_ids):
+        jobs = self.batch.describe_jobs(jobs=job_ids)['jobs']
+        with self.lock:
+            for jobId in job_ids:
+                self.failures.pop(jobId, None)
+        returned = set()
+        for job in jobs:
+            returned.add(job['jobId'])
+            if job['status'] in TERMINAL_STATUSES:
+                self._finish(job['jobId'], job)
+        for jobId in job_ids:
+            if jobId not in returned:
+                self._missing(jobId)
+
+    def poll_interval(self, num_jobs):
+        # keeps the DescribeJobs rate bounded as the number of jobs grows
+        num_calls = -(-num_jobs // 100)
+        return min(self.max_interval, max(self.min_interval, num_calls / self.max_calls_per_second))
+
+    def poll(self):
+        with self.lock:
+            job_ids = list(self.futures.keys())
+
+        error = None
+        for start in range(0, len(job_ids), 100):
+            batch_ids = job_ids[start:start + 100]
+            try:
+                self._describe(batch_ids)
+            except Exception as e:
+                error = e
+                for jobId in batch_ids:
+                    with self.lock:
+                        if jobId not in self.futures:
+                            continue
+                        self.failures[jobId] = self.failures.get(jobId, 0) + 1
+                        isolate = self.failures[jobId] >= self.max_failures
+                    if isolate:
+                        # the call keeps failing, describe the job on its own
+                        # so that a bad id only fails its own future
+                        try:
+                            self._describe([jobId])
+                        except Exception as job_error:
+                            self._finish(jobId, exception=job_error)
+        if error is not None:
+            # throttled or unreachable, back off
+            raise error
+        return len(job_ids)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.futures:
+                    self.thread = None
+                    return
+            try:
+                num_jobs = self.poll()
+                self.interval = self.poll_interval(num_jobs)
+            except Exception:
+                # throttled or unreachable, back off
+                self.interval = min(self.max_interval, self.interval * 2)
+            time.sleep(self.interval)
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_job_poller(regionName, endpointUrl=None):
+    with _pollers_lock:
+        if (regionName, endpointUrl) not in _pollers:
+            _pollers[(regionName, endpointUrl)] = BatchJobPoller(
+                regionName, endpointUrl)
+        return _pollers[(regionName, endpointUrl)]
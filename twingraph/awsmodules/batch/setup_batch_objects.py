@@ -3,16 +3,13 @@
 # SPDX-License-Identifier: MIT-0                                     #
 ######################################################################
 
-import boto3
+from twingraph.awsmodules.clients import get_client
 import time
 import sys
 
 
 def create_compute_environment(computeEnvironmentName, computeEnvironmentType, instanceType, unitVCpus, imageId, serviceRole, instanceRole, subnets, securityGroups, regionName):
-    batch = boto3.client(
-        service_name='batch',
-        region_name=regionName,
-        endpoint_url='https://batch.' + regionName + '.amazonaws.com')
+    batch = get_client('batch', regionName)
     response = batch.create_compute_environment(
         computeEnvironmentName=computeEnvironmentName,
         type='MANAGED',
@@ -53,10 +50,7 @@ def create_compute_environment(computeEnvironmentName, computeEnvironmentType, i
 
 def create_job_queue(computeEnvironmentName, queueName, regionName):
     jobQueueName = queueName
-    batch = boto3.client(
-        service_name='batch',
-        region_name=regionName,
-        endpoint_url='https://batch.' + regionName + '.amazonaws.com')
+    batch = get_client('batch', regionName)
     response = batch.create_job_queue(jobQueueName=jobQueueName,
                                       priority=0,
                                       computeEnvironmentOrder=[
@@ -85,10 +79,7 @@ def create_job_queue(computeEnvironmentName, queueName, regionName):
 
 
 def register_job_definition(jobDefName, image, unitVCpus, unitMemory, regionName, numGPUs, envType, roleARN):
-    batch = boto3.client(
-        service_name='batch',
-        region_name=regionName,
-        endpoint_url='https://batch.' + regionName + '.amazonaws.com')
+    batch = get_client('batch', regionName)
     if envType.upper() == 'FARGATE':
         response = batch.register_job_definition(jobDefinitionName=jobDefName,
                                                  type='container',
@@ -3,18 +3,23 @@
 # SPDX-License-Identifier: MIT-0                                     #
 ######################################################################
 
-import sys
 import time
+import concurrent.futures
 from datetime import datetime
 import random
 
-import boto3
+from twingraph.awsmodules.clients import get_client
 from botocore.compat import total_seconds
 import os
 
 from twingraph.awsmodules.cloudwatch.cloudwatch_utils import get_cloudwatch_client
 
 from twingraph.awsmodules.awslambda.lambd_functions import exponential_backoff
+from twingraph.awsmodules.batch.job_poller import get_job_poller, DEFAULT_NOT_FOUND_TIMEOUT
+from twingraph.runner import RESULT_START, RESULT_END
+
+# about as long as the 350 polls of the earlier per-job loop
+DEFAULT_TIMEOUT = 54000
 
 def printLogs(logGroupName, logStreamName, startTime, regionName):
     kwargs = {'logGroupName': logGroupName,
@@ -22,10 +27,7 @@ def printLogs(logGroupName, logStreamName, startTime, regionName):
               'startTime': startTime,
               'startFromHead': True}
 
-    cloudwatch = boto3.client(
-        service_name='logs',
-        region_name=regionName,
-        endpoint_url='https://logs.' + regionName + '.amazonaws.com')
+    cloudwatch = get_cloudwatch_client(regionName)
 
     lastTimestamp = 0.
     while True:
@@ -47,10 +49,7 @@ def printLogs(logGroupName, logStreamName, startTime, regionName):
 
 def getLogStream(logGroupName, jobName, jobId, regionName):
 
-    cloudwatch = boto3.client(
-        service_name='logs',
-        region_name=regionName,
-        endpoint_url='https://logs.' + regionName + '.amazonaws.com')
+    cloudwatch = get_cloudwatch_client(regionName)
 
     response = cloudwatch.describe_log_streams(
         logGroupName=logGroupName,
@@ -69,11 +68,18 @@ def nowInMillis():
     return endTime
 
 
-def submit_job(logGroupName, jobName, jobQueue, jobDefinition, command, regionName, wait=True):
-    batch = boto3.client(
-        service_name='batch',
-        region_name=regionName,
-        endpoint_url='https://batch.' + regionName + '.amazonaws.com')
+def wait_for_job(jobId, regionName, endpointUrl=None, timeout=DEFAULT_TIMEOUT, not_found_timeout=DEFAULT_NOT_FOUND_TIMEOUT):
+    poller = get_job_poller(regionName, endpointUrl)
+    try:
+        return poller.watch(jobId, not_found_timeout).result(timeout)
+    except concurrent.futures.TimeoutError:
+        poller.forget(jobId)
+        raise Exception('Batch job ' + jobId +
+                        ' did not finish within ' + str(timeout) + ' seconds')
+
+
+def submit_job(logGroupName, jobName, jobQueue, jobDefinition, command, regionName, wait=True, environment=[], endpointUrl=None, timeout=DEFAULT_TIMEOUT, not_found_timeout=DEFAULT_NOT_FOUND_TIMEOUT):
+    batch = get_client('batch', regionName, endpointUrl)
 
     # jitter to avoid API flooding, time for cloudwatch to register
     submittedJob = False
@@ -87,7 +93,8 @@ def submit_job(logGroupName, jobName, jobQueue, jobDefinition, command, regionNa
                 jobName=jobName,
                 jobQueue=jobQueue,
                 jobDefinition=jobDefinition,
-                containerOverrides={'command': command}
+                containerOverrides={
+                    'command': command, 'environment': environment}
             )
             jobId = submitJobResponse['jobId']
             submittedJob=True
@@ -98,92 +105,127 @@ def submit_job(logGroupName, jobName, jobQueue, jobDefinition, command, regionNa
 
     # print('Submitted job [%s - %s] to the job queue [%s]' % (jobName, jobId, jobQueue))
 
-    spinner = 0
-    running = False
-    startTime = 0
+    if not wait:
+        return None
 
-    # jitter to avoid API flooding, time for cloudwatch to register
+    job = wait_for_job(jobId, regionName, endpointUrl,
+                       timeout, not_found_timeout)
+    print('%s' % ('=' * 80))
+    print('Job [%s - %s] %s' % (jobName, jobId, job['status']))
+    if job['status'] == 'SUCCEEDED':
+        return job['container']['logStreamName']
+
+    print(job['container'].get('logStreamName', ''))
+    print('Batch job failed, check Batch console', job.get('attempts', [''])[-1])
+    os.system("pkill -9 -f 'celerytasks'")
+    return None
+
+
+def submit_array_job(jobName, jobQueue, jobDefinition, command, regionName, size, environment=[], endpointUrl=None):
+    batch = get_client('batch', regionName, endpointUrl)
+
+    # jitter to avoid API flooding
+    jobId = None
     try_id=0
-    max_retries=350
-    while wait and try_id<max_retries:
-        time.sleep(min(exponential_backoff(base_delay=1.1,exponent=1.1,try_id=try_id),180))  
+    max_retries=5
+    while jobId is None and try_id<max_retries:
+        time.sleep(exponential_backoff(base_delay=1.5,exponent=1.2,try_id=try_id))
         try:
-            describeJobsResponse = batch.describe_jobs(jobs=[jobId])
-            status = describeJobsResponse['jobs'][0]['status']
-            if status == 'SUCCEEDED':
-                print('%s' % ('=' * 80))
-                print('Job [%s - %s] %s' % (jobName, jobId, status))
-                logStreamName = getLogStream(
-                    logGroupName, jobName, jobId, regionName)
-                wait=False
-                return describeJobsResponse['jobs'][0]['container']['logStreamName']
-            elif status == 'FAILED':
-                print('%s' % ('=' * 80))
-                print('Job [%s - %s] %s' % (jobName, jobId, status))
-                logStreamName = getLogStream(
-                    logGroupName, jobName, jobId, regionName)
-                print(describeJobsResponse['jobs'][0]['container']['logStreamName'])
-                print('Batch job failed, check Batch console',
-                    describeJobsResponse['jobs'][0]['attempts'][-1])
-                os.system("pkill -9 -f 'celerytasks'")
-                wait=False
-            elif status == 'RUNNING':
-                logStreamName = getLogStream(
-                    logGroupName, jobName, jobId, regionName)
-                if not running and logStreamName:
-                    running = True
-                    # print('\rJob [%s - %s] is RUNNING.' % (jobName, jobId))
-                    # print('Output [%s]:\n %s' % (logStreamName, '=' * 80))
-                if logStreamName:
-                    startTime = printLogs(
-                        logGroupName, logStreamName, startTime, regionName) + 1
-                    # print(logGroupName, logStreamName)
-            else:
-                # print('\rJob [%s - %s] is %-9s... %s' % (jobName, jobId, status, spin[spinner % len(spin)])),
-                sys.stdout.flush()
-                spinner += 1
+            submitJobResponse = batch.submit_job(
+                jobName=jobName,
+                jobQueue=jobQueue,
+                jobDefinition=jobDefinition,
+                arrayProperties={'size': size},
+                containerOverrides={
+                    'command': command, 'environment': environment}
+            )
+            jobId = submitJobResponse['jobId']
         except Exception as e:
-            # print('wait results Try '+str(try_id),e)
+            #print('submit array job try:',try_id,e)
             pass
         try_id+=1
-            
+
+    if jobId is None:
+        raise Exception('Unable to submit the Batch array job ' + jobName)
+    return jobId
+
+
+def wait_array_job(jobId, size, regionName, endpointUrl=None, timeout=DEFAULT_TIMEOUT, not_found_timeout=DEFAULT_NOT_FOUND_TIMEOUT):
+    batch = get_client('batch', regionName, endpointUrl)
+
+    wait_for_job(jobId, regionName, endpointUrl, timeout, not_found_timeout)
+
+    # the child jobs of an array job are <jobId>:<index>, described 100 at a time
+    children = [None] * size
+    for start in range(0, size, 100):
+        describeJobsResponse = batch.describe_jobs(
+            jobs=[jobId + ':' + str(index) for index in range(start, min(start + 100, size))])
+        for job in describeJobsResponse['jobs']:
+            children[job['arrayProperties']['index']] = {
+                'status': job['status'],
+                'logStreamName': job.get('container', {}).get('logStreamName', None)}
+    return children
+
+
+def find_result_event(cloudwatch, logGroupName, logStreamName):
+    # the result is printed last, so read the stream backwards page by page
+    # and stop at the first match; a result frame larger than one log event
+    # (256 KB) is split across consecutive events, which are joined again
+    kwargs = {'logGroupName': logGroupName,
+              'logStreamName': logStreamName,
+              'startFromHead': False}
+    frame = None
+    while True:
+        logEvents = cloudwatch.get_log_events(**kwargs)
+        for event in reversed(logEvents['events']):
+            message = str(event['message'])
+            if frame is not None:
+                frame.insert(0, message)
+                if RESULT_START in message:
+                    return ''.join(frame)
+            elif RESULT_END in message:
+                if RESULT_START in message:
+                    return message
+                frame = [message]
+            elif 'outputs(' in message:
+                return message
+
+        nextToken = logEvents.get('nextBackwardToken', None)
+        if not logEvents['events'] or not nextToken or kwargs.get('nextToken') == nextToken:
+            if frame is not None:
+                raise Exception('The result in log stream ' + logStreamName +
+                                ' is incomplete, the start of the result frame was not found')
+            return None
+        kwargs['nextToken'] = nextToken
+
+
 def obtain_results(batch_config, cw_log_name):
+    cloudwatch = get_cloudwatch_client(
+        batch_config['region_name'], batch_config.get('logs_endpoint_url', None))
+
     # jitter to avoid API flooding, time for cloudwatch to register
-    obtainedOutputs = False
+    output_str = None
+    error = None
     try_id=0
     max_retries=25
-    output_str = ''
-    while obtainedOutputs == False and try_id<max_retries:
+    while output_str is None and try_id<max_retries:
         time.sleep(exponential_backoff(base_delay=1.2,exponent=1.2,try_id=try_id))
         try:
-            cloudwatch = get_cloudwatch_client(batch_config['region_name'])
-            response = cloudwatch.describe_log_streams(
-                logGroupName=batch_config['logGroupName'],
-                logStreamNamePrefix=cw_log_name
-            )
-
-            kwargs = {'logGroupName': batch_config['logGroupName'],
-                      'logStreamName': response['logStreams'][0]['logStreamName'],
-                      'startTime': 0,
-                      'startFromHead': True}
-
-            for i in range(len(cloudwatch.get_log_events(
-                **kwargs)['events'])):
-                
-                output_str = str(cloudwatch.get_log_events(
-                **kwargs)['events'][-i]['message'])
-            
-                if ('outputs(' in output_str):
-                    obtainedOutputs = True 
-                    break
+            output_str = find_result_event(
+                cloudwatch, batch_config['logGroupName'], cw_log_name)
         except Exception as e:
-            #print('obtain results Try '+str(try_id),e)
-            pass
-        
+            # e.g. the events of a split result are still being ingested
+            error = e
+
         try_id+=1
-        
-    if try_id>=max_retries-1:
+
+    if output_str is None and error is not None:
+        raise Exception('Unable to read the result of the Batch job from CloudWatch log stream ' +
+                        str(cw_log_name) + ': ' + str(error))
+
+    if output_str is None:
         print('Batch job succeeded but unable to retrieve logs from Cloudwatch - please check on the Console.')
         os.system("pkill -9 -f 'celerytasks'")
-        
+        return ''
+
     return output_str
@@ -0,0 +1,51 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# boto3 clients are thread-safe but expensive to create (credential
+# resolution, endpoint and model loading) and each one owns its HTTP
+# connection pool, so they are created once per process and reused for every
+# (service, region, endpoint). Sessions are not thread-safe, clients are
+# created under a lock from one session per process.
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+_clients = {}
+_lock = threading.Lock()
+_session = {}
+_config = {'max_pool_connections': int(
+    os.environ.get('TWINGRAPH_AWS_MAX_POOL_CONNECTIONS', '32'))}
+
+
+def configure_clients(max_pool_connections):
+    # sized to the number of threads sharing the clients (e.g. the Celery
+    # concurrency), clients created before with a smaller pool are replaced
+    with _lock:
+        if max_pool_connections > _config['max_pool_connections']:
+            _config['max_pool_connections'] = max_pool_connections
+            _clients.clear()
+
+
+def create_client(service_name, region_name=None, endpoint_url=None):
+    if _session.get('pid', None) != os.getpid():
+        _session.update({'pid': os.getpid(), 'session': boto3.session.Session()})
+    return _session['session'].client(service_name, region_name=region_name, endpoint_url=endpoint_url, config=Config(
+        max_pool_connections=_config['max_pool_connections'], retries={'mode': 'standard', 'max_attempts': 5}))
+
+
+def get_client(service_name, region_name=None, endpoint_url=None):
+    key = (service_name, region_name, endpoint_url, os.getpid())
+    client = _clients.get(key, None)
+    if client is None:
+        with _lock:
+            client = _clients.get(key, None)
+            if client is None:
+                client = create_client(
+                    service_name, region_name, endpoint_url)
+                _clients[key] = client
+    return client
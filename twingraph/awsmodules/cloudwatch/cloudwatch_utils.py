@@ -3,11 +3,8 @@
 # SPDX-License-Identifier: MIT-0                                     #
 ######################################################################
 
-import boto3
+from twingraph.awsmodules.clients import get_client
 
 
-def get_cloudwatch_client(region):
-    return boto3.client(
-        service_name='logs',
-        region_name=region,
-        endpoint_url='https://logs.' + region + '.amazonaws.com')
+def get_cloudwatch_client(region, endpoint_url=None):
+    return get_client('logs', region, endpoint_url)
@@ -3,12 +3,12 @@
 # SPDX-License-Identifier: MIT-0                                     #
 ######################################################################
 
-import boto3
+from twingraph.awsmodules.clients import get_client
 
 
 
 def create_ecr_repo(repositoryName):
-    client = boto3.client('ecr')
+    client = get_client('ecr')
     response = client.create_repository(
         # registryId='string',
         repositoryName=repositoryName,
@@ -0,0 +1,163 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Warm containers for the Docker backend: instead of creating, starting and
+# removing a container per component call, long-lived containers (one idle
+# interpreter each) are kept per image and volume set, and the runner is
+# started in them with exec_run (with the CPU and memory limits of the
+# container set at creation). A container runs one task at a time; the
+# pool grows up to max_containers, and idle containers are evicted least
+# recently used first, or after max_idle_seconds. Containers left behind by
+# a driver that did not exit cleanly stop by themselves once idle, and are
+# removed by the next pool on the host.
+
+import atexit
+import collections
+import os
+import socket
+import threading
+import time
+
+from twingraph.docker.docker_utils import get_client
+
+POOL_LABEL = 'twingraph.io/container-pool'
+POOL_HOST_LABEL = 'twingraph.io/container-pool-host'
+
+# the interpreter exits when no other process (an exec of the runner) has
+# run in the container for idle_seconds
+KEEPALIVE = '''import os, time
+idle = 0
+while idle < {idle_seconds}:
+    time.sleep(10)
+    busy = any(pid.isdigit() and int(pid) != os.getpid() for pid in os.listdir('/proc'))
+    idle = 0 if busy else idle + 10
+'''
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ContainerPool:
+    def __init__(self, max_containers=None, max_idle_seconds=300, client=None):
+        self.client = client if client is not None else get_client()
+        self.max_containers = max_containers or os.cpu_count() or 1
+        self.max_idle_seconds = max_idle_seconds
+        # idle containers by last use, oldest first
+        self.idle = collections.OrderedDict()
+        self.busy = {}
+        self.condition = threading.Condition()
+        self.reap()
+
+    def reap(self):
+        # removes the containers of earlier pools on this host whose process is gone
+        try:
+            containers = self.client.containers.list(
+                all=True, filters={'label': POOL_LABEL})
+        except Exception:
+            return
+        self._remove([container for container in containers if container.labels.get(POOL_HOST_LABEL, None) == socket.gethostname()
+                      and container.labels.get(POOL_LABEL, '').isdigit() and not _pid_alive(int(container.labels[POOL_LABEL]))])
+
+    def _size(self):
+        return len(self.idle) + len(self.busy)
+
+    def _evict(self, container_ids):
+        return [self.idle.pop(container_id)[0] for container_id in container_ids]
+
+    def _remove(self, containers):
+        for container in containers:
+            try:
+                container.remove(force=True)
+            except Exception:
+                pass
+
+    def _expired(self):
+        now = time.time()
+        return [container_id for container_id, (_, _, last_used) in self.idle.items()
+                if now - last_used > self.max_idle_seconds]
+
+    def acquire(self, docker_id, volumes={}, python='python', limits={}):
+        key = (docker_id, repr(sorted(volumes.items())),
+               python, repr(sorted(limits.items())))
+        evicted = []
+        with self.condition:
+            while True:
+                evicted += self._evict(self._expired())
+                for container_id, (container, container_key, _) in reversed(self.idle.items()):
+                    if container_key == key:
+                        del self.idle[container_id]
+                        self.busy[container_id] = (container, key)
+                        break
+                else:
+                    container = None
+                if container is not None:
+                    break
+                if self._size() >= self.max_containers and self.idle:
+                    # make room by evicting the least recently used idle container
+                    evicted += self._evict([next(iter(self.idle))])
+                if self._size() < self.max_containers:
+                    # reserved while the container starts
+                    placeholder = object()
+                    self.busy[id(placeholder)] = (placeholder, key)
+                    break
+                self.condition.wait()
+        self._remove(evicted)
+        if container is not None:
+            return container
+
+        try:
+            # outlives the idle eviction of the pool, so that the pool
+            # itself never finds an exited container
+            container = self.client.containers.run(docker_id, entrypoint=[python, '-c', KEEPALIVE.format(idle_seconds=2 * self.max_idle_seconds + 60)], volumes=volumes, detach=True,
+                                                   labels={POOL_LABEL: str(os.getpid()), POOL_HOST_LABEL: socket.gethostname()}, **limits)
+        except Exception:
+            with self.condition:
+                del self.busy[id(placeholder)]
+                self.condition.notify()
+            raise
+        with self.condition:
+            del self.busy[id(placeholder)]
+            self.busy[container.id] = (container, key)
+        return container
+
+    def release(self, container, healthy=True):
+        with self.condition:
+            _, key = self.busy.pop(container.id)
+            if healthy:
+                self.idle[container.id] = (container, key, time.time())
+            self.condition.notify()
+        if not healthy:
+            self._remove([container])
+
+    def shutdown(self):
+        with self.condition:
+            containers = [container for container, _, _ in self.idle.values()]
+            self.idle.clear()
+        self._remove(containers)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_container_pool(max_containers=None, max_idle_seconds=300):
+    with _pools_lock:
+        if (max_containers, max_idle_seconds) not in _pools:
+            _pools[(max_containers, max_idle_seconds)] = ContainerPool(
+                max_containers, max_idle_seconds)
+        return _pools[(max_containers, max_idle_seconds)]
+
+
+@atexit.register
+def shutdown_container_pools():
+    for pool in list(_pools.values()):
+        pool.shutdown()
@@ -4,17 +4,84 @@
 ######################################################################
 
 import docker
+import hashlib
+import io
+import os
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from docker.utils.build import exclude_paths
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 
 def get_client():
-    return docker.from_env()
+    # one client (and connection pool) per process, shared by all threads
+    with _clients_lock:
+        if os.getpid() not in _clients:
+            _clients[os.getpid()] = docker.from_env(max_pool_size=32)
+        return _clients[os.getpid()]
+
+
+def create_file_archive(file_name, data):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        tar_info = tarfile.TarInfo(name=file_name)
+        tar_info.size = len(data)
+        tar.addfile(tar_info, io.BytesIO(data))
+    return archive.getvalue()
+
+
+def read_file_from_container(container, path):
+    stream, _ = container.get_archive(path)
+    with tarfile.open(fileobj=io.BytesIO(b''.join(stream))) as tar:
+        return tar.extractfile(tar.getmembers()[0]).read()
+
+
+CONTEXT_HASH_LABEL = 'twingraph.io/context-hash'
+
+
+def _ignore_patterns(dockerfile_path):
+    try:
+        with open(os.path.join(dockerfile_path, '.dockerignore')) as ignore_file:
+            return [line.strip() for line in ignore_file if line.strip() and not line.startswith('#')]
+    except FileNotFoundError:
+        return []
+
 
+def context_hash(dockerfile_path, dockerfile_name):
+    # hash of the build context (file names, modes and contents) and the
+    # Dockerfile; the files are selected by the .dockerignore rules of the
+    # Docker SDK, including the ! exceptions, as sent with the build
+    included = exclude_paths(dockerfile_path, _ignore_patterns(
+        dockerfile_path), dockerfile=dockerfile_name)
+    context = hashlib.sha256()
+    for relative_path in sorted(included):
+        file_path = os.path.join(dockerfile_path, relative_path)
+        if not os.path.isfile(file_path):
+            continue
+        context.update(relative_path.encode() + b'\0' +
+                       str(os.stat(file_path).st_mode & 0o777).encode() + b'\0')
+        with open(file_path, 'rb') as context_file:
+            context.update(hashlib.sha256(context_file.read()).digest())
+    with open(os.path.join(dockerfile_path, dockerfile_name), 'rb') as dockerfile:
+        context.update(b'Dockerfile\0' + dockerfile.read())
+    return context.hexdigest()
 
-def build_image(dockerfile_path, dockerfile_name, image_tag):
+
+def build_image(dockerfile_path, dockerfile_name, image_tag, use_cache=True):
+    # The build is skipped when an image of the same context already exists
     client = get_client()
-    client.containers.prune()
+    build_hash = context_hash(dockerfile_path, dockerfile_name)
+    if use_cache:
+        images = client.images.list(
+            filters={'label': CONTEXT_HASH_LABEL + '=' + build_hash})
+        if images:
+            images[0].tag(image_tag)
+            return 0
     client.images.build(path=dockerfile_path,
-                        dockerfile=dockerfile_name, tag=image_tag)
+                        dockerfile=dockerfile_name, tag=image_tag, labels={CONTEXT_HASH_LABEL: build_hash})
     return 0
 
 
@@ -23,7 +90,43 @@ def tag_image(image_name, repo_name, repo_tag):
     client.images.get(image_name).tag(repository=repo_name, tag=repo_tag)
 
 
-def push_image(repo_name, repo_tag):
+def _reference(repo_name, repo_tag):
+    if ':' in repo_name.rsplit('/', 1)[-1]:
+        return repo_name
+    return repo_name + ':' + repo_tag
+
+
+def registry_has_image(repo_name, repo_tag):
+    # The registry digest of the tag is compared with the digests the local
+    # image was pushed or pulled with
     client = get_client()
-    client.images.push(repository=repo_name, tag=repo_tag)
+    reference = _reference(repo_name, repo_tag)
+    try:
+        registry_digest = client.images.get_registry_data(reference).id
+        local_digests = client.images.get(reference).attrs.get('RepoDigests', [])
+    except docker.errors.APIError:
+        return False
+    return reference.rsplit(':', 1)[0] + '@' + registry_digest in local_digests
+
+
+def push_image(repo_name, repo_tag, skip_existing=True):
+    if skip_existing and registry_has_image(repo_name, repo_tag):
+        return 0
+    client = get_client()
+    for line in client.images.push(repository=repo_name, tag=repo_tag, stream=True, decode=True):
+        if 'error' in line:
+            raise Exception('Pushing ' + repo_name +
+                            ' failed: ' + line['error'])
     return 0
+
+
+def tag_and_push_images(images, max_workers=8):
+    # images: (image_name, repo_name, repo_tag) for each component, tagged
+    # and pushed concurrently
+    def tag_and_push(image):
+        image_name, repo_name, repo_tag = image
+        tag_image(image_name, repo_name, repo_tag)
+        return push_image(repo_name, repo_tag)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(tag_and_push, images))
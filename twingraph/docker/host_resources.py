@@ -0,0 +1,146 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Admission of local Docker tasks by host capacity. Every process on the
+# host (e.g. all Celery workers) reserves CPUs and memory in one ledger file
+# under an exclusive lock; a task only starts once its CPUs (pinned to
+# specific cores) and memory are free, and waits otherwise. Reservations of
+# processes that are gone are dropped when the ledger is read.
+
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+LEDGER_PATH = os.environ.get('TWINGRAPH_HOST_RESOURCES', os.path.join(
+    tempfile.gettempdir(), 'twingraph-host-resources.json'))
+
+_memory_units = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_memory(memory):
+    # bytes, or a Docker style string such as '512m' or '2g'
+    if memory is None:
+        return 0
+    if isinstance(memory, (int, float)):
+        return int(memory)
+    memory = memory.strip().lower()
+    if memory[-1] in _memory_units:
+        return int(float(memory[:-1]) * _memory_units[memory[-1]])
+    return int(memory)
+
+
+def host_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def host_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Reservation:
+    def __init__(self, token, cpus, memory):
+        self.token = token
+        self.cpus = cpus
+        self.memory = memory
+
+    @property
+    def cpuset(self):
+        return ','.join(str(cpu) for cpu in self.cpus)
+
+
+class HostResources:
+    def __init__(self, path=LEDGER_PATH, cpus=None, memory=None, memory_fraction=0.9):
+        self.path = path
+        self.cpus = cpus if cpus is not None else host_cpus()
+        self.memory = memory if memory is not None else int(
+            host_memory() * memory_fraction)
+        self.lock = threading.Lock()
+
+    def _update(self, change):
+        # read-modify-write of the ledger under the host wide lock
+        with self.lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path) as ledger_file:
+                    ledger = json.load(ledger_file)
+            except (FileNotFoundError, ValueError):
+                ledger = {}
+            ledger = {token: entry for token,
+                      entry in ledger.items() if _alive(entry['pid'])}
+            result = change(ledger)
+            tmp_path = self.path + '.' + str(os.getpid())
+            with open(tmp_path, 'w') as ledger_file:
+                json.dump(ledger, ledger_file)
+            os.replace(tmp_path, self.path)
+            return result
+
+    def try_reserve(self, cpus=1, memory=0):
+        num_cpus = min(len(self.cpus), max(1, math.ceil(cpus))) if cpus else 0
+        memory = parse_memory(memory)
+
+        def reserve(ledger):
+            used_cpus = set(
+                cpu for entry in ledger.values() for cpu in entry['cpus'])
+            used_memory = sum(entry['memory'] for entry in ledger.values())
+            free_cpus = [cpu for cpu in self.cpus if cpu not in used_cpus]
+            if len(free_cpus) < num_cpus:
+                return None
+            # a task larger than the host is admitted once the host is idle
+            if self.memory and memory and used_memory + memory > self.memory and used_memory > 0:
+                return None
+            token = uuid.uuid4().hex
+            ledger[token] = {'pid': os.getpid(),
+                             'cpus': free_cpus[:num_cpus], 'memory': memory}
+            return Reservation(token, free_cpus[:num_cpus], memory)
+
+        return self._update(reserve)
+
+    def reserve(self, cpus=1, memory=0, timeout=None):
+        start_time = time.time()
+        interval = 0.05
+        while True:
+            reservation = self.try_reserve(cpus, memory)
+            if reservation is not None:
+                return reservation
+            if timeout is not None and time.time() - start_time > timeout:
+                raise Exception('Timed out waiting for ' + str(cpus) +
+                                ' CPUs and ' + str(memory) + ' of memory on this host')
+            time.sleep(interval)
+            interval = min(interval * 1.5, 1.0)
+
+    def release(self, reservation):
+        self._update(lambda ledger: ledger.pop(reservation.token, None))
+
+
+_host_resources = {}
+_host_resources_lock = threading.Lock()
+
+
+def get_host_resources(path=LEDGER_PATH):
+    with _host_resources_lock:
+        if path not in _host_resources:
+            _host_resources[path] = HostResources(path)
+        return _host_resources[path]
@@ -33,12 +33,7 @@ def init_reset_graph(gremlin_IP):
     pass
 
 
-def add_vertex_connection(gremlin_IP, attributes):
-    connection = DriverRemoteConnection(gremlin_IP, 'g')
-
-    graph = Graph()
-    g = graph.traversal().withRemote(connection)
-
+def add_vertex(g, attributes):
     # prepare the add vertex sub traversal
     add_vertex_traversal = __.addV(attributes["Name"])
     for k, v in attributes.items():
@@ -59,5 +54,42 @@ def add_vertex_connection(gremlin_IP, attributes):
     # for p in g.V().has('Hash', attributes['Hash']).properties():
     #    print("key:",p.label, "| value: " ,p.value)
 
+
+def add_vertex_connection(gremlin_IP, attributes):
+    connection = DriverRemoteConnection(gremlin_IP, 'g')
+
+    graph = Graph()
+    g = graph.traversal().withRemote(connection)
+
+    add_vertex(g, attributes)
+
     connection.close()
     pass
+
+
+def add_vertices(gremlin_IP, attributes_list):
+    # records a batch of vertices (e.g. the elements of a map) over one connection
+    connection = DriverRemoteConnection(gremlin_IP, 'g')
+
+    graph = Graph()
+    g = graph.traversal().withRemote(connection)
+
+    for attributes in attributes_list:
+        add_vertex(g, attributes)
+
+    connection.close()
+    pass
+
+
+def get_component_durations(gremlin_IP):
+    connection = DriverRemoteConnection(gremlin_IP, 'g')
+
+    graph = Graph()
+    g = graph.traversal().withRemote(connection)
+
+    # mean 'Duration' of the recorded runs of each component, by name
+    durations = g.V().has('Duration').group().by(
+        __.label()).by(__.values('Duration').mean()).next()
+
+    connection.close()
+    return durations
@@ -0,0 +1,101 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# One watch per process and namespace tracks every TwinGraph job in flight:
+# the jobs are listed once by label and then followed through the watch
+# stream, and waiting tasks get the finished V1Job through a future, instead
+# of each task running its own `kubectl wait`.
+
+import threading
+import time
+from concurrent.futures import Future
+
+from kubernetes import watch
+
+from twingraph.kubernetes import k8s_class
+
+JOB_LABEL_SELECTOR = 'app.kubernetes.io/managed-by=twingraph'
+TERMINAL_CONDITIONS = ('Complete', 'Failed')
+
+
+def job_state(job):
+    for condition in (job.status.conditions or []) if job.status else []:
+        if condition.type in TERMINAL_CONDITIONS and condition.status == 'True':
+            return condition.type
+    return None
+
+
+class JobInformer:
+    def __init__(self, namespace, batch_api=None, label_selector=JOB_LABEL_SELECTOR, timeout_seconds=60, retry_interval=2.0):
+        self.namespace = namespace
+        self.batch_api = batch_api if batch_api is not None else k8s_class.batch_api
+        self.label_selector = label_selector
+        self.timeout_seconds = timeout_seconds
+        self.retry_interval = retry_interval
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stream = None
+
+    def watch(self, job_name):
+        # called before the job is created, so that no event can be missed
+        with self.lock:
+            if job_name not in self.futures:
+                self.futures[job_name] = Future()
+            future = self.futures[job_name]
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='twingraph-k8s-informer', daemon=True)
+                self.thread.start()
+        return future
+
+    def forget(self, job_name):
+        with self.lock:
+            self.futures.pop(job_name, None)
+
+    def update(self, jobs):
+        for job in jobs:
+            if job_state(job) is None:
+                continue
+            with self.lock:
+                future = self.futures.pop(job.metadata.name, None)
+                if not self.futures and self.stream is not None:
+                    self.stream.stop()
+            if future is not None:
+                future.set_result(job)
+
+    def _run(self):
+        resource_version = None
+        while True:
+            with self.lock:
+                if not self.futures:
+                    self.thread = None
+                    return
+                self.stream = watch.Watch()
+            try:
+                if resource_version is None:
+                    job_list = self.batch_api.list_namespaced_job(
+                        self.namespace, label_selector=self.label_selector)
+                    self.update(job_list.items)
+                    resource_version = job_list.metadata.resource_version
+                for event in self.stream.stream(self.batch_api.list_namespaced_job, self.namespace, label_selector=self.label_selector, resource_version=resource_version, timeout_seconds=self.timeout_seconds):
+                    self.update([event['object']])
+                # the stream timed out or was stopped, resume where it ended
+                resource_version = self.stream.resource_version
+            except Exception:
+                # e.g. 410 Gone when the resource version is too old, list again
+                resource_version = None
+                time.sleep(self.retry_interval)
+
+
+_informers = {}
+_informers_lock = threading.Lock()
+
+
+def get_job_informer(namespace):
+    with _informers_lock:
+        if namespace not in _informers:
+            _informers[namespace] = JobInformer(namespace)
+        return _informers[namespace]
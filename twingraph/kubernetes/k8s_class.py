@@ -4,7 +4,12 @@
 ######################################################################
 
 import logging
-from kubernetes import client, config, watch
+import os
+import threading
+import uuid
+from kubernetes import client, config
+
+from twingraph.orchestration.run_context import current_run_id
 
 logging.basicConfig(level=logging.INFO)
 
@@ -19,27 +24,50 @@ except:
 core_api = client.CoreV1Api()
 batch_api = client.BatchV1Api()
 
+# Jobs are labelled with the run that created them (the Celery workers of a
+# pipeline inherit TWINGRAPH_RUN_ID), see delete_run_jobs
+RUN_ID = os.environ.get('TWINGRAPH_RUN_ID', uuid.uuid4().hex)
+RUN_ID_LABEL = 'twingraph.io/run-id'
+COMPONENT_LABEL = 'twingraph.io/component'
 
-def create_namespace(namespace):
+_namespaces = set()
+_namespaces_lock = threading.Lock()
 
-    namespaces = core_api.list_namespace()
-    all_namespaces = []
-    for ns in namespaces.items:
-        all_namespaces.append(ns.metadata.name)
 
-    if namespace in all_namespaces:
-        logging.info(f"Namespace {namespace} already exists. Reusing.")
-    else:
-        namespace_metadata = client.V1ObjectMeta(name=namespace)
-        core_api.create_namespace(
-            client.V1Namespace(metadata=namespace_metadata)
-        )
-        logging.info(f"Created namespace {namespace}.")
+def create_namespace(namespace):
+    if namespace in _namespaces:
+        return namespace
+
+    with _namespaces_lock:
+        if namespace in _namespaces:
+            return namespace
+        try:
+            core_api.read_namespace(namespace)
+            logging.info(f"Namespace {namespace} already exists. Reusing.")
+        except client.exceptions.ApiException as e:
+            if e.status == 403:
+                # not allowed to read namespaces, the jobs are created in it
+                # as before and fail there if it does not exist
+                _namespaces.add(namespace)
+                return namespace
+            if e.status != 404:
+                raise
+            namespace_metadata = client.V1ObjectMeta(name=namespace)
+            try:
+                core_api.create_namespace(
+                    client.V1Namespace(metadata=namespace_metadata)
+                )
+                logging.info(f"Created namespace {namespace}.")
+            except client.exceptions.ApiException as e:
+                # created by another process in the meantime
+                if e.status != 409:
+                    raise
+        _namespaces.add(namespace)
 
     return namespace
 
 
-def create_container(image, name, pull_policy, command, args):
+def create_container(image, name, pull_policy, command, args, volume_mounts=None, env=None):
 
     container = client.V1Container(
         image=image,
@@ -47,14 +75,27 @@ def create_container(image, name, pull_policy, command, args):
         image_pull_policy=pull_policy,
         args=args,
         command=command,
+        volume_mounts=volume_mounts,
+        env=env,
+        termination_message_path="/dev/termination-log",
+        termination_message_policy="FallbackToLogsOnError",
     )
 
     return container
 
 
-def create_pod_template(pod_name, container):
+def create_payload_volume(path, claim_name=None):
+    # A persistent volume claim shared by all nodes, or the host path on
+    # single node clusters.
+    if claim_name:
+        return client.V1Volume(name='twingraph-payloads', persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(claim_name=claim_name))
+    return client.V1Volume(name='twingraph-payloads', host_path=client.V1HostPathVolumeSource(path=path))
+
+
+def create_pod_template(pod_name, container, volumes=None):
     pod_template = client.V1PodTemplateSpec(
-        spec=client.V1PodSpec(restart_policy="Never", containers=[container]),
+        spec=client.V1PodSpec(restart_policy="Never",
+                              containers=[container], volumes=volumes),
         metadata=client.V1ObjectMeta(name=pod_name, labels={
                                      "pod_name": pod_name}),
     )
@@ -62,15 +103,81 @@ def create_pod_template(pod_name, container):
     return pod_template
 
 
-def create_job(job_name, pod_template):
-    metadata = client.V1ObjectMeta(name=job_name, labels={"job_name": job_name})
+def create_job(job_name, pod_template, completions=None, parallelism=None, labels={}, ttl_seconds_after_finished=None):
+    metadata = client.V1ObjectMeta(name=job_name, labels=dict(
+        {"job_name": job_name, "app.kubernetes.io/managed-by": "twingraph"}, **labels))
+
+    # Finished jobs (and their pods) are garbage collected by the TTL controller
+    if completions is None:
+        spec = client.V1JobSpec(backoff_limit=0, template=pod_template,
+                                ttl_seconds_after_finished=ttl_seconds_after_finished)
+    else:
+        # Indexed Job, each pod gets its JOB_COMPLETION_INDEX
+        spec = client.V1JobSpec(backoff_limit=0, template=pod_template, completion_mode="Indexed",
+                                completions=completions, parallelism=parallelism or completions,
+                                ttl_seconds_after_finished=ttl_seconds_after_finished)
 
     job = client.V1Job(
         api_version="batch/v1",
         kind="Job",
         metadata=metadata,
-        spec=client.V1JobSpec(backoff_limit=0, template=pod_template),
+        spec=spec,
     )
 
     return job
 
+
+def get_termination_message(job_name, namespace):
+    pods = core_api.list_namespaced_pod(
+        namespace, label_selector="job-name=" + job_name)
+    for pod in pods.items:
+        message = get_pod_termination_message(pod)
+        if message:
+            return message
+    return ''
+
+
+def get_job_logs(job_name, namespace):
+    pods = core_api.list_namespaced_pod(
+        namespace, label_selector="job-name=" + job_name)
+    if not pods.items:
+        return ''
+    return core_api.read_namespaced_pod_log(pods.items[-1].metadata.name, namespace)
+
+
+def get_indexed_pods(job_name, namespace):
+    # The pods of an Indexed Job by completion index, the succeeded pod
+    # of an index is preferred
+    pods = core_api.list_namespaced_pod(
+        namespace, label_selector="job-name=" + job_name)
+    indexed_pods = {}
+    for pod in pods.items:
+        index = int((pod.metadata.annotations or {}).get(
+            "batch.kubernetes.io/job-completion-index", -1))
+        if index not in indexed_pods or pod.status.phase == "Succeeded":
+            indexed_pods[index] = pod
+    return indexed_pods
+
+
+def get_pod_termination_message(pod):
+    for container_status in pod.status.container_statuses or []:
+        terminated = container_status.state.terminated
+        if terminated is not None and terminated.message:
+            return terminated.message
+    return ''
+
+
+def get_pod_logs(pod):
+    return core_api.read_namespaced_pod_log(pod.metadata.name, pod.metadata.namespace)
+
+
+def run_labels(component_name, run_id=None):
+    # label values are limited to 63 characters
+    return {RUN_ID_LABEL: (run_id or current_run_id(RUN_ID))[:63], COMPONENT_LABEL: component_name[:63].strip('_.-')}
+
+
+def delete_run_jobs(run_id=None, namespace='default'):
+    # Removes the jobs (and pods) of a run in one request, e.g. when they
+    # are kept for debugging with a long ttl_seconds_after_finished
+    batch_api.delete_collection_namespaced_job(
+        namespace, label_selector=RUN_ID_LABEL + '=' + (run_id or current_run_id(RUN_ID))[:63], propagation_policy='Background')
@@ -0,0 +1,356 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Code generation for Celery pipelines. The tasks module is the include files
+# with a Celery task decorator added above each top-level component; it is
+# edited by line on the parsed AST so that the recorded (and shipped) source
+# of the components stays as written. The pipeline (driver) module is the
+# body of the pipeline function with the component calls rewritten on the
+# AST, skipping names that are rebound inside the pipeline, so that the whole
+# DAG is submitted without waiting (see celery_refs). Both modules are
+# written once per hash of their inputs and reused by later runs.
+
+import ast
+import hashlib
+import os
+import py_compile
+import shutil
+
+CODEGEN_VERSION = '6'
+
+# the leading positional arguments of the component decorator
+COMPONENT_ARGUMENTS = ('lambda_task', 'batch_task',
+                       'kubernetes_task', 'f_py', 'docker_id')
+REMOTE_FLAGS = ('lambda_task', 'batch_task', 'kubernetes_task')
+
+
+def _decorator_name(decorator):
+    if isinstance(decorator, ast.Call):
+        decorator = decorator.func
+    if isinstance(decorator, ast.Attribute):
+        return decorator.attr
+    if isinstance(decorator, ast.Name):
+        return decorator.id
+    return None
+
+
+def is_decorated(node, name):
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(
+        _decorator_name(decorator) == name for decorator in node.decorator_list)
+
+
+def component_names(tree):
+    return [node.name for node in tree.body if is_decorated(node, 'component')]
+
+
+def is_remote_component(node):
+    # Components on AWS Batch, AWS Lambda, Kubernetes or Docker only wait on
+    # their backend in the worker; flags that are not literals count as set
+    for decorator in node.decorator_list:
+        if _decorator_name(decorator) != 'component' or not isinstance(decorator, ast.Call):
+            continue
+        arguments = list(zip(COMPONENT_ARGUMENTS, decorator.args)) + \
+            [(keyword.arg, keyword.value) for keyword in decorator.keywords]
+        for name, value in arguments:
+            literal = isinstance(value, ast.Constant)
+            if name in REMOTE_FLAGS and not (literal and not value.value):
+                return True
+            if name == 'docker_id' and not (literal and value.value == 'NotProvided'):
+                return True
+    return False
+
+
+def remote_component_names(source):
+    return [node.name for node in ast.parse(source).body if is_decorated(node, 'component') and is_remote_component(node)]
+
+
+def _first_line(node):
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])])
+
+
+def _is_main_block(node):
+    test = getattr(node, 'test', None)
+    return isinstance(node, ast.If) and isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == '__name__'
+
+
+def _is_call_of(node, names):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and node.value.func.id in names
+
+
+def _imported_module(node):
+    if isinstance(node, ast.ImportFrom) and node.level == 0:
+        return [node.module]
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    return []
+
+
+def include_module_names(include_files, base_dir):
+    # The module names under which the include files may be imported, e.g.
+    # components/component_1.py -> components.component_1
+    names = set()
+    for include_file in include_files:
+        relative_path = os.path.relpath(include_file, base_dir) if os.path.isabs(
+            include_file) else include_file
+        names.add(os.path.splitext(relative_path)[0].replace(os.sep, '.'))
+        names.add(os.path.splitext(os.path.basename(include_file))[0])
+    return names
+
+
+def rewrite_include(source, task_decorator, pipeline_names, include_modules, io_task_decorator=None):
+    # Line based edits located on the AST: the task decorator is inserted
+    # above the components (io_task_decorator above remote components), the pipelines (definitions, calls and __main__
+    # blocks) and the imports of other include files are removed.
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    inserts = {}
+    removed = set()
+    functions = []
+    for node in tree.body:
+        if is_decorated(node, 'component'):
+            first_line = _first_line(node)
+            indent = lines[first_line - 1][:len(lines[first_line - 1]) -
+                                           len(lines[first_line - 1].lstrip())]
+            inserts[first_line] = indent + (io_task_decorator if io_task_decorator is not None and is_remote_component(
+                node) else task_decorator) + '\n'
+            functions.append(node.name)
+        elif is_decorated(node, 'pipeline') or getattr(node, 'name', None) in pipeline_names or _is_call_of(node, pipeline_names) or _is_main_block(node) or any(module in include_modules for module in _imported_module(node)):
+            removed.update(range(_first_line(node), node.end_lineno + 1))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append(node.name)
+
+    rewritten = []
+    for line_number, line in enumerate(lines, start=1):
+        if line_number in inserts:
+            rewritten.append(inserts[line_number])
+        if line_number not in removed:
+            rewritten.append(line)
+    if rewritten and not rewritten[-1].endswith('\n'):
+        rewritten.append('\n')
+    return ''.join(rewritten), component_names(tree), functions
+
+
+def _bound_names(function_node):
+    arguments = function_node.args
+    names = set(argument.arg for argument in arguments.args +
+                arguments.kwonlyargs + getattr(arguments, 'posonlyargs', []))
+    names.update(argument.arg for argument in (
+        arguments.vararg, arguments.kwarg) if argument is not None)
+    for node in ast.walk(function_node):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node is not function_node:
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0]
+                         for alias in node.names)
+    return names
+
+
+def _slice(node):
+    key = node.slice
+    if type(key).__name__ == 'Index':
+        # Python 3.8
+        key = key.value
+    return key
+
+
+def _subscript_key(node):
+    key = _slice(node)
+    return key.value if isinstance(key, ast.Constant) else None
+
+
+def _is_result_key(node):
+    return isinstance(node, ast.Subscript) and _subscript_key(node) in ('outputs', 'hash')
+
+
+def _assigned_names(function_node):
+    return set(node.id for node in ast.walk(function_node) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store))
+
+
+def _root_name(node):
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _attribute_path(node, handle_names):
+    # handle.outputs.field, handle.outputs and handle.hash on the handles
+    # assigned in the pipeline -> (handle, ['outputs', 'field'])
+    if not isinstance(node, ast.Attribute):
+        return None, None
+    if node.attr in ('outputs', 'hash') and _root_name(node.value) in handle_names:
+        return node.value, [ast.Constant(value=node.attr)]
+    if isinstance(node.value, ast.Attribute) and node.value.attr == 'outputs' and _root_name(node.value.value) in handle_names:
+        return node.value.value, [ast.Constant(value='outputs'), ast.Constant(value=node.attr)]
+    return None, None
+
+
+def _result_path(node, handle_names=()):
+    # base['outputs'][key]... -> (base, ['outputs', key, ...])
+    keys = []
+    while isinstance(node, ast.Subscript):
+        keys.insert(0, _slice(node))
+        if _subscript_key(node) in ('outputs', 'hash'):
+            return node.value, keys
+        node = node.value
+    base, attribute_keys = _attribute_path(node, handle_names)
+    if base is not None:
+        return base, attribute_keys + keys
+    return None, None
+
+
+def _call(name, args, keywords=[]):
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=keywords)
+
+
+class PipelineTransformer(ast.NodeTransformer):
+    # Func(...) -> celery_submit(Func, ...), Func.map(...) -> celery_map(...).
+    # In the arguments of a component call or map (directly, or within
+    # lists, tuples, dicts and comprehensions) handle['outputs'][...] /
+    # handle['hash'] - or handle.outputs.field / handle.hash on the names
+    # assigned in the pipeline - become references resolved by the worker, elsewhere the outputs are read in
+    # the driver with result_value(handle)[...]; the hashes are always kept
+    # as references (e.g. parent_hash = [a['hash'], b['hash']]) so that
+    # reading them never waits on the component
+    def __init__(self, components, io_components=(), handle_names=()):
+        self.components = set(components)
+        self.io_components = set(io_components)
+        self.handle_names = set(handle_names)
+        self.in_arguments = False
+
+    def visit(self, node):
+        in_arguments = self.in_arguments
+        if not isinstance(node, (ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Starred, ast.keyword, ast.Subscript, ast.Attribute, ast.Call, ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            self.in_arguments = False
+        try:
+            return super().visit(node)
+        finally:
+            self.in_arguments = in_arguments
+
+    def visit_Dict(self, node):
+        in_arguments = self.in_arguments
+        self.in_arguments = False
+        node.keys = [self.visit(key) if key is not None else None for key in node.keys]
+        self.in_arguments = in_arguments
+        node.values = [self.visit(value) for value in node.values]
+        return node
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in self.components:
+            self.in_arguments = True
+            node.args = [self.visit(arg) for arg in node.args]
+            node.keywords = [self.visit(keyword) for keyword in node.keywords]
+            return _call('celery_submit', [func] + node.args, node.keywords)
+        if isinstance(func, ast.Attribute) and func.attr == 'map' and isinstance(func.value, ast.Name) and func.value.id in self.components:
+            self.in_arguments = True
+            node.args = [self.visit(arg) for arg in node.args]
+            node.keywords = [self.visit(keyword) for keyword in node.keywords]
+            chunk_task = 'twingraph_map_chunk_io' if func.value.id in self.io_components else 'twingraph_map_chunk'
+            return _call('celery_map', [ast.Name(id=chunk_task, ctx=ast.Load()), ast.Constant(value=func.value.id)] + node.args, node.keywords)
+        self.in_arguments = False
+        self.generic_visit(node)
+        return node
+
+    def _visit_comprehension(self, node, fields):
+        # the elements built by a comprehension are arguments as well, e.g.
+        # Func.map([{'input_1': a_k['outputs']['sum']} for a_k in a])
+        in_arguments = self.in_arguments
+        self.in_arguments = False
+        node.generators = [self.visit(generator)
+                           for generator in node.generators]
+        for field in fields:
+            self.in_arguments = in_arguments and field != 'key'
+            setattr(node, field, self.visit(getattr(node, field)))
+        return node
+
+    def visit_ListComp(self, node):
+        return self._visit_comprehension(node, ['elt'])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        return self._visit_comprehension(node, ['key', 'value'])
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Load):
+            base, keys = _attribute_path(node, self.handle_names)
+            if base is not None:
+                in_arguments = self.in_arguments
+                self.in_arguments = False
+                base = self.visit(base)
+                if in_arguments or node.attr == 'hash':
+                    return _call('result_ref', [base] + keys)
+                node = _call('result_value', [base])
+                for key in keys:
+                    node = ast.Subscript(value=node, slice=key, ctx=ast.Load())
+                return node
+        self.in_arguments = False
+        self.generic_visit(node)
+        return node
+
+    def visit_Subscript(self, node):
+        if self.in_arguments and isinstance(node.ctx, ast.Load):
+            base, keys = _result_path(node, self.handle_names)
+            if base is not None and not any(isinstance(key, ast.Slice) for key in keys):
+                self.in_arguments = False
+                return _call('result_ref', [self.visit(base)] + [self.visit(key) for key in keys])
+        self.in_arguments = False
+        if isinstance(node.ctx, ast.Load) and _subscript_key(node) == 'hash' and not _is_result_key(node.value):
+            return _call('result_ref', [self.visit(node.value), _slice(node)])
+        self.generic_visit(node)
+        if _subscript_key(node) in ('outputs', 'hash') and not _is_result_key(node.value):
+            node.value = _call('result_value', [node.value])
+        return node
+
+
+def find_function(tree, name):
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+            return node
+    raise Exception('Pipeline function ' + name + ' not found')
+
+
+def rewrite_pipeline(source, pipeline_name, components, io_components=()):
+    function_node = find_function(ast.parse(source), pipeline_name)
+    function_node.decorator_list = []
+    transformer = PipelineTransformer(
+        set(components) - _bound_names(function_node), io_components, _assigned_names(function_node))
+    module = ast.Module(body=[transformer.visit(function_node)], type_ignores=[])
+    return ast.unparse(ast.fix_missing_locations(module)) + '\n'
+
+
+def codegen_key(*parts):
+    key = hashlib.sha256(CODEGEN_VERSION.encode())
+    for part in parts:
+        key.update(hashlib.sha256(str(part).encode()).digest())
+    return key.hexdigest()
+
+
+def cached_modules(cache_dir, modules):
+    # modules: {file name: source}, written and byte-compiled once per
+    # cache_dir; the directory is renamed into place so that concurrent
+    # runs never see a partial directory
+    if os.path.isdir(cache_dir):
+        return cache_dir, True
+
+    tmp_dir = cache_dir + '.tmp' + str(os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for file_name, source in modules.items():
+        with open(os.path.join(tmp_dir, file_name), 'w') as module_file:
+            module_file.write(source)
+        if not file_name.endswith('.py'):
+            continue
+        py_compile.compile(os.path.join(tmp_dir, file_name), dfile=os.path.join(
+            cache_dir, file_name), doraise=True)
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # written by another run in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return cache_dir, False
@@ -0,0 +1,184 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Persistent Celery workers (celery_persistent_workers=True). Instead of a
+# new worker per pipeline run, one long-lived worker fleet per broker and
+# settings is started on demand (detached, so that it outlives the run) and
+# shared by the pipeline runs. It has a single generic task, which imports
+# the generated tasks module of a pipeline by path - the path includes the
+# hash of the generated code - and calls the component in it; each pipeline
+# (version) gets its own queues, which are added to the running fleet, so a
+# new run starts on warm workers and runs never kill each other's workers.
+# As with the workers of a single run, the fleet has a prefork worker for
+# the local components and an I/O worker (threads, gevent or eventlet) for
+# the components waiting on a remote backend.
+
+import fcntl
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from celery import Celery
+
+from twingraph.orchestration.celery_refs import ResultRefTask
+from twingraph.orchestration.run_context import set_run_id, set_task_dir
+
+FLEET_QUEUE = 'twingraph.fleet'
+FLEET_ROLES = ('cpu', 'io')
+RUN_COMPONENT = 'twingraph.run_component'
+
+_apps = {}
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def fleet_key(broker, backend, concurrency, serialization_config={}, io_pool='threads', io_concurrency=None):
+    return hashlib.sha256(json.dumps([broker, backend, concurrency, serialization_config, io_pool, io_concurrency], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def fleet_node(key, host='@localhost', role='cpu'):
+    return 'twingraph-fleet-' + ('' if role == 'cpu' else role + '-') + key + host
+
+
+def fleet_app(broker, backend, serialization_config={}):
+    app_key = (broker, backend, json.dumps(
+        serialization_config, sort_keys=True))
+    if app_key not in _apps:
+        app = Celery('twingraph_fleet', backend=backend, broker=broker)
+        if serialization_config != {}:
+            from twingraph.serialization.serializers import register_kombu_serializer
+            serializer_name = register_kombu_serializer(serialization_config.get(
+                'format', 'json'), serialization_config.get('compression', None))
+            app.conf.update(task_serializer=serializer_name, result_serializer=serializer_name,
+                            accept_content=[serializer_name, 'json'])
+        app.task(name=RUN_COMPONENT, trail=True, base=ResultRefTask)(run_component)
+        _apps[app_key] = app
+    return _apps[app_key]
+
+
+def load_tasks_module(module_path, cwd=None):
+    with _modules_lock:
+        if module_path not in _modules:
+            # the modules of the pipeline directory are importable from the
+            # tasks, as on the workers started per run; added once per module
+            if cwd is not None and cwd not in sys.path:
+                sys.path.append(cwd)
+            module_name = 'twingraph_tasks_' + \
+                os.path.basename(os.path.dirname(module_path))
+            spec = importlib.util.spec_from_file_location(
+                module_name, module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            _modules[module_path] = module
+        return _modules[module_path]
+
+
+def run_component(module_path, name, args, kwargs, cwd=None, run_id=None):
+    # The prefork children run one task at a time each, so they change to
+    # the working directory of the pipeline; the I/O worker runs tasks of
+    # several pipelines on threads, which resolve relative paths against
+    # the directory of their task instead (see run_context.task_path)
+    set_task_dir(cwd)
+    if cwd is not None and threading.current_thread() is threading.main_thread():
+        os.chdir(cwd)
+    if run_id is not None:
+        set_run_id(run_id)
+    return getattr(load_tasks_module(module_path, cwd), name)(*args, **kwargs)
+
+
+class FleetTask:
+    # Stands in for a task of the generated tasks module in the pipeline
+    # (driver) module, with the calls sent to the generic fleet task
+    def __init__(self, app, module_path, name, queue, cwd=None, run_id=None):
+        self.app = app
+        self.module_path = module_path
+        self.name = name
+        self.queue = queue
+        self.cwd = cwd
+        self.run_id = run_id
+
+    def s(self, *args, **kwargs):
+        return self.app.signature(RUN_COMPONENT, args=[self.module_path, self.name, list(args), kwargs, self.cwd, self.run_id], queue=self.queue)
+
+    def delay(self, *args, **kwargs):
+        return self.s(*args, **kwargs).apply_async()
+
+
+def fleet_tasks(module_path, queue, names, broker, backend, serialization_config={}, io_names=()):
+    app = fleet_app(broker, backend, serialization_config)
+    return [FleetTask(app, module_path, name, queue + '.io' if name in io_names else queue, os.getcwd(), os.environ.get('TWINGRAPH_RUN_ID', None)) for name in names]
+
+
+def _running(app, node):
+    try:
+        return bool(app.control.ping(destination=[node], timeout=1.0))
+    except Exception:
+        return False
+
+
+def ensure_fleet(broker, backend, concurrency, host='@localhost', task_dir='/tmp', serialization_config={}, timeout=120, io_pool='threads', io_concurrency=None):
+    # Starts the workers of the fleet unless they are running already; the
+    # lock makes concurrent runs wait for one start
+    key = fleet_key(broker, backend, concurrency,
+                    serialization_config, io_pool, io_concurrency)
+    nodes = {role: fleet_node(key, host, role) for role in FLEET_ROLES}
+    app = fleet_app(broker, backend, serialization_config)
+    if all(_running(app, node) for node in nodes.values()):
+        return app, nodes
+
+    os.makedirs(task_dir, exist_ok=True)
+    log_path = os.path.join(task_dir, 'fleet_' + key + '.log')
+    with open(os.path.join(task_dir, 'fleet_' + key + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        for role, node in nodes.items():
+            if _running(app, node):
+                continue
+            config = {'broker': broker, 'backend': backend, 'node': node, 'serialization_config': serialization_config,
+                      'pool': io_pool if role == 'io' else 'prefork', 'concurrency': (io_concurrency or concurrency) if role == 'io' else concurrency}
+            with open(log_path, 'a') as log_file:
+                subprocess.Popen([sys.executable, '-m', 'twingraph.orchestration.celery_fleet'], cwd=task_dir, stdin=subprocess.DEVNULL, stdout=log_file,
+                                 stderr=subprocess.STDOUT, start_new_session=True, env=dict(os.environ, TWINGRAPH_FLEET_CONFIG=json.dumps(config)))
+            start_time = time.time()
+            while not _running(app, node):
+                if time.time() - start_time > timeout:
+                    raise Exception('The Celery worker fleet ' + node + ' did not start within ' +
+                                    str(timeout) + ' seconds, see ' + log_path)
+    return app, nodes
+
+
+def add_pipeline_queue(app, nodes, queue):
+    app.control.add_consumer(queue, destination=[nodes['cpu']], reply=True)
+    app.control.add_consumer(
+        queue + '.io', destination=[nodes['io']], reply=True)
+
+
+def stop_fleet(broker, backend, serialization_config={}):
+    # stops all fleets on the broker
+    app = fleet_app(broker, backend, serialization_config)
+    nodes = [node for reply in app.control.ping(timeout=1.0)
+             for node in reply if node.startswith('twingraph-fleet-')]
+    if nodes:
+        app.control.shutdown(destination=nodes)
+
+
+def main():
+    config = json.loads(os.environ['TWINGRAPH_FLEET_CONFIG'])
+    if config['pool'] in ('gevent', 'eventlet'):
+        from celery import maybe_patch_concurrency
+        maybe_patch_concurrency(['worker', '-P', config['pool']])
+    app = fleet_app(config['broker'], config['backend'],
+                    config['serialization_config'])
+    app.worker_main(['worker', '--loglevel=INFO', '--pool=' + config['pool'], '--concurrency=' + str(config['concurrency']),
+                     '-n', config['node'], '-Q', FLEET_QUEUE] + (['-Ofair'] if config['pool'] == 'prefork' else []))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Result references for the Celery driver. A component call in the
+# generated pipeline module is submitted right away; the results of other
+# components it uses as arguments (e.g. a['outputs']['sum'] or
+# parent_hash=[a['hash']]) are passed as references to the task id and
+# resolved by the worker once the task has finished - a task whose inputs
+# are not ready is retried with a growing countdown (up to a minute, for
+# about as long as a Batch job may take) instead of holding a worker slot.
+# The elements of Func.map(...) refer to their chunk task in the same way.
+# Values read in the driver itself are fetched once per task id, and the
+# driver waits for all submitted tasks at the end.
+
+import collections
+import threading
+
+from celery import Task
+from celery.result import AsyncResult
+
+REF_KEY = '__twingraph_result__'
+MAX_RETRY_COUNTDOWN = 60.0
+MAX_INPUT_RETRIES = 1000
+
+_values = {}
+_submitted = []
+
+
+class ResultNotReady(Exception):
+    pass
+
+
+class MapItem:
+    # an element of Func.map(...), the result of a chunk task at an index
+    def __init__(self, chunk_result, index, child_hash):
+        self.chunk_result = chunk_result
+        self.index = index
+        self.hash = child_hash
+
+
+def result_ref(result, *path):
+    # a reference to result[path[0]][path[1]]..., or the value itself when
+    # the result is already a value
+    if isinstance(result, MapItem):
+        if list(path[:1]) == ['hash']:
+            return result.hash
+        return {REF_KEY: result.chunk_result.id, 'path': [result.index] + list(path), 'hash': result.hash}
+    if isinstance(result, AsyncResult):
+        return {REF_KEY: result.id, 'path': list(path)}
+    for key in path:
+        result = result[key]
+    return result
+
+
+def result_value(result):
+    if isinstance(result, MapItem):
+        return result_value(result.chunk_result)[result.index]
+    if not isinstance(result, AsyncResult):
+        return result
+    if result.id not in _values:
+        _values[result.id] = result.get()
+    return _values[result.id]
+
+
+def submitted(result):
+    _submitted.append(result)
+    return result
+
+
+def _as_refs(value):
+    if isinstance(value, (AsyncResult, MapItem)):
+        return result_ref(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_as_refs(element) for element in value)
+    if isinstance(value, dict):
+        return {key: _as_refs(element) for key, element in value.items()}
+    return value
+
+
+def _hash_refs(value, hashes):
+    # the hashes of the results referenced in value, one per result
+    if isinstance(value, dict) and REF_KEY in value:
+        if 'hash' in value:
+            hashes[value['hash']] = value['hash']
+        else:
+            hashes[value[REF_KEY]] = {REF_KEY: value[REF_KEY], 'path': ['hash']}
+    elif isinstance(value, (list, tuple)):
+        for element in value:
+            _hash_refs(element, hashes)
+    elif isinstance(value, dict):
+        for element in value.values():
+            _hash_refs(element, hashes)
+    return hashes
+
+
+def _refs(args, kwargs, parent_hash):
+    # as with the result handles of the local path, the results passed to a
+    # component are added to its parent_hash so that the edges are recorded
+    if not isinstance(parent_hash, (list, tuple)):
+        parent_hash = [parent_hash]
+    parent_hash = [result_ref(parent, 'hash') if isinstance(
+        parent, (AsyncResult, MapItem)) else parent for parent in parent_hash]
+    args = _as_refs(list(args))
+    kwargs = _as_refs(kwargs)
+    parent_hash += [parent for parent in _hash_refs([args, kwargs], {}).values()
+                    if parent not in parent_hash]
+    return args, kwargs, parent_hash
+
+
+def celery_submit(celery_task, /, *args, **kwargs):
+    args, kwargs, parent_hash = _refs(
+        args, kwargs, kwargs.pop('parent_hash', []))
+    if parent_hash:
+        kwargs['parent_hash'] = parent_hash
+    return submitted(celery_task.delay(*args, **kwargs))
+
+
+def map_element_refs(element):
+    # an element (args, kwargs, parent_hash, child_hash) of Func.map(...),
+    # with the results in it passed as references to the chunk task
+    args, kwargs, parent_hash, child_hash = element
+    return list(_refs(args, kwargs, parent_hash)) + [child_hash]
+
+
+def wait_submitted():
+    for result in _submitted:
+        result_value(result)
+
+
+class ResolvedResults:
+    # the values of finished tasks on a worker, least recently used first
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.values = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, app, task_id):
+        with self.lock:
+            if task_id in self.values:
+                self.values.move_to_end(task_id)
+                return self.values[task_id]
+        result = AsyncResult(task_id, app=app)
+        if not result.ready():
+            raise ResultNotReady(task_id)
+        # raises the error of a failed task
+        value = result.get(disable_sync_subtasks=False)
+        with self.lock:
+            self.values[task_id] = value
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+        return value
+
+
+_resolved = ResolvedResults()
+
+
+def resolve_refs(value, app):
+    if isinstance(value, dict) and REF_KEY in value:
+        resolved = _resolved.get(app, value[REF_KEY])
+        for key in value['path']:
+            resolved = resolved[key]
+        return resolved
+    if isinstance(value, (list, tuple)):
+        return type(value)(resolve_refs(element, app) for element in value)
+    if isinstance(value, dict):
+        return {key: resolve_refs(element, app) for key, element in value.items()}
+    return value
+
+
+class ResultRefTask(Task):
+    max_retries = MAX_INPUT_RETRIES
+
+    def __call__(self, *args, **kwargs):
+        try:
+            args = resolve_refs(list(args), self.app)
+            kwargs = resolve_refs(kwargs, self.app)
+        except ResultNotReady as e:
+            # fails the task once the retries are used up
+            raise self.retry(countdown=min(0.05 * 2 ** self.request.retries, MAX_RETRY_COUNTDOWN), exc=Exception(
+                'The inputs of ' + self.name + ' were not ready after ' + str(self.max_retries) + ' retries, task ' + str(e) + ' did not finish'))
+        return super().__call__(*args, **kwargs)
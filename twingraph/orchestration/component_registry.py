@@ -0,0 +1,141 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Lambda functions and Batch job definitions are provisioned once per
+# pipeline run by whichever worker calls the component first. The pipeline
+# writes the components to provision (components_list_<kind>_<run id>.json)
+# next to the generated tasks, which are shared by the runs of the same
+# code; concurrent first calls block on one provisioning
+# operation - on a per-component file lock, or on a Redis SETNX claim and
+# pub/sub notification when the workers do not share a file system.
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+from twingraph.orchestration.run_context import current_run_id
+
+_registry_backend = {'url': None}
+_provisioned = set()
+_provisioned_lock = threading.Lock()
+
+
+def set_registry_backend(url):
+    _registry_backend['url'] = url
+
+
+def components_list_path(directory, kind, run_id=None):
+    if run_id is None:
+        run_id = current_run_id('')
+    return os.path.join(directory, 'components_list_' + kind + ('_' + run_id if run_id else '') + '.json')
+
+
+class FileComponentRegistry:
+    def __init__(self, path):
+        self.path = path
+
+    def _locked(self, lock_path):
+        lock_file = open(lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def pending(self):
+        try:
+            with open(self.path) as list_file:
+                return json.load(list_file)
+        except FileNotFoundError:
+            return []
+
+    def _write(self, component_names):
+        # replaced atomically, readers never see a partial list
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path))
+        with os.fdopen(file_descriptor, 'w') as tmp_file:
+            json.dump(component_names, tmp_file)
+        os.replace(tmp_path, self.path)
+
+    def write(self, component_names):
+        lock_file = self._locked(self.path + '.lock')
+        try:
+            self._write(component_names)
+        finally:
+            lock_file.close()
+
+    def _remove(self, name):
+        lock_file = self._locked(self.path + '.lock')
+        try:
+            self._write([component_name for component_name in self.pending()
+                        if component_name != name])
+        finally:
+            lock_file.close()
+
+    def ensure(self, name, create):
+        # the lock of a component is held while it is created, so that the
+        # other workers wait for it instead of creating it again
+        lock_file = self._locked(self.path + '.' + name + '.lock')
+        try:
+            if name in self.pending():
+                create()
+                self._remove(name)
+        finally:
+            lock_file.close()
+
+
+class RedisComponentRegistry:
+    def __init__(self, url, namespace):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.namespace = 'twingraph:components:' + namespace
+
+    def ensure(self, name, create, timeout=900):
+        key = self.namespace + ':' + name
+        channel = key + ':provisioned'
+        if self.client.get(key) == b'done':
+            return
+        if self.client.set(key, 'pending', nx=True, ex=timeout):
+            try:
+                create()
+            except Exception:
+                self.client.delete(key)
+                self.client.publish(channel, 'failed')
+                raise
+            self.client.set(key, 'done', ex=86400)
+            self.client.publish(channel, 'done')
+            return
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            # checked again after subscribing, the claim may have completed in between
+            state = self.client.get(key)
+            while state not in (b'done', None):
+                message = pubsub.get_message(timeout=timeout)
+                if message is None:
+                    raise Exception('Timed out waiting for ' +
+                                    name + ' to be provisioned')
+                state = self.client.get(key)
+        finally:
+            pubsub.close()
+        if state is None:
+            # the other worker failed, claim it again
+            self.ensure(name, create, timeout)
+
+
+def get_component_registry(path):
+    if _registry_backend['url'] is None:
+        return FileComponentRegistry(path)
+    # the generated tasks directory is reused across runs, the run id keeps
+    # the claims of each run apart
+    return RedisComponentRegistry(_registry_backend['url'], os.path.basename(os.path.dirname(os.path.abspath(path))) + ':' + current_run_id('') + ':' + os.path.basename(path))
+
+
+def ensure_component(path, name, create):
+    if (path, name) in _provisioned:
+        return
+    get_component_registry(path).ensure(name, create)
+    with _provisioned_lock:
+        _provisioned.add((path, name))
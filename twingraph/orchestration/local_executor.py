@@ -0,0 +1,239 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Celery-free parallel mode for @pipeline(executor='threads'|'processes').
+# Component calls return pending ComponentResult handles and are dispatched
+# to a concurrent.futures pool as soon as the handles they depend on resolve,
+# so independent branches of the pipeline run in parallel on one machine.
+
+import contextvars
+import heapq
+import importlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+active_executor = contextvars.ContextVar('active_executor', default=None)
+
+# Undecorated component functions, looked up by module and name inside the
+# worker processes (the module attribute is the decorated wrapper).
+component_functions = {}
+
+
+def register_component_function(func):
+    component_functions[(func.__module__, func.__qualname__)] = func
+
+
+def run_component_function(module_name, qualname, input_dict):
+    if (module_name, qualname) not in component_functions:
+        importlib.import_module(module_name)
+    func = component_functions.get((module_name, qualname), None)
+    if func is None and module_name == '__main__':
+        func = component_functions[('__mp_main__', qualname)]
+    return func(**input_dict)._asdict()
+
+
+class _Node:
+    def __init__(self, fn, dependencies, future, name):
+        self.fn = fn
+        self.dependencies = dependencies
+        self.future = future
+        self.name = name
+        self.context = contextvars.copy_context()
+        self.children = []
+        self.priority = 0.0
+        self.scheduled = False
+
+
+class _DeferredFuture(Future):
+    # Reading a pending deferred result dispatches everything recorded so far.
+    def __init__(self, executor):
+        Future.__init__(self)
+        self.executor = executor
+
+    def result(self, timeout=None):
+        if not self.done():
+            self.executor.flush()
+        return Future.result(self, timeout)
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self.executor.flush()
+        return Future.exception(self, timeout)
+
+
+def _pending_node(dependency):
+    return getattr(getattr(dependency, '_future', None), 'node', None)
+
+
+class LocalExecutor:
+    def __init__(self, executor='threads', max_workers=None, deferred=False, durations={}):
+        if executor not in ('threads', 'processes'):
+            raise Exception(
+                "The pipeline executor needs to be 'threads' or 'processes'!")
+        self.executor = executor
+        self.max_workers = max_workers
+        # Component bookkeeping (inputs, backend waits, graph writes) always
+        # runs on threads, local function bodies run on processes if requested.
+        self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=max_workers) if executor == 'processes' else None
+        self.lock = threading.Lock()
+        self.futures = []
+
+        # Deferred mode: calls are only recorded until a pending value is read
+        # or the pipeline body returns, then the recorded DAG is dispatched
+        # with the longest remaining path (estimated from the durations of
+        # previous runs, by component name) first.
+        self.deferred = deferred
+        self.durations = dict(durations)
+        self.samples = {name: 1 for name in durations}
+        self.nodes = []
+        self.ready = []
+        self.running = 0
+        self.sequence = 0
+        self.slots = self.thread_pool._max_workers
+
+    def submit(self, fn, dependencies=[], name=None):
+        future = _DeferredFuture(self) if self.deferred else Future()
+        node = _Node(fn, dependencies, future, name)
+        with self.lock:
+            self.futures.append(future)
+            if self.deferred:
+                future.node = node
+                for dependency in dependencies:
+                    parent = _pending_node(dependency)
+                    if parent is not None and not parent.scheduled:
+                        parent.children.append(node)
+                self.nodes.append(node)
+
+        if not self.deferred:
+            self._schedule(node)
+        return future
+
+    def flush(self):
+        with self.lock:
+            nodes, self.nodes = self.nodes, []
+            for node in nodes:
+                node.scheduled = True
+        if not nodes:
+            return
+
+        # Calls are recorded in program order, so the dependents of a node
+        # always come after it.
+        for node in reversed(nodes):
+            node.priority = self.duration(node.name) + \
+                max([child.priority for child in node.children], default=0.0)
+        # Every node that is ready now is queued before any is started, so
+        # that the first slots go to the longest paths, not to program order.
+        for node in nodes:
+            self._schedule(node, drain=False)
+        self._drain()
+
+    def duration(self, name):
+        if name in self.durations:
+            return self.durations[name]
+        if self.durations:
+            return sum(self.durations.values()) / len(self.durations)
+        return 1.0
+
+    def _schedule(self, node, drain=True):
+        pending = [
+            dependency for dependency in node.dependencies if not dependency.done()]
+        remaining = [len(pending)]
+
+        def on_dependency_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self._dispatch(node)
+
+        if not pending:
+            self._dispatch(node, drain)
+        for dependency in pending:
+            dependency.add_done_callback(on_dependency_done)
+
+    def _dispatch(self, node, drain=True):
+        for dependency in node.dependencies:
+            if dependency.exception() is not None:
+                node.future.set_exception(dependency.exception())
+                return
+
+        if not self.deferred:
+            inner_future = self.thread_pool.submit(node.context.run, node.fn)
+            inner_future.add_done_callback(
+                lambda done_future: _copy_future(done_future, node.future))
+            return
+
+        with self.lock:
+            self.sequence += 1
+            heapq.heappush(self.ready, (-node.priority, self.sequence, node))
+        if drain:
+            self._drain()
+
+    def _drain(self):
+        nodes = []
+        with self.lock:
+            while self.ready and self.running < self.slots:
+                nodes.append(heapq.heappop(self.ready)[2])
+                self.running += 1
+        for node in nodes:
+            self.thread_pool.submit(node.context.run, self._run_node, node)
+
+    def _run_node(self, node):
+        start_time = time.perf_counter()
+        try:
+            result, error = node.fn(), None
+        except BaseException as e:
+            result, error = None, e
+        elapsed = time.perf_counter() - start_time
+        with self.lock:
+            # running mean, counting the mean of previous runs as one sample
+            samples = self.samples.get(node.name, 0) + 1
+            mean = self.durations.get(node.name, elapsed)
+            self.durations[node.name] = mean + (elapsed - mean) / samples
+            self.samples[node.name] = samples
+            self.running -= 1
+
+        if error is None:
+            node.future.set_result(result)
+        else:
+            node.future.set_exception(error)
+        self._drain()
+
+    def run_function(self, func, input_dict):
+        if self.process_pool is None:
+            return func(**input_dict)._asdict()
+        return self.process_pool.submit(run_component_function, func.__module__, func.__qualname__, input_dict).result()
+
+    def wait(self):
+        self.flush()
+        # Futures can be added while waiting (e.g. components submitted by
+        # callbacks), loop until everything submitted so far has finished.
+        waited = 0
+        while True:
+            with self.lock:
+                futures = self.futures[waited:]
+            if not futures:
+                break
+            for future in futures:
+                future.exception()
+            waited += len(futures)
+        for future in self.futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
+
+
+def _copy_future(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -4,28 +4,68 @@
 ######################################################################
 
 import nest_asyncio
+import asyncio
+import contextvars
 import functools
 import inspect
+import threading
 
 from pathlib import Path
-from twingraph.graph.graph_tools import init_reset_graph, add_vertex_connection
-from twingraph.orchestration.orchestration_utils import remove_line_containing, set_gremlin_port_ip, set_randomize_time, run_aws_batch, batch_create_component, lambda_create_component, load_inputs, set_hash, set_AWS_ARN, line_no, run_kubernetes, run_lambda, run_docker_compose
-from twingraph.awsmodules.awslambda.lambd_functions import exponential_backoff, matching_parentheses
-
-from collections import namedtuple
+from twingraph.graph.graph_tools import init_reset_graph, add_vertex_connection, add_vertices, get_component_durations
+from twingraph.orchestration.orchestration_utils import set_gremlin_port_ip, set_randomize_time, run_aws_batch, run_aws_batch_array, run_kubernetes_indexed, batch_create_component, lambda_create_component, load_inputs, set_hash, set_AWS_ARN, line_no, run_kubernetes, run_lambda, run_docker_compose, collect_dependencies, map_elements, chunk_elements
+from twingraph.awsmodules.awslambda.lambd_functions import matching_parentheses
+from twingraph.orchestration.result_handles import ComponentResult, ItemFuture, resolve_handles, await_arguments
+from twingraph.awsmodules.clients import configure_clients
+from twingraph.orchestration.component_registry import FileComponentRegistry, components_list_path, ensure_component
+from twingraph.orchestration.local_executor import LocalExecutor, active_executor, register_component_function
+from twingraph.orchestration.celery_codegen import codegen_key, include_module_names, rewrite_include, rewrite_pipeline, cached_modules, remote_component_names
+
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import hashlib
 import datetime
 import time
-import random
 import os
 import json
 import ast
-import shutil
-import string
 import subprocess
 
+# Thread pool used by Func.aio(...) calls of the running async pipeline.
+async_executor = contextvars.ContextVar('async_executor', default=None)
+
+# Thread pool shared by the Func.map(...) calls made without an executor,
+# one per process; a map called from a chunk of another map runs inline,
+# so that the chunks never wait on the pool they occupy.
+_map_pools = {}
+_map_pools_lock = threading.Lock()
+_map_thread = threading.local()
+
+
+def get_map_pool():
+    with _map_pools_lock:
+        if os.getpid() not in _map_pools:
+            _map_pools[os.getpid()] = ThreadPoolExecutor(
+                thread_name_prefix='twingraph-map')
+        return _map_pools[os.getpid()]
+
 
-def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=False, celery_pipeline=False, celery_concurrency_threads=32, celery_include_files=[], celery_host="@localhost", celery_worker_name="tasks", celery_backend='redis://localhost:6379/0', celery_broker='redis://localhost:6379/1', celery_task_dir='/tmp', graph_config={}, clear_graph=True, multipipeline=False, f_py=None, redirect_logging=True):
+def run_map_chunk(chunk_fn):
+    _map_thread.active = True
+    try:
+        return chunk_fn()
+    finally:
+        _map_thread.active = False
+
+
+def run_inline(chunk_fn):
+    future = Future()
+    try:
+        future.set_result(chunk_fn())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=False, celery_pipeline=False, celery_concurrency_threads=32, celery_include_files=[], celery_host="@localhost", celery_worker_name="tasks", celery_backend='redis://localhost:6379/0', celery_broker='redis://localhost:6379/1', celery_task_dir='/tmp', graph_config={}, clear_graph=True, multipipeline=False, f_py=None, redirect_logging=True, celery_serialization_config={}, celery_registry_backend=None, celery_persistent_workers=False, celery_io_pool='threads', celery_io_concurrency=None, celery_cpu_concurrency=None, executor=None, max_workers=None, deferred=False):
     """ 
     ### The pipeline function is intended as a decorator to an orchestration specification function, which strings together different component within a pure python code. 
     
@@ -43,7 +83,7 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
         
     - celery_pipeline (bool, optional): *This flag sets whether the pipeline is executed directly or parsed into a Celery orchestration pipeline. Celery is the backend queueing, dispatch and orchestration engine; without Celery the tasks are simply run locally - hence, ensure that this flag is set to true for executing remotely.* Defaults to False.
     
-    - celery_concurrency_threads (int, optional): *When using a Celery pipeline, a set number of tasks can be concurrently executed - this can be tuned using this flag.* Defaults to 32.
+    - celery_concurrency_threads (int, optional): *When using a Celery pipeline, a set number of tasks can be concurrently executed - this can be tuned using this flag; it is the default concurrency of the I/O worker (see celery_io_pool).* Defaults to 32.
     
     - celery_include_files (list, optional): *When using Celery-based components, ensure that the files which contain any of these components are specified here in order to parse and extract information.* Defaults to [].
     
@@ -55,7 +95,7 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
         
     - celery_broker (str, optional): *This string specifies the backend message broker service URL, based on either Redis, RabbitMQ/PyAMQ, AWS SQS or a custom MQ - when using the default Redis ensure that redis-cli ping returns PONG.* Defaults to 'redis://localhost:6379/1'.
     
-    - celery_task_dir (str, optional): *When using Celery, this string determines where the tasks are executed and stored; if using the default tmp directory ensure that you have read/write access - otherwise change this directory to another local directory.* Defaults to '/tmp'.
+    - celery_task_dir (str, optional): *When using Celery, this string determines where the tasks are executed and stored; the generated task and pipeline modules are cached there by the hash of the include files and the Celery options, and reused by later runs. If using the default tmp directory ensure that you have read/write access - otherwise change this directory to another local directory.* Defaults to '/tmp'.
     
     - graph_config (dict, optional): *This dictionary includes a parameter called graph_endpoint, which needs to point to the URL endpoint of the graph, including the websocket protocol (ws, wss) and the port ID (usually 8182).* Defaults to {'graph_endpoint':'ws://localhost:8182'}.
         
@@ -66,6 +106,24 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
     - f_py (_type_, optional): *This in a method for feeding the function without using the pipeline as a decorator - at the moment not supported due to parsing limitations.* Defaults to None.
         
     - redirect_logging (bool, optional): *Ensure that this flag is set to on in order to get verbose information logs from Celery; however if using Ray or another library which also prints logs to the same directory, this needs to be set to False.* Defaults to True.
+    
+    - celery_serialization_config (dict, optional): *When using Celery, this dictionary selects the serializer used for task arguments and results exchanged through the broker and result backend, with the same 'format' and 'compression' keys as the component serialization_config, for example: {"format": "msgpack", "compression": "lz4"}.* Defaults to {} (Celery's default JSON serializer).
+    
+    - celery_registry_backend (str, optional): *When using Celery with AWS Batch or AWS Lambda, the Batch job definitions and Lambda functions are created once per pipeline run by the first worker calling the component, while concurrent first calls wait on it; by default this is coordinated with file locks in celery_task_dir, which needs to be on a file system shared by the workers. With a Redis URL, for example 'redis://localhost:6379/2', it is coordinated through Redis instead.* Defaults to None (file locks).
+    
+    - celery_persistent_workers (bool, optional): *When using Celery, the components run on a long-lived worker fleet instead of a worker started for each run (which stops the workers of earlier runs unless multipipeline is set); the fleet is started in the background by the first run, shared by all pipelines using the same broker, backend, serialization and concurrency, and loads the generated task modules of each pipeline on demand, with a queue per pipeline version, so later runs start on warm workers and concurrent pipelines do not stop each other's workers. Stop it with twingraph.orchestration.celery_fleet.stop_fleet(celery_broker, celery_backend).* Defaults to False.
+    
+    - celery_io_pool (str, optional): *When using Celery, the components on AWS Batch, AWS Lambda, Kubernetes or Docker (detected from the flags and docker_id given to the component decorator) only wait on their backend in the worker, and are routed to a separate queue ('<pipeline name>.io') served by a worker with this pool - 'threads', or 'gevent' / 'eventlet' when installed for many thousands of concurrent waits - while the local components run in a prefork worker on the '<pipeline name>' queue.* Defaults to 'threads'.
+    
+    - celery_io_concurrency (int, optional): *The number of concurrent tasks of the I/O worker.* Defaults to None (celery_concurrency_threads).
+    
+    - celery_cpu_concurrency (int, optional): *The number of processes of the prefork worker running the local components.* Defaults to None (the number of CPUs).
+    
+    - executor (str, optional): *This enables a local parallel mode without Celery - with 'threads' or 'processes', component calls return pending result handles and each component is dispatched to a local thread or process pool as soon as the result handles passed to it (or given as parent_hash) have resolved, so that independent branches run in parallel; the graph is recorded as usual. With 'processes', the bodies of local components run in worker processes and need picklable inputs and outputs, while Docker, Kubernetes, AWS Batch and AWS Lambda components are always waited on threads. Reading a value from a pending handle (e.g. a['outputs']) waits for that component.* Defaults to None (components run one after the other in program order).
+    
+    - max_workers (int, optional): *The number of workers of the executor pool, or when the pipeline is an async function (async def) using the asynchronous form of the components (await Func.aio(...)), the number of component calls whose backend waits (Docker, Kubernetes, AWS Batch, AWS Lambda) can overlap on the event loop.* Defaults to None (32 for async pipelines, the concurrent.futures default otherwise).
+    
+    - deferred (bool, optional): *This runs the pipeline body symbolically before dispatching anything - component calls are only recorded (on the 'threads' executor if no executor is given) until a value is read from a pending handle or the body returns, and the recorded DAG is then dispatched with the components on the longest remaining path first, using the mean 'Duration' of previous runs recorded in the graph. Components should be wired through result handles (e.g. Func_B(a.outputs.sum)) rather than a['outputs']['sum'], which waits for the component.* Defaults to False.
 
     ### Raises:
     
@@ -74,6 +132,8 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
     - Exception: If the number of Celery concurrency threads is too high that the local machine runs out of resources.
     
     - Exception: If the Celery host cannot be found or is not running.
+    
+    - Exception: If an async pipeline, a local executor or deferred mode is set for a Celery pipeline.
         
 
     ### Returns:
@@ -102,96 +162,168 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
             if celery_pipeline == False:
                 raise Exception("Lambda needs to be orchestrated with Celery!")
 
+        if celery_pipeline and inspect.iscoroutinefunction(func):
+            raise Exception(
+                "Async pipelines cannot be orchestrated with Celery!")
+
+        if celery_pipeline and (executor is not None or deferred):
+            raise Exception(
+                "Local executors and deferred pipelines cannot be combined with Celery!")
+
         if celery_pipeline:
-            if multipipeline == False:
+            if multipipeline == False and not celery_persistent_workers:
+                # the workers and drivers of earlier runs are started with
+                # their celerytasks/ directory as an argument, see below
                 try:
                     os.system("pkill -9 -f 'celerytasks'")
                 except:
                     pass
 
             celery_include_files.append(file_path)
+            include_files = list(dict.fromkeys(celery_include_files))
 
-            encoded_pipeline_hash = hashlib.md5(
-                str(datetime.datetime.now()).encode(), usedforsecurity=False)
+            # every run gets its own id, the generated modules are cached
+            run_id = hashlib.md5(
+                str(datetime.datetime.now()).encode(), usedforsecurity=False).hexdigest()
 
-            pipeline_dir = celery_task_dir + '/celerytasks/' + \
-                pipeline_name + str(encoded_pipeline_hash.hexdigest())
-            try:
-                shutil.rmtree(pipeline_dir)
+            io_concurrency = celery_io_concurrency or celery_concurrency_threads
+            cpu_concurrency = celery_cpu_concurrency or os.cpu_count() or 1
 
-            except:
-                pass
-            os.makedirs(pipeline_dir)
-            component_functions_names = []
-            data = "from celery import Celery, signals\napp = Celery('" + celery_worker_name + '_' + \
+            data = ''
+            if celery_io_pool in ('gevent', 'eventlet'):
+                # the I/O worker patches the standard library before anything is imported
+                data += "import sys\nif sys.argv[-1] == 'io':\n  from celery import maybe_patch_concurrency\n  maybe_patch_concurrency(['worker', '-P', '" + \
+                    celery_io_pool + "'])\n"
+
+            data += "from celery import Celery, signals\nfrom twingraph.orchestration.celery_refs import ResultRefTask\napp = Celery('" + celery_worker_name + '_' + \
                 pipeline_name + "', backend='" + celery_backend + \
                 "',  broker='" + celery_broker + "')\n"
 
-            for celery_include in celery_include_files:
-                with open(celery_include, 'r') as file:
-                    data += '\n'
-                    data_f = file.read().replace('\n@component', "\n@app.task(trail=True, queue='" +
-                                                 pipeline_name + "',routing_key='" + pipeline_name + celery_host + "')\n@component")
-                    data += '\n' + data_f
-                    node = ast.parse(data_f)
-                    component_functions_names_file = [
-                        n.name for n in node.body if isinstance(n, ast.FunctionDef)]
-                    component_functions_names += component_functions_names_file
-
-            data = data.replace(inspect.getsource(func), "").replace(
-                '\n' + str(func.__name__), "\n")
-            data = data.replace('\n()', '')
-
-            if redirect_logging:
-                data += "@signals.setup_logging.connect\ndef setup_celery_logging(**kwargs):\n  pass\n"
-
-            data += "if __name__ == '__main__':\n  app.worker_main(['worker','--loglevel=DEBUG','--concurrency=" + str(
-                celery_concurrency_threads) + "', '-n','" + pipeline_name + celery_host + "','-Q', '" + pipeline_name + "', '-Ofair'])"
+            data += "from twingraph.awsmodules.clients import configure_clients\nconfigure_clients(" + str(
+                io_concurrency) + ")\n"
 
-            for celery_include in celery_include_files:
-                data = remove_line_containing(
-                    data, celery_include.replace('.py', '').replace('/', '.'))
+            if celery_serialization_config != {}:
+                data += "from twingraph.serialization.serializers import register_kombu_serializer\nserializer_name = register_kombu_serializer('" + celery_serialization_config.get('format', 'json') + "', " + repr(celery_serialization_config.get('compression', None)) + \
+                    ")\napp.conf.update(task_serializer=serializer_name, result_serializer=serializer_name, accept_content=[serializer_name, 'json'])\n"
 
-            print(data, file=open(pipeline_dir +
-                  '/tasks_' + pipeline_name + '.py', 'w'))
+            if celery_registry_backend is not None:
+                data += "from twingraph.orchestration.component_registry import set_registry_backend\nset_registry_backend('" + \
+                    celery_registry_backend + "')\n"
 
-            component_functions_names.remove(pipeline_name)
-            component_names = list(set(component_functions_names))
+            # local components run on the '<name>' queue, the components
+            # which wait on a remote backend on the '<name>.io' queue
+            io_queue = pipeline_name + '.io'
+            task_decorator = "@app.task(trail=True, base=ResultRefTask, queue='" + pipeline_name + \
+                "',routing_key='" + pipeline_name + celery_host + "')"
+            io_task_decorator = "@app.task(trail=True, base=ResultRefTask, queue='" + io_queue + \
+                "',routing_key='" + io_queue + celery_host + "')"
 
-            if batch_pipeline:
-                json.dump(component_names, open(
-                    pipeline_dir + '/components_list_batch.json', 'w'))
-
-            if lambda_pipeline:
-                json.dump(component_names, open(pipeline_dir +
-                          '/components_list_lambda.json', 'w'))
+            # Func.map(...) runs its chunks through one generic task, submitted as a Celery group
+            footer = "\n@app.task(trail=True, base=ResultRefTask, queue='" + pipeline_name + "',routing_key='" + pipeline_name + celery_host + \
+                "')\ndef twingraph_map_chunk(component_name, elements):\n  return globals()[component_name].run.map_chunk(elements)\n"
+            footer += "\n@app.task(trail=True, base=ResultRefTask, queue='" + io_queue + "',routing_key='" + io_queue + celery_host + \
+                "')\ndef twingraph_map_chunk_io(component_name, elements):\n  return globals()[component_name].run.map_chunk(elements)\n"
 
-            pipeline_content = 'from tasks_' + pipeline_name + ' import ' + str(component_functions_names).replace("[", '').replace(
-                "]", '').replace("'", "") + '\n\n' + "\n".join((inspect.getsource(func)).split("\n")[1:]) + '\n' + str(func.__name__) + '()'
-
-            spec_characters = list(string.punctuation)
-            spec_characters.remove('_')
-            spec_characters.remove('-')
-            for f_name in component_functions_names:
-                pipeline_content = pipeline_content.replace(
-                    ' ' + f_name + '(', ' ' + f_name + '.delay(')
-                for spec_character in spec_characters:
-                    pipeline_content = pipeline_content.replace(
-                        spec_character + f_name + '(', spec_character + f_name + '.delay(')
+            if redirect_logging:
+                footer += "@signals.setup_logging.connect\ndef setup_celery_logging(**kwargs):\n  pass\n"
 
-            pipeline_content = pipeline_content.replace(
-                "['outputs']", ".get()['outputs']")
-            pipeline_content = pipeline_content.replace(
-                "['hash']", ".get()['hash']")
+            footer += "if __name__ == '__main__':\n  import sys\n  if sys.argv[-1] == 'io':\n    app.worker_main(['worker','--loglevel=DEBUG','--pool=" + celery_io_pool + "','--concurrency=" + str(
+                io_concurrency) + "', '-n','" + io_queue + celery_host + "','-Q', '" + io_queue + "'])\n"
+            footer += "  else:\n    app.worker_main(['worker','--loglevel=DEBUG','--concurrency=" + str(
+                cpu_concurrency) + "', '-n','" + pipeline_name + celery_host + "','-Q', '" + pipeline_name + "', '-Ofair'])\n"
 
-            print(pipeline_content, file=open(pipeline_dir +
-                  '/pipeline_' + pipeline_name + '.py', 'w'))
+            include_sources = []
+            for celery_include in include_files:
+                with open(celery_include, 'r') as file:
+                    include_sources.append((celery_include, file.read()))
+            include_modules = include_module_names(
+                include_files, str(path.parent.absolute()))
 
-            celery_task_proc = subprocess.Popen(
-                ['python', pipeline_dir + '/tasks_' + pipeline_name + '.py'], cwd=str(path.parent.absolute()), shell=False)
+            # The modules are generated once per hash of their inputs
+            codegen_hash = codegen_key(
+                pipeline_name, data, task_decorator, io_task_decorator, footer, sorted(include_modules), include_sources, celery_persistent_workers)
+            pipeline_dir = celery_task_dir + '/celerytasks/' + \
+                pipeline_name + '_' + codegen_hash[:32]
+            fleet_queue = 'twingraph.' + os.path.basename(pipeline_dir)
+
+            if not os.path.isdir(pipeline_dir):
+                component_names = []
+                io_component_names = []
+                component_functions_names = []
+                tasks_content = data
+                for celery_include, include_source in include_sources:
+                    include_content, include_components, include_functions = rewrite_include(
+                        include_source, task_decorator, [pipeline_name], include_modules, io_task_decorator)
+                    tasks_content += '\n\n' + include_content
+                    component_names += include_components
+                    io_component_names += remote_component_names(
+                        include_source)
+                    component_functions_names += include_functions
+                tasks_content += footer
+                component_names = list(dict.fromkeys(component_names))
+                component_functions_names = list(
+                    dict.fromkeys(component_functions_names))
+
+                pipeline_content = 'from twingraph.orchestration.orchestration_tools import celery_map\nfrom twingraph.orchestration.celery_refs import celery_submit, result_ref, result_value, wait_submitted\nfrom tasks_' + \
+                    pipeline_name + ' import twingraph_map_chunk, twingraph_map_chunk_io\n'
+                if component_functions_names:
+                    pipeline_content += 'from tasks_' + pipeline_name + ' import ' + \
+                        ', '.join(component_functions_names) + '\n'
+                if celery_persistent_workers:
+                    # the components are sent to the fleet instead
+                    fleet_names = component_names + \
+                        ['twingraph_map_chunk', 'twingraph_map_chunk_io']
+                    fleet_io_names = io_component_names + \
+                        ['twingraph_map_chunk_io']
+                    pipeline_content += 'from twingraph.orchestration.celery_fleet import fleet_tasks\n' + ', '.join(fleet_names) + ' = fleet_tasks(' + repr(pipeline_dir + '/tasks_' + pipeline_name + '.py') + ', ' + repr(
+                        fleet_queue) + ', ' + repr(fleet_names) + ', ' + repr(celery_broker) + ', ' + repr(celery_backend) + ', ' + repr(celery_serialization_config) + ', ' + repr(fleet_io_names) + ')\n'
+                pipeline_content += '\n' + rewrite_pipeline(dict(include_sources)[file_path], pipeline_name,
+                                                            component_names, io_component_names) + '\n' + pipeline_name + '()\nwait_submitted()\n'
+
+                cached_modules(pipeline_dir, {'tasks_' + pipeline_name + '.py': tasks_content,
+                                              'pipeline_' + pipeline_name + '.py': pipeline_content,
+                                              'components.json': json.dumps(component_names),
+                                              'io_components.json': json.dumps(io_component_names)})
+
+            with open(pipeline_dir + '/components.json') as components_file:
+                component_names = json.load(components_file)
+            with open(pipeline_dir + '/io_components.json') as components_file:
+                io_component_names = json.load(components_file)
+
+            # the workers label their Kubernetes jobs (and registry claims)
+            # with the run of the pipeline
+            run_id = os.environ.get('TWINGRAPH_RUN_ID', run_id)
+
+            # each run provisions its components from its own list
+            if batch_pipeline:
+                FileComponentRegistry(components_list_path(
+                    pipeline_dir, 'batch', run_id)).write(component_names)
 
-            celery_pipeline_proc = subprocess.Popen(
-                ['python', pipeline_dir + '/pipeline_' + pipeline_name + '.py'], cwd=str(path.parent.absolute()), shell=False)
+            if lambda_pipeline:
+                FileComponentRegistry(components_list_path(
+                    pipeline_dir, 'lambda', run_id)).write(component_names)
+
+            run_env = dict(os.environ, TWINGRAPH_RUN_ID=run_id,
+                           PYTHONPATH=os.pathsep.join([pipeline_dir] + [p for p in [os.environ.get('PYTHONPATH', '')] if p]))
+
+            if celery_persistent_workers:
+                from twingraph.orchestration.celery_fleet import ensure_fleet, add_pipeline_queue
+                fleet, fleet_nodes = ensure_fleet(celery_broker, celery_backend, cpu_concurrency, celery_host,
+                                                  celery_task_dir + '/celeryfleet', celery_serialization_config, io_pool=celery_io_pool, io_concurrency=io_concurrency)
+                add_pipeline_queue(fleet, fleet_nodes, fleet_queue)
+            else:
+                # started as modules so that the byte-compiled cache is used,
+                # the directory argument marks the processes for pkill; the
+                # prefork worker is only started for local components
+                worker_roles = ['io'] if io_component_names else []
+                if len(io_component_names) < len(component_names) or not component_names:
+                    worker_roles.append('cpu')
+                for worker_role in worker_roles:
+                    subprocess.Popen(['python', '-m', 'tasks_' + pipeline_name, pipeline_dir, worker_role],
+                                     cwd=str(path.parent.absolute()), shell=False, env=run_env)
+
+            subprocess.Popen(
+                ['python', '-m', 'pipeline_' + pipeline_name] + ([] if celery_persistent_workers else [pipeline_dir]), cwd=str(path.parent.absolute()), shell=False, env=run_env)
 
             def empty_fun():
                 if clear_graph:
@@ -199,6 +331,47 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
                     init_reset_graph(gremlin_ip_port)
                 pass
             return empty_fun
+        elif inspect.iscoroutinefunction(func):
+            async def run_async(*args, **kwargs):
+                with ThreadPoolExecutor(max_workers=max_workers or 32) as executor:
+                    async_executor.set(executor)
+                    return await func(*args, **kwargs)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if clear_graph:
+                    gremlin_ip_port = set_gremlin_port_ip(graph_config)
+                    init_reset_graph(gremlin_ip_port)
+                # nest_asyncio allows this to run inside an existing event
+                # loop as well (e.g. Jupyter notebooks)
+                retval = asyncio.run(run_async(*args, **kwargs))
+                return retval
+            return wrapper
+        elif executor is not None or deferred:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                gremlin_ip_port = set_gremlin_port_ip(graph_config)
+                durations = {}
+                if deferred:
+                    try:
+                        durations = get_component_durations(gremlin_ip_port)
+                    except:
+                        pass
+                if clear_graph:
+                    init_reset_graph(gremlin_ip_port)
+                local_executor = LocalExecutor(
+                    executor or 'threads', max_workers, deferred=deferred, durations=durations)
+                if max_workers:
+                    configure_clients(max_workers)
+                token = active_executor.set(local_executor)
+                try:
+                    retval = func(*args, **kwargs)
+                    local_executor.wait()
+                finally:
+                    active_executor.reset(token)
+                    local_executor.shutdown()
+                return retval
+            return wrapper
         else:
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
@@ -211,7 +384,7 @@ def pipeline(lambda_pipeline=False, batch_pipeline=False, kubernetes_pipeline=Fa
     return _decorator(f_py) if callable(f_py) else _decorator
 
 
-def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=None, docker_id='NotProvided', kube_config={}, batch_config={}, lambda_config={}, graph_config={}, additional_attributes={}, git_data=False, auto_infer=False):
+def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=None, docker_id='NotProvided', kube_config={}, batch_config={}, lambda_config={}, graph_config={}, additional_attributes={}, git_data=False, auto_infer=False, serialization_config={}, payload_store_config={}, runner_config={}, docker_config={}):
     """
     ### The component function is intended to be used as a decorator on top of Python functions which read basic json-pickleable data types (int, float, lists, strings) and return NamedTuples called 'outputs' converted into dictionaries containing 'hash' and 'outputs'. Using appropriate flag and configuration dictionary pairs, such as lambda_task+lambda_config, batch_task+batch_config or kubernetes_task+kube_config, the code will be stringified and run on the selected backend compute. Additionally, the graph backend used to record the task can be switched (i.e. Amazon Neptune or Apache TinkerGraph) 
 
@@ -227,11 +400,11 @@ def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=N
     
     - docker_id (str, optional): *This string specifies the ID of the docker image, and the function will be executed within the docker container launched from the image.* Defaults to 'NotProvided'.
     
-    - kube_config (dict, optional): *This dictionary includes information needed to execute Kubernetes tasks - information that can be passed include, for example: {"pull_policy": "Always","namespace": "default", "timeout":"360000"} .* Defaults to {"pull_policy": "Always","namespace": "default", "timeout":"360000"} - does not need to be specified explicitly with the kubernetes_task flag.
+    - kube_config (dict, optional): *This dictionary includes information needed to execute Kubernetes tasks - information that can be passed include, for example: {"pull_policy": "Always","namespace": "default", "timeout":"360000"}. Func.map(...) fan-outs of a Kubernetes component are submitted as one Indexed Job (up to 10000 elements per chunk with a payload_store_config, 100 without, with at most "parallelism" pods running at once), each pod picking its inputs by JOB_COMPLETION_INDEX and recorded as its own vertex. Finished jobs are deleted after "ttl_seconds_after_finished" (3600 by default) and labelled with the run that created them ("run_id", by default the TWINGRAPH_RUN_ID environment variable, which the Celery workers of a pipeline inherit), so that twingraph.kubernetes.k8s_class.delete_run_jobs(run_id, namespace) can remove all jobs of a run at once.* Defaults to {"pull_policy": "Always","namespace": "default", "timeout":"360000"} - does not need to be specified explicitly with the kubernetes_task flag.
     
-    - batch_config (dict, optional): *This dictionary includes information needed to execute AWS Batch tasks - information that can be passed include, for example: {"region_name": "<AWS-REGION-ID>", "jobQueue": "twingraph-run-queue","logGroupName": "/aws/batch/job","vCPU": 1,"Mem": 2048} .* Defaults to {} - needs to be specified explicitly with the batch_task flag.
+    - batch_config (dict, optional): *This dictionary includes information needed to execute AWS Batch tasks - information that can be passed include, for example: {"region_name": "<AWS-REGION-ID>", "jobQueue": "twingraph-run-queue","logGroupName": "/aws/batch/job","vCPU": 1,"Mem": 2048}. Func.map(...) fan-outs of a Batch component are submitted as one Batch array job (up to 10000 elements per chunk with a payload_store_config, 100 without), each child picking its inputs by AWS_BATCH_JOB_ARRAY_INDEX and recorded as its own vertex. "endpoint_url" and "logs_endpoint_url" point the Batch and CloudWatch Logs calls at another endpoint, e.g. a local stand-in for testing. A job that does not finish within "timeout" seconds (54000 by default) fails the component, as does a job that DescribeJobs still does not return "not_found_timeout" seconds after it was submitted (300 by default).* Defaults to {} - needs to be specified explicitly with the batch_task flag.
     
-    - lambda_config (dict, optional): *This dictionary includes information needed to execute AWS Lambda tasks - information that can be passed include, for example: {"iam_role": "arn:aws:iam::<AWS-ACCOUNT-ID>:role/<AWS-LAMBDA-ROLE-ID>", "architecture": "x86_64","storage_size": 512, "region_name": "<AWS-REGION-ID>", "timeout": 900}.* Defaults to {} - needs to be specified explicitly with the lambda_task flag.
+    - lambda_config (dict, optional): *This dictionary includes information needed to execute AWS Lambda tasks - information that can be passed include, for example: {"iam_role": "arn:aws:iam::<AWS-ACCOUNT-ID>:role/<AWS-LAMBDA-ROLE-ID>", "architecture": "x86_64","storage_size": 512, "region_name": "<AWS-REGION-ID>", "timeout": 900}. The Lambda handler runs the task with the TwinGraph runner (sent with each invocation, or read from the payload store when there is one, unless "runner_installed" is set to True) and returns the serialized outputs in its response. With "invocation_type" set to "Event", the function is invoked asynchronously and posts its outputs to the payload store (payload_store_config, e.g. on S3), where the driver awaits them - suited to large fan-outs.* Defaults to {} - needs to be specified explicitly with the lambda_task flag.
     
     - graph_config (dict, optional): *This dictionary includes a parameter called graph_endpoint, which needs to point to the URL endpoint of the graph, including the websocket protocol (ws, wss) and the port ID (usually 8182).* Defaults to {'graph_endpoint':'ws://localhost:8182'}.
     
@@ -240,6 +413,14 @@ def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=N
     - git_data (bool, optional): *This flag allows the user to automatically record git data about the function (author, timestamp changelog) to the graph database.* Defaults to False.
     
     - auto_infer (bool, optional): *This is an experimental flag which allows the user to automatically infer the task chain and interdependencies, but it does not work with Celery due to stack visibility issues for security reasons.* Defaults to False.
+    
+    - serialization_config (dict, optional): *This dictionary selects how the inputs are serialized when crossing a process or container boundary (Docker, Kubernetes, AWS Batch or AWS Lambda) - 'format' is one of 'json', 'msgpack', 'pickle' (protocol 5 with out-of-band buffers) or 'npy' (arrays), and 'compression' is optionally one of 'zlib', 'zstd' or 'lz4', for example: {"format": "pickle", "compression": "zstd"}. Byte counts and encoding times are recorded on the graph. Formats other than 'json' require the corresponding packages (msgpack, numpy, zstandard, lz4) inside the container image.* Defaults to {} (JSON without compression).
+    
+    - payload_store_config (dict, optional): *This dictionary enables passing large inputs by reference - serialized inputs larger than 'threshold_bytes' are written once to a content-addressed object store at 'uri' and only the object URI is sent to the backend, which resolves it before running the function. The 'uri' can be a local directory or shared volume (file:///mnt/shared/twingraph, mounted into Docker containers automatically, and into Kubernetes pods from the host path or from the persistent volume claim named by the 'payload_volume_claim' key of kube_config) or an S3 bucket (s3://bucket/prefix, required for AWS Batch and AWS Lambda), with an optional 'endpoint_url' for S3 compatible stores such as MinIO, for example: {"uri": "s3://my-bucket/twingraph", "threshold_bytes": 262144}. AWS Batch tasks are kept within the 30 KiB request limit by storing their inputs above 15 KiB; a task that does not fit without a store fails before it is submitted.* Defaults to {} (inputs are always sent inline).
+    
+    - runner_config (dict, optional): *This dictionary configures the twingraph.runner entrypoint which executes Docker, Kubernetes and AWS Batch components from a compact task envelope - set 'installed' to True when TwinGraph is installed in the component image (started with python -m twingraph.runner), otherwise the runner is shipped as a compressed bootstrap on the command line, or written once to the payload store (payload_store_config) and read from it by a short loader; 'python' sets the interpreter, for example: {"installed": True, "python": "python3"}.* Defaults to {} (bootstrapped runner with the 'python' interpreter).
+    
+    - docker_config (dict, optional): *This dictionary configures the Docker backend - by default each call runs in a new container. With 'warm_pool' set to True the runner is started with exec in warm containers instead, which are kept per image (and payload volume) for later calls; the pool of a process grows up to 'max_containers' containers (the number of CPUs by default), the least recently used idle container is replaced when the pool is full, and idle containers are removed after 'max_idle_seconds' and when the process exits. The component declares its needs with 'cpus' and 'memory' (bytes or a Docker style string such as '2g'), applied as container limits; with 'admission' set to True, all processes on the host (e.g. the Celery workers) share one reservation ledger, so a call only starts while enough CPUs (1 if 'cpus' is not given) and memory are free and runs pinned to its reserved CPUs, for example: {"warm_pool": True, "admission": True, "cpus": 2, "memory": "4g", "max_containers": 8, "max_idle_seconds": 60}.* Defaults to {} (a new container per call, without limits or admission).
 
     ### Raises:
     
@@ -250,110 +431,42 @@ def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=N
     - Exception: If the configuration does not match the task description e.g. Batch with non-Batch config, etc.
     
     - Exception: If autoinfer is used with Celery.
+    
+    ### Asynchronous form:
+    
+    - Func.aio(*args, **kwargs): *Every component can be awaited inside an async pipeline (await Func.aio(...)); the backend call runs on the pipeline thread pool so that independent branches (e.g. asyncio.gather over many Docker or Lambda calls) overlap their waits on a single event loop. Arguments can be pending asyncio tasks of other component calls, which are awaited first. auto_infer is not supported with the asynchronous form.*
+    
+    ### Bulk form:
+    
+    - Func.map(iterable_of_kwargs, chunk_size=None, ordered=True, parent_hash=[]): *Runs the component once per element of the iterable - a dictionary of keyword arguments or a tuple of positional arguments, which can hold result handles and its own 'parent_hash' - as one operation. The elements are split into chunks of chunk_size (by default at most 32 chunks) which run on a local thread pool, on the pipeline executor, or as one Celery group in a Celery pipeline, and the graph vertices of each chunk are written over one connection. Returns the list of results in the order of the elements, or with ordered=False an iterator over the results as their chunks finish.*
         
 
     ### Returns:
     
-    - Dict (from NamedTuple function definition): The components need to be specified with a NamedTuple return in the function definition, but TwinGraph converts the outputs into a Python dictionary with two components - 'hash' which includes a string indicating component hash as it was run, and 'outputs' which contains all the return values contained within the NamedTuple used in the function definition.  
+    - Dict (from NamedTuple function definition): The components need to be specified with a NamedTuple return in the function definition, but TwinGraph converts the outputs into a Python dictionary with two components - 'hash' which includes a string indicating component hash as it was run, and 'outputs' which contains all the return values contained within the NamedTuple used in the function definition. The dictionary is a ComponentResult handle - when the handle itself or one of its output fields (e.g. result.outputs.output_1) is passed as an argument to another component, the dependency is recorded on the graph automatically without specifying parent_hash.  
     """
     
     assert callable(f_py) or f_py is None
 
     def _decorator(func):
         file_path = inspect.stack()[1].filename
+        register_component_function(func)
 
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            try:
-                parent_hash = kwargs.pop('parent_hash')
-            except:
-                parent_hash = []
-
-            if type(parent_hash) == str:
-                parent_hash = [parent_hash]
-
-            if auto_infer:
-                dict_of_frame = inspect.stack(context=4)[1].frame.f_locals
-                context_str = (
-                    ''.join((inspect.stack(context=20)[1].code_context)[2:]).strip())
-
-                node_fcall = ast.parse(context_str[context_str.find(func.__name__):(matching_parentheses(context_str)[
-                                       context_str.find(func.__name__) + len(func.__name__)]) + 1].replace('\n', '').strip().replace(' ', ''))
-
-                depend_funcs = (list(set([(node_f) for node_f in ast.walk(node_fcall) if isinstance(
-                    node_f, ast.Name) or isinstance(node_f, ast.Subscript)])))
-                depend_funcs_list = [ast.unparse(
-                    (depend_funcs_k)) for depend_funcs_k in depend_funcs]
-                locals().update(dict_of_frame)
-
-                for var in depend_funcs_list:
-                    try:
-                        parent_hash.append(eval(var + "['hash']"))
-                    except Exception as e:
-                        print(e)
-                        pass
-
-            parent_hash = list(set(parent_hash))
-
-            set_randomize_time()
+        def prepare(args, kwargs, parent_hash, child_hash):
+            args, kwargs = resolve_handles(args, kwargs)
 
             component_name = str(func.__name__)
 
             if batch_task:
-                create_component = False
-                try_id=0
-                max_retries=5
-                while create_component == False and try_id<max_retries:
-                    time.sleep(exponential_backoff(base_delay=1.2,exponent=1.5,try_id=try_id))
-                    component_names = json.load(
-                        open(os.path.dirname(file_path) + '/components_list_batch.json'))
-                    if (component_name in component_names):
-                        try:
-                            print('Creating Batch component', component_name, component_names,
-                                file=open(os.path.dirname(file_path) + '/log_' + str(datetime.datetime.now()) + '.txt', 'w'))
-                            batch_create_component(
-                                docker_id, component_name, batch_config)
-                            component_names.remove(component_name)
-                            json.dump(component_names, open(os.path.dirname(
-                                file_path) + '/components_list_batch.json', 'w'))
-                            create_component = True
-                        except Exception as e:
-                            #print('Try '+str(1)+' error:',e)
-                            pass
-                    else:
-                        create_component = True
-                    try_id+=1
+                ensure_component(components_list_path(os.path.dirname(file_path), 'batch'), component_name,
+                                 functools.partial(batch_create_component, docker_id, component_name, batch_config))
 
             if lambda_task:
-                create_component = False
-                try_id=0
-                max_retries=5
-                while create_component == False and try_id<max_retries:  
-                    time.sleep(exponential_backoff(base_delay=1.5,exponent=1.2,try_id=try_id))
-                    component_names = json.load(open(os.path.dirname(
-                        file_path) + '/components_list_lambda.json'))
-                    if (component_name in component_names):
-                        try:
-                            print('Creating Lambda component', component_name, component_names,
-                                file=open(os.path.dirname(file_path) + '/log_' + str(datetime.datetime.now()) + '.txt', 'w'))
-                            lambda_create_component(
-                                docker_id, component_name, lambda_config)
-                            component_names.remove(component_name)
-                            json.dump(component_names, open(os.path.dirname(
-                                file_path) + '/components_list_lambda.json', 'w'))
-                            create_component = True
-                        except:
-                            pass
-                    else:
-                        create_component = True
-                    try_id+=1
+                ensure_component(components_list_path(os.path.dirname(file_path), 'lambda'), component_name,
+                                 functools.partial(lambda_create_component, docker_id, component_name, lambda_config))
 
             input_vals, input_dict = load_inputs(
-                args=args, kwargs=kwargs, argspec=inspect.getfullargspec(func))
-
-            child_hash = set_hash(parent_hash=parent_hash)
-
-            gremlin_ip_port = set_gremlin_port_ip(graph_config)
+                args=args, kwargs=kwargs, argspec=inspect.getfullargspec(func), json_compatible=serialization_config.get('format', 'json') == 'json')
 
             AWS_ARN = set_AWS_ARN()
 
@@ -400,38 +513,208 @@ def component(lambda_task=False, batch_task=False, kubernetes_task=False, f_py=N
                 git_attributes = {'Git History': relevant_blame}
                 attributes.update(git_attributes)
 
-            poutput = namedtuple('wrap_output', ['outputs', 'hash'])
+            return input_dict, attributes
+
+        def run(args, kwargs, parent_hash, child_hash):
+            input_dict, attributes = prepare(
+                args, kwargs, parent_hash, child_hash)
 
+            start_time = time.time()
             try:
                 if docker_id == 'NotProvided':
-                    ioutputs = func(**input_dict)._asdict()
+                    local_executor = active_executor.get()
+                    if local_executor is None:
+                        ioutputs = func(**input_dict)._asdict()
+                    else:
+                        ioutputs = local_executor.run_function(
+                            func, input_dict)
                     attributes.update({'Compute Platform': 'Local without Containers'})
                 elif kubernetes_task:
                     ioutputs = run_kubernetes(docker_id=docker_id, input_dict=input_dict,
-                                              attributes=attributes, kube_config=kube_config)._asdict()
+                                              attributes=attributes, kube_config=kube_config, serialization_config=serialization_config, payload_store_config=payload_store_config, runner_config=runner_config)._asdict()
                     attributes.update({'Compute Platform': 'Kubernetes'})
                 elif batch_task:
                     ioutputs = run_aws_batch(
-                        input_dict=input_dict, attributes=attributes, batch_config=batch_config)._asdict()
+                        input_dict=input_dict, attributes=attributes, batch_config=batch_config, serialization_config=serialization_config, payload_store_config=payload_store_config, runner_config=runner_config)._asdict()
                     attributes.update({'Compute Platform': 'AWS Batch'})
                 elif lambda_task:
                     ioutputs = run_lambda(
-                        input_dict=input_dict, attributes=attributes, lambda_config=lambda_config)._asdict()
+                        input_dict=input_dict, attributes=attributes, lambda_config=lambda_config, serialization_config=serialization_config, payload_store_config=payload_store_config)._asdict()
                     attributes.update({'Compute Platform': 'AWS Lambda'})
                 else:
                     ioutputs = run_docker_compose(
-                        docker_id=docker_id, input_dict=input_dict, attributes=attributes)._asdict()
+                        docker_id=docker_id, input_dict=input_dict, attributes=attributes, serialization_config=serialization_config, payload_store_config=payload_store_config, runner_config=runner_config, docker_config=docker_config)._asdict()
                     attributes.update({'Compute Platform': 'Docker'})
             except:
                 print('Inputs', input_dict)
                 print('Attributes', attributes)
                 raise Exception('Error with running function.')
 
-            attributes.update({'Output': str(ioutputs)})
+            attributes.update({'Output': str(ioutputs), 'Duration': time.time() - start_time})
+            return ioutputs, attributes
+
+        def execute(args, kwargs, parent_hash, child_hash):
+            ioutputs, attributes = run(args, kwargs, parent_hash, child_hash)
             add_vertex_connection(
-                gremlin_IP=gremlin_ip_port, attributes=attributes)
+                gremlin_IP=set_gremlin_port_ip(graph_config), attributes=attributes)
 
-            return poutput(ioutputs, child_hash)._asdict()
+            return ioutputs
 
+        def run_array(elements):
+            # one AWS Batch array job or Kubernetes Indexed Job for the whole chunk
+            prepared = [prepare(args, kwargs, parent_hash, child_hash)
+                        for args, kwargs, parent_hash, child_hash in elements]
+            input_dicts = [input_dict for input_dict, _ in prepared]
+            attributes_list = [attributes for _, attributes in prepared]
+            start_time = time.time()
+            try:
+                if kubernetes_task:
+                    compute_platform = 'Kubernetes'
+                    ioutputs_list = run_kubernetes_indexed(docker_id=docker_id, input_dicts=input_dicts, attributes_list=attributes_list, kube_config=kube_config,
+                                                           serialization_config=serialization_config, payload_store_config=payload_store_config, runner_config=runner_config)
+                else:
+                    compute_platform = 'AWS Batch'
+                    ioutputs_list = run_aws_batch_array(input_dicts=input_dicts, attributes_list=attributes_list, batch_config=batch_config,
+                                                        serialization_config=serialization_config, payload_store_config=payload_store_config, runner_config=runner_config)
+                ioutputs_list = [ioutputs._asdict()
+                                 for ioutputs in ioutputs_list]
+            except:
+                print('Attributes', attributes_list)
+                raise Exception('Error with running function.')
+
+            for ioutputs, attributes in zip(ioutputs_list, attributes_list):
+                attributes.update({'Compute Platform': compute_platform, 'Output': str(
+                    ioutputs), 'Duration': time.time() - start_time})
+            return [(ioutputs, attributes) for ioutputs, (_, attributes) in zip(ioutputs_list, prepared)]
+
+        def run_chunk(elements):
+            if (batch_task or kubernetes_task) and len(elements) > 1:
+                results = run_array(elements)
+            else:
+                results = [run(args, kwargs, parent_hash, child_hash)
+                           for args, kwargs, parent_hash, child_hash in elements]
+            add_vertices(gremlin_IP=set_gremlin_port_ip(graph_config), attributes_list=[
+                         attributes for _, attributes in results])
+            return [ioutputs for ioutputs, _ in results]
+
+        def map_chunk(elements):
+            return [{'outputs': ioutputs, 'hash': element[3]} for ioutputs, element in zip(run_chunk(elements), elements)]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent_hash, dependencies = collect_dependencies(args, kwargs)
+
+            if auto_infer:
+                dict_of_frame = inspect.stack(context=4)[1].frame.f_locals
+                context_str = (
+                    ''.join((inspect.stack(context=20)[1].code_context)[2:]).strip())
+
+                node_fcall = ast.parse(context_str[context_str.find(func.__name__):(matching_parentheses(context_str)[
+                                       context_str.find(func.__name__) + len(func.__name__)]) + 1].replace('\n', '').strip().replace(' ', ''))
+
+                depend_funcs = (list(set([(node_f) for node_f in ast.walk(node_fcall) if isinstance(
+                    node_f, ast.Name) or isinstance(node_f, ast.Subscript)])))
+                depend_funcs_list = [ast.unparse(
+                    (depend_funcs_k)) for depend_funcs_k in depend_funcs]
+                locals().update(dict_of_frame)
+
+                for var in depend_funcs_list:
+                    try:
+                        parent_hash.append(eval(var + "['hash']"))
+                    except Exception as e:
+                        print(e)
+                        pass
+
+            parent_hash = list(set(parent_hash))
+
+            set_randomize_time()
+
+            child_hash = set_hash(parent_hash=parent_hash)
+
+            local_executor = active_executor.get()
+            if local_executor is not None:
+                return ComponentResult(child_hash, future=local_executor.submit(functools.partial(execute, args, kwargs, parent_hash, child_hash), dependencies, str(func.__name__)))
+
+            return ComponentResult(child_hash, outputs=execute(args, kwargs, parent_hash, child_hash))
+
+        def map_inputs(iterable_of_kwargs, chunk_size=None, ordered=True, parent_hash=[]):
+            elements, dependencies = map_elements(
+                iterable_of_kwargs, parent_hash)
+            if (batch_task or kubernetes_task) and chunk_size is None:
+                # AWS Batch array jobs take up to 10000 children, Indexed
+                # Jobs are kept to the same size; without a payload store the
+                # inputs are sent inline, within the request size limits
+                chunk_size = 10000 if payload_store_config != {} else 100
+
+            local_executor = active_executor.get()
+            futures = []
+            handles = []
+            for chunk in chunk_elements(list(zip(elements, dependencies)), chunk_size):
+                chunk_fn = functools.partial(
+                    run_chunk, [element for element, _ in chunk])
+                if local_executor is not None:
+                    future = local_executor.submit(chunk_fn, [
+                        dependency for _, element_dependencies in chunk for dependency in element_dependencies], str(func.__name__))
+                elif getattr(_map_thread, 'active', False):
+                    future = run_inline(chunk_fn)
+                else:
+                    future = get_map_pool().submit(run_map_chunk, chunk_fn)
+                futures.append(future)
+                handles.append([ComponentResult(element[3], future=ItemFuture(future, index))
+                                for index, (element, _) in enumerate(chunk)])
+
+            if local_executor is None and ordered:
+                for future in futures:
+                    future.result()
+
+            if ordered:
+                return [handle for chunk_handles in handles for handle in chunk_handles]
+
+            future_indices = {future: index for index,
+                              future in enumerate(futures)}
+
+            def as_completed_handles():
+                if local_executor is not None:
+                    local_executor.flush()
+                for future in as_completed(futures):
+                    yield from handles[future_indices[future]]
+            return as_completed_handles()
+
+        async def aio(*args, **kwargs):
+            args, kwargs = await await_arguments(args, kwargs)
+            return await asyncio.get_running_loop().run_in_executor(async_executor.get(), functools.partial(wrapper, *args, **kwargs))
+
+        wrapper.aio = aio
+        wrapper.map = map_inputs
+        wrapper.map_chunk = map_chunk
         return wrapper
     return _decorator(f_py) if callable(f_py) else _decorator
+
+
+def celery_map(chunk_task, component_name, iterable_of_kwargs, chunk_size=None, ordered=True, parent_hash=[]):
+    # Func.map(...) inside a Celery pipeline - the chunks are sent as one
+    # group; in order, the elements are returned right away as references
+    # to their chunk task (see celery_refs)
+    from celery import group
+    from twingraph.orchestration.celery_refs import MapItem, map_element_refs, submitted
+
+    elements, _ = map_elements(iterable_of_kwargs, parent_hash)
+    chunks = chunk_elements([map_element_refs(element)
+                            for element in elements], chunk_size)
+    group_result = group(chunk_task.s(component_name, chunk)
+                         for chunk in chunks).apply_async()
+    for chunk_result in group_result.results:
+        submitted(chunk_result)
+
+    if ordered:
+        return [MapItem(chunk_result, index, element[3]) for chunk_result, chunk in zip(group_result.results, chunks) for index, element in enumerate(chunk)]
+
+    def as_completed_results():
+        if group_result.supports_native_join:
+            completed = (meta['result'] for _, meta in group_result.iter_native())
+        else:
+            completed = (async_result.get() for async_result in group_result.results)
+        for chunk_results in completed:
+            for chunk_result in chunk_results:
+                yield ComponentResult(chunk_result['hash'], outputs=chunk_result['outputs'])
+    return as_completed_results()
@@ -5,6 +5,8 @@
 
 import hashlib
 import datetime
+import base64
+import zlib
 
 import time
 import random
@@ -14,14 +16,23 @@ import json
 import ast
 from collections import namedtuple
 
-from twingraph.docker.docker_utils import get_client
+from twingraph.docker.docker_utils import get_client, create_file_archive, read_file_from_container
+from twingraph.docker.container_pool import get_container_pool
+from twingraph.docker.host_resources import get_host_resources, parse_memory
 from twingraph.awsmodules.batch import setup_batch_objects, submit_batch_job
 from twingraph.awsmodules.awslambda import lambd_functions
-from twingraph.kubernetes.k8s_class import create_container, create_pod_template, create_job
+from twingraph.kubernetes.k8s_class import create_namespace, create_container, create_pod_template, create_job, create_payload_volume, get_termination_message, get_job_logs, get_indexed_pods, get_pod_termination_message, get_pod_logs, run_labels, batch_api
+from twingraph.kubernetes.job_informer import get_job_informer, job_state
+from twingraph.serialization import serializers
+from twingraph.storage import object_store
+from twingraph import runner
+from twingraph.orchestration.result_handles import is_handle, find_handles, handle_hashes
+from twingraph.orchestration.run_context import task_path
 from kubernetes import client as kube_client
 
-import subprocess
+import concurrent.futures
 import re
+from urllib.parse import urlparse
 import pandas as pd
 
 
@@ -31,21 +42,129 @@ def replace_full_words(text, dic):
     return text
 
 
-def create_python_input_str(input_dict, attributes):
-    input_str = ''
-    for key, val in input_dict.items():
-        if type(val) == str:
-            input_str += key + "=¿" + str(val) + "¿,"
-        else:
-            input_str += key + "=" + str(val) + ","
+def store_uri(payload_store_config):
+    # a relative local store is resolved against the directory of the task
+    parsed_uri = urlparse(payload_store_config['uri'])
+    if parsed_uri.scheme in ('', 'file') and not os.path.isabs(parsed_uri.netloc + parsed_uri.path):
+        return 'file://' + task_path(parsed_uri.netloc + parsed_uri.path)
+    return payload_store_config['uri']
+
+
+def get_payload_store(payload_store_config):
+    return object_store.get_object_store(store_uri(payload_store_config), payload_store_config.get(
+        'endpoint_url', None), payload_store_config.get('region_name', None))
+
+
+# SubmitJob requests to AWS Batch are limited to 30 KiB; Kubernetes objects
+# to about 1.5 MiB, some of which is kept for the rest of the job spec;
+# Lambda payloads to 6 MiB, or 256 KiB for asynchronous (Event) invocations
+BATCH_REQUEST_LIMIT = 30 * 1024
+KUBERNETES_OBJECT_LIMIT = 1024 * 1024
+LAMBDA_REQUEST_LIMIT = 6 * 1024 * 1024
+LAMBDA_EVENT_LIMIT = 256 * 1024
+
+
+def store_payload(payload, attributes, payload_store_config, max_inline_bytes=None):
+    threshold_bytes = payload_store_config.get('threshold_bytes', 262144)
+    if max_inline_bytes is not None:
+        threshold_bytes = min(threshold_bytes, max_inline_bytes)
+    if payload_store_config == {} or len(payload) < threshold_bytes:
+        return None
+    payload_uri = get_payload_store(payload_store_config).put(payload)
+    attributes.update({'Input URI': payload_uri})
+    return payload_uri
+
+
+def store_key(payload_store_config):
+    # the objects stored once per process are kept per store, as components
+    # (and pipelines) may use different stores
+    return json.dumps(dict(payload_store_config, uri=store_uri(payload_store_config)), sort_keys=True)
+
+
+_stored_code_uris = {}
+
+
+def store_code(source, payload_store_config):
+    code_hash = runner.source_hash(source)
+    code_key = (store_key(payload_store_config), code_hash)
+    if code_key not in _stored_code_uris:
+        _stored_code_uris[code_key] = get_payload_store(
+            payload_store_config).put(source.encode())
+    return code_hash, _stored_code_uris[code_key]
+
+
+def create_task_envelope(input_dict, attributes, serialization_config={}, payload_store_config={}, max_inline_bytes=None):
+    payload, stats = serializers.encode_payload(input_dict, serialization_config.get(
+        'format', 'json'), serialization_config.get('compression', None))
+    attributes.update({'Input Serialization': str(stats._asdict())})
+
+    envelope = {'name': attributes['Name'],
+                'output_format': serialization_config.get('format', 'json'),
+                'output_compression': serialization_config.get('compression', None)}
+
+    if payload_store_config == {}:
+        envelope['code'] = attributes['Source Code']
+    else:
+        envelope['code_hash'], envelope['code_uri'] = store_code(
+            attributes['Source Code'], payload_store_config)
+        envelope['endpoint_url'] = payload_store_config.get(
+            'endpoint_url', None)
+
+    payload_uri = store_payload(
+        payload, attributes, payload_store_config, max_inline_bytes)
+    if payload_uri is None:
+        envelope['inputs'] = base64.b64encode(payload).decode()
+    else:
+        envelope['inputs_uri'] = payload_uri
+    return envelope
+
+
+_stored_bootstrap_uris = {}
+
+
+def store_bootstrap(payload_store_config):
+    bootstrap_key = store_key(payload_store_config)
+    if bootstrap_key not in _stored_bootstrap_uris:
+        _stored_bootstrap_uris[bootstrap_key] = get_payload_store(payload_store_config).put(
+            zlib.compress(runner.bootstrap_source().encode(), 9))
+    return _stored_bootstrap_uris[bootstrap_key]
+
+
+def runner_command(runner_config={}, payload_store_config={}):
+    # With a payload store, the bootstrapped runner is stored once and only
+    # a short loader is sent with each task
+    if runner_config.get('installed', False) or payload_store_config == {}:
+        return runner.runner_command(runner_config)
+    return runner.bootstrap_loader_command(store_bootstrap(payload_store_config), runner_config.get('python', 'python'), payload_store_config.get('endpoint_url', None))
+
+
+def check_task_size(command, encoded_envelope, limit, backend):
+    size = sum(len(part) for part in command) + len(encoded_envelope)
+    if size > limit:
+        raise Exception('The ' + backend + ' task is ' + str(size) + ' bytes, more than the limit of ' + str(limit) +
+                        ' - set a payload_store_config to pass the inputs and the runner by reference, set "installed" in runner_config, or map with a smaller chunk_size')
+
+
+def local_store_root(payload_store_config):
+    if payload_store_config == {} or not payload_store_config['uri'].startswith(('file://', '/')):
+        return None
+    return object_store.get_object_store(store_uri(payload_store_config)).root
+
 
-    python_str = '\nimport sys\nfrom typing import NamedTuple\n' + attributes['Source Code'].replace("'", "¿").replace(
-        '"', '§') + "\nprint(" + attributes['Name'] + "(" + input_str + "))"
-    return python_str
+def parse_result(result_str, attributes=None):
+    decoded_result = runner.decode_result(result_str)
+    if decoded_result is not None and attributes is not None:
+        attributes.update({'Output Serialization': str(decoded_result[1]._asdict()),
+                           'Output Schema': str(decoded_result[2])})
+    return None if decoded_result is None else decoded_result[0]
 
 
-def parse_outputs(output_str):
-    # print(output_str)
+def parse_outputs(output_str, attributes=None):
+    ioutputs = parse_result(output_str, attributes)
+    if ioutputs is not None:
+        return ioutputs
+
+    # Fallback for outputs printed by inline scripts (e.g. AWS Lambda)
     output_line = output_str.splitlines()[-1]
     # print('****', output_line)
     node = ast.parse(output_line)
@@ -77,53 +196,179 @@ def parse_outputs(output_str):
     return outputs(*keyword_values)
 
 
-def run_docker_compose(docker_id, input_dict, attributes):
+def container_limits(docker_config):
+    limits = {}
+    if docker_config.get('cpus', None):
+        limits['nano_cpus'] = int(float(docker_config['cpus']) * 1e9)
+    if docker_config.get('memory', None):
+        limits['mem_limit'] = parse_memory(docker_config['memory'])
+    return limits
 
-    python_str = create_python_input_str(input_dict, attributes)
 
-    python_str = python_str.replace('§', '\\"').replace('¿', "\'")
+def reserve_host_resources(docker_config):
+    # With 'admission', tasks are admitted while the host has free CPUs (1
+    # by default) and memory, and pinned to the reserved CPUs
+    if not docker_config.get('admission', False):
+        return None
+    return get_host_resources().reserve(docker_config.get('cpus', 1), docker_config.get('memory', 0), docker_config.get('admission_timeout', None))
 
-    client = get_client()
-    container = client.containers.run(
-        docker_id, 'python -c \"' + python_str + '\"', detach=True)
-    container.wait()
 
-    output_str = container.logs().decode()
+def run_docker_compose(docker_id, input_dict, attributes, serialization_config={}, payload_store_config={}, runner_config={}, docker_config={}):
 
-    ioutputs = parse_outputs(output_str)
-    return ioutputs
+    envelope = create_task_envelope(
+        input_dict, attributes, serialization_config, payload_store_config)
+
+    store_root = local_store_root(payload_store_config)
+    volumes = {store_root: {'bind': store_root, 'mode': 'ro'}} if store_root else {}
 
+    reservation = reserve_host_resources(docker_config)
+    try:
+        if docker_config.get('warm_pool', False):
+            return run_docker_warm(docker_id, envelope, attributes, volumes, runner_config, docker_config, reservation)
+        return run_docker_container(docker_id, envelope, attributes, volumes, runner_config, docker_config, reservation)
+    finally:
+        if reservation is not None:
+            get_host_resources().release(reservation)
 
-def run_lambda(input_dict, attributes, lambda_config):
 
-    python_str = create_python_input_str(input_dict, attributes)
+def run_docker_container(docker_id, envelope, attributes, volumes, runner_config={}, docker_config={}, reservation=None):
+    envelope.update({'output_channel': 'file',
+                    'output_path': runner.RESULT_PATH})
+    limits = container_limits(docker_config)
+    if reservation is not None and reservation.cpus:
+        limits['cpuset_cpus'] = reservation.cpuset
 
-    python_str = python_str.replace('§', '\'').replace(
-        '¿', '\'').replace('\n', '\\n')
+    client = get_client()
+    container = client.containers.create(
+        docker_id, runner.runner_command(runner_config) + ['--task-file', '/tmp/twingraph_task'], volumes=volumes, **limits)
+    try:
+        container.put_archive('/tmp', create_file_archive('twingraph_task',
+                              runner.encode_envelope(envelope).encode()))
+        container.start()
+        container.wait()
 
-    Unfinished = True
-    try_id=0
-    max_retries=5
-    while Unfinished and try_id<max_retries:
+        # Only the result file is read back, not the container logs
         try:
-            output_str = lambd_functions.invoke_lambd_function(
-                attributes['Name'], python_str, lambda_config['region_name'], attributes['Hash'], extended_output=lambda_config.get('extended_output','False'))
-            if output_str == None:
-                raise Exception('Outputs not found from Lambda')
-            Unfinished = False
-        except:
-            pass
-        try_id+=1
+            result_str = read_file_from_container(
+                container, runner.RESULT_PATH).decode()
+        except Exception:
+            raise Exception('Code failed to run - please check function:\n' +
+                            container.logs(tail=50).decode())
+    finally:
+        container.remove(force=True)
+
+    ioutputs = parse_result(result_str, attributes)
+    if ioutputs is None:
+        raise Exception('Outputs not found in ' + runner.RESULT_PATH)
+    return ioutputs
+
 
-    ioutputs = parse_outputs(output_str)
+def run_docker_warm(docker_id, envelope, attributes, volumes, runner_config={}, docker_config={}, reservation=None):
+    # The runner is started in an idle container of the pool, the result
+    # frame is read from the output of the exec
+    envelope.update({'output_channel': 'stdout'})
+    encoded_envelope = runner.encode_envelope(envelope)
+    task_name = 'twingraph_task_' + attributes['Hash']
+
+    pool = get_container_pool(docker_config.get(
+        'max_containers', None), docker_config.get('max_idle_seconds', 300))
+    container = pool.acquire(
+        docker_id, volumes, runner_config.get('python', 'python'), container_limits(docker_config))
+    healthy = False
+    try:
+        if reservation is not None and reservation.cpus:
+            container.update(cpuset_cpus=reservation.cpuset)
+        if len(encoded_envelope) < 65536:
+            # small tasks are passed in the environment of the exec
+            exit_code, output = container.exec_run(runner.runner_command(
+                runner_config), environment={'TWINGRAPH_TASK': encoded_envelope})
+        else:
+            container.put_archive('/tmp', create_file_archive(
+                task_name, encoded_envelope.encode()))
+            exit_code, output = container.exec_run(runner.runner_command(
+                runner_config) + ['--task-file', '/tmp/' + task_name])
+            container.exec_run(['rm', '-f', '/tmp/' + task_name])
+        healthy = True
+    finally:
+        if healthy and reservation is not None and reservation.cpus:
+            # unpinned before it goes back to the pool, its next call may
+            # reserve other CPUs or none at all
+            try:
+                container.update(cpuset_cpus=','.join(
+                    str(cpu) for cpu in get_host_resources().cpus))
+            except Exception:
+                healthy = False
+        pool.release(container, healthy)
+
+    output_str = output.decode(errors='replace')
+    ioutputs = parse_result(output_str, attributes)
+    if ioutputs is None:
+        raise Exception('Code failed to run - please check function:\n' +
+                        '\n'.join(output_str.splitlines()[-50:]))
     return ioutputs
 
 
-def run_aws_batch(input_dict, attributes, batch_config):
+def await_result(result_uri, payload_store_config, timeout=900):
+    store = get_payload_store(payload_store_config)
+    key = object_store.split_uri(result_uri)[1]
+    start_time = time.time()
+    interval = 0.1
+    while not store.exists(key):
+        if time.time() - start_time > timeout:
+            raise Exception('No result posted to ' + result_uri +
+                            ' after ' + str(timeout) + ' seconds')
+        time.sleep(interval)
+        interval = min(interval * 1.5, 5)
+    return store.get(key).decode()
+
+
+def run_lambda(input_dict, attributes, lambda_config, serialization_config={}, payload_store_config={}):
+
+    invocation_type = lambda_config.get('invocation_type', 'RequestResponse')
+    payload_limit = LAMBDA_EVENT_LIMIT if invocation_type == 'Event' else LAMBDA_REQUEST_LIMIT
+    envelope = create_task_envelope(
+        input_dict, attributes, serialization_config, payload_store_config, payload_limit // 2)
+
+    if invocation_type == 'Event':
+        if payload_store_config == {}:
+            raise Exception(
+                'Asynchronous Lambda invocations need a payload_store_config to post their results to!')
+        envelope['result_uri'] = get_payload_store(
+            payload_store_config).uri('result-' + attributes['Hash'])
+        envelope['endpoint_url'] = payload_store_config.get(
+            'endpoint_url', None)
+
+    # the runner is read from the payload store by the handler when there
+    # is one, as with the loader command of the other backends
+    event = {'task': runner.encode_envelope(envelope)}
+    if not lambda_config.get('runner_installed', False):
+        if payload_store_config == {}:
+            event['runner'] = runner.bootstrap_blob()
+        else:
+            event['runner_uri'] = store_bootstrap(payload_store_config)
+            event['endpoint_url'] = payload_store_config.get(
+                'endpoint_url', None)
+    encoded_event = json.dumps(event)
+    check_task_size([], encoded_event, payload_limit, 'AWS Lambda')
+
+    output_str = lambd_functions.invoke_lambd_function(
+        attributes['Name'], encoded_event, lambda_config['region_name'], invocation_type)
+    if invocation_type == 'Event':
+        output_str = await_result(
+            envelope['result_uri'], payload_store_config, lambda_config.get('timeout', 900))
+
+    ioutputs = parse_outputs(output_str, attributes)
+    return ioutputs
+
 
-    python_str = create_python_input_str(input_dict, attributes)
+def run_aws_batch(input_dict, attributes, batch_config, serialization_config={}, payload_store_config={}, runner_config={}):
 
-    python_str = python_str.replace('§', '\\"').replace('¿', "\'")
+    envelope = create_task_envelope(
+        input_dict, attributes, serialization_config, payload_store_config, BATCH_REQUEST_LIMIT // 2)
+    command = runner_command(runner_config, payload_store_config)
+    encoded_envelope = runner.encode_envelope(envelope)
+    check_task_size(command, encoded_envelope,
+                    BATCH_REQUEST_LIMIT, 'AWS Batch')
 
     if "wait" in batch_config.keys():
         wait = bool(batch_config["wait"])
@@ -136,39 +381,153 @@ def run_aws_batch(input_dict, attributes, batch_config):
                                               jobQueue=batch_config['jobQueue'],
                                               jobDefinition='job-' +
                                               attributes['Name'],
-                                              command=[
-                                                      "/bin/bash", "-c", "python -c \"" + python_str + "\""],
+                                              command=command,
                                               regionName=batch_config['region_name'],
-                                              wait=wait)
+                                              wait=wait,
+                                              environment=[{'name': 'TWINGRAPH_TASK', 'value': encoded_envelope}],
+                                              endpointUrl=batch_config.get('endpoint_url', None),
+                                              timeout=float(batch_config.get('timeout', submit_batch_job.DEFAULT_TIMEOUT)),
+                                              not_found_timeout=float(batch_config.get('not_found_timeout', submit_batch_job.DEFAULT_NOT_FOUND_TIMEOUT)))
 
     output_str = submit_batch_job.obtain_results(batch_config, cw_log_name)
 
-    ioutputs = parse_outputs(output_str)
+    ioutputs = parse_outputs(output_str, attributes)
     return ioutputs
 
 
-def run_kubernetes(docker_id, input_dict, attributes, kube_config):
+def create_array_envelope(input_dicts, attributes_list, serialization_config={}, payload_store_config={}):
+    envelopes = [create_task_envelope(input_dict, attributes, serialization_config, payload_store_config)
+                 for input_dict, attributes in zip(input_dicts, attributes_list)]
+    array = [{key: val for key, val in element_envelope.items() if key in (
+        'inputs', 'inputs_uri')} for element_envelope in envelopes]
 
-    python_str = create_python_input_str(input_dict, attributes)
+    envelope = {key: val for key, val in envelopes[0].items() if key not in (
+        'inputs', 'inputs_uri')}
+    if payload_store_config == {}:
+        envelope['array'] = array
+    else:
+        # keeps the TWINGRAPH_TASK environment variable small for large arrays
+        envelope['array_uri'] = get_payload_store(
+            payload_store_config).put(json.dumps(array).encode())
+    return envelope
+
+
+def run_aws_batch_array(input_dicts, attributes_list, batch_config, serialization_config={}, payload_store_config={}, runner_config={}):
+
+    envelope = create_array_envelope(
+        input_dicts, attributes_list, serialization_config, payload_store_config)
+    command = runner_command(runner_config, payload_store_config)
+    encoded_envelope = runner.encode_envelope(envelope)
+    check_task_size(command, encoded_envelope,
+                    BATCH_REQUEST_LIMIT, 'AWS Batch array')
+
+    job_id = submit_batch_job.submit_array_job(jobName='job-' + attributes_list[0]['Hash'],
+                                               jobQueue=batch_config['jobQueue'],
+                                               jobDefinition='job-' +
+                                               attributes_list[0]['Name'],
+                                               command=command,
+                                               regionName=batch_config['region_name'],
+                                               size=len(input_dicts),
+                                               environment=[
+                                                   {'name': 'TWINGRAPH_TASK', 'value': encoded_envelope}],
+                                               endpointUrl=batch_config.get('endpoint_url', None))
+
+    children = submit_batch_job.wait_array_job(job_id, len(input_dicts), batch_config['region_name'], batch_config.get(
+        'endpoint_url', None), float(batch_config.get('timeout', submit_batch_job.DEFAULT_TIMEOUT)), float(batch_config.get('not_found_timeout', submit_batch_job.DEFAULT_NOT_FOUND_TIMEOUT)))
+
+    ioutputs_list = []
+    for index, (child, attributes) in enumerate(zip(children, attributes_list)):
+        attributes.update({'AWS Batch Array Job': job_id,
+                          'AWS Batch Array Index': index})
+        if child is None or child['status'] != 'SUCCEEDED':
+            raise Exception('Batch array job ' + job_id + ':' +
+                            str(index) + ' did not succeed, check Batch console')
+        output_str = submit_batch_job.obtain_results(
+            batch_config, child['logStreamName'])
+        ioutputs_list.append(parse_outputs(output_str, attributes))
+    return ioutputs_list
+
+
+def submit_kubernetes_job(docker_id, envelope, job_name, component_name, kube_config, payload_store_config={}, runner_config={}, completions=None):
+    store_root = local_store_root(payload_store_config)
+    volumes = [create_payload_volume(store_root, kube_config.get(
+        'payload_volume_claim', None))] if store_root else []
+    command = runner_command(runner_config, payload_store_config)
+    encoded_envelope = runner.encode_envelope(envelope)
+    check_task_size(command, encoded_envelope,
+                    KUBERNETES_OBJECT_LIMIT, 'Kubernetes')
+
+    run_container = create_container(docker_id, job_name, kube_config.get(
+        'pull_policy', "Always"), command, None, volume_mounts=[kube_client.V1VolumeMount(name='twingraph-payloads', mount_path=store_root, read_only=True)] if store_root else None, env=[kube_client.V1EnvVar(name='TWINGRAPH_TASK', value=encoded_envelope)])
+    pod_template = create_pod_template(
+        job_name, run_container, volumes=volumes)
+    job = create_job(job_name, pod_template, completions, kube_config.get('parallelism', None), labels=run_labels(
+        component_name, kube_config.get('run_id', None)), ttl_seconds_after_finished=kube_config.get('ttl_seconds_after_finished', 3600))
+    namespace = create_namespace(kube_config.get('namespace', 'default'))
+
+    # The job is followed by the shared informer of the namespace
+    informer = get_job_informer(namespace)
+    finished = informer.watch(job_name)
+    try:
+        batch_api.create_namespaced_job(namespace, job)
+        return finished.result(timeout=float(kube_config.get('timeout', '360000')))
+    except Exception as e:
+        informer.forget(job_name)
+        if isinstance(e, concurrent.futures.TimeoutError):
+            raise Exception('Timed out waiting for Kubernetes job ' + job_name)
+        raise
+
+
+def run_kubernetes(docker_id, input_dict, attributes, kube_config, serialization_config={}, payload_store_config={}, runner_config={}):
+
+    envelope = create_task_envelope(
+        input_dict, attributes, serialization_config, payload_store_config)
+    envelope.update({'output_channel': 'termination'})
+    namespace = kube_config.get('namespace', 'default')
+
+    finished_job = submit_kubernetes_job(
+        docker_id, envelope, attributes['Hash'], attributes['Name'], kube_config, payload_store_config, runner_config)
+
+    # The result is read from the pod termination message, the logs are only
+    # downloaded through the API when the result did not fit into it
+    ioutputs = parse_result(get_termination_message(
+        attributes['Hash'], namespace), attributes)
+    if ioutputs is None:
+        output_str = get_job_logs(attributes['Hash'], namespace)
+        if job_state(finished_job) == 'Failed' and runner.RESULT_END not in output_str:
+            raise Exception('Kubernetes job ' +
+                            attributes['Hash'] + ' failed:\n' + output_str)
+        ioutputs = parse_outputs(output_str, attributes)
+    return ioutputs
 
-    python_str = python_str.replace('§', '\\"').replace('¿', "\'")
 
-    run_container = create_container(docker_id, attributes['Hash'], kube_config.get(
-        'pull_policy', "Always"), ["/bin/sh", "-c"], ['python -c \"' + python_str + '\"'])
-    pod_template = create_pod_template(attributes['Hash'], run_container)
-    job = create_job(attributes['Hash'], pod_template)
-    k8s_batch_api = kube_client.BatchV1Api()
-    k8s_batch_api.create_namespaced_job(
-        kube_config.get('namespace', 'default'), job)
+def run_kubernetes_indexed(docker_id, input_dicts, attributes_list, kube_config, serialization_config={}, payload_store_config={}, runner_config={}):
 
-    subprocess.check_output(
-        ["kubectl", "wait", "--for=condition=complete", "--timeout=" + kube_config.get('timeout', '360000') + "s", "job/" + attributes['Hash']])
+    envelope = create_array_envelope(
+        input_dicts, attributes_list, serialization_config, payload_store_config)
+    envelope.update({'output_channel': 'termination'})
+    job_name = attributes_list[0]['Hash']
 
-    output_str = subprocess.check_output(
-        ["kubectl", "logs", "job/" + attributes['Hash']]).decode()
+    finished_job = submit_kubernetes_job(docker_id, envelope, job_name, attributes_list[0]['Name'], kube_config,
+                                         payload_store_config, runner_config, completions=len(input_dicts))
+    if job_state(finished_job) == 'Failed':
+        raise Exception('Kubernetes indexed job ' + job_name +
+                        ' did not succeed, check the pods of the job')
 
-    ioutputs = parse_outputs(output_str)
-    return ioutputs
+    pods = get_indexed_pods(job_name, kube_config.get('namespace', 'default'))
+    ioutputs_list = []
+    for index, attributes in enumerate(attributes_list):
+        attributes.update({'Kubernetes Indexed Job': job_name,
+                          'Kubernetes Completion Index': index})
+        if index not in pods:
+            raise Exception('No pod found for index ' + str(index) +
+                            ' of Kubernetes indexed job ' + job_name)
+        ioutputs = parse_result(
+            get_pod_termination_message(pods[index]), attributes)
+        if ioutputs is None:
+            ioutputs = parse_outputs(get_pod_logs(pods[index]), attributes)
+        ioutputs_list.append(ioutputs)
+    return ioutputs_list
 
 
 def remove_line_containing(file_string, match):
@@ -188,7 +547,7 @@ def line_no(inp, target):
     return line_no - 1
 
 
-def load_inputs(args, kwargs, argspec):
+def load_inputs(args, kwargs, argspec, json_compatible=True):
     s = StringIO()
 
     adjusted_args = argspec.args
@@ -200,6 +559,8 @@ def load_inputs(args, kwargs, argspec):
         input_dict[adjusted_args[i]] = arg
     input_dict.update(kwargs)
     input_vals = s.getvalue()
+    if not json_compatible:
+        return input_vals, input_dict
     input_dict = {
         key: (input_dict[key].to_json(orient='records')
               if isinstance(input_dict[key], pd.DataFrame)
@@ -225,6 +586,62 @@ def set_hash(parent_hash):
     return str(encoded_child_hash.hexdigest())
 
 
+def collect_dependencies(args, kwargs):
+    try:
+        parent_hash = kwargs.pop('parent_hash')
+    except:
+        parent_hash = []
+
+    if type(parent_hash) == str or is_handle(parent_hash):
+        parent_hash = [parent_hash]
+
+    argument_handles = find_handles(args, kwargs)
+    dependencies = argument_handles + [parent_hash_k.handle if hasattr(
+        parent_hash_k, 'handle') else parent_hash_k for parent_hash_k in parent_hash if is_handle(parent_hash_k)]
+    parent_hash = [parent_hash_k.hash if is_handle(parent_hash_k) else parent_hash_k for parent_hash_k in parent_hash] + \
+        handle_hashes(argument_handles)
+    return parent_hash, dependencies
+
+
+def map_elements(iterable_of_kwargs, parent_hash=[]):
+    # Elements of Func.map(...) are keyword argument dictionaries (or tuples of
+    # positional arguments), each one becomes (args, kwargs, parent_hash, child_hash)
+    # - the index keeps the hashes of one map unique without a sleep per element.
+    # the parent hashes may also be results of a Celery pipeline (see
+    # celery_refs.map_element_refs), which are not strings
+    if not isinstance(parent_hash, (list, tuple)):
+        parent_hash = [parent_hash]
+
+    set_randomize_time()
+
+    elements = []
+    dependencies = []
+    for index, element in enumerate(iterable_of_kwargs):
+        if isinstance(element, dict):
+            args, kwargs = (), dict(element)
+        else:
+            args, kwargs = tuple(element), {}
+        element_parent_hash = kwargs.get('parent_hash', [])
+        if not isinstance(element_parent_hash, (list, tuple)):
+            element_parent_hash = [element_parent_hash]
+        kwargs['parent_hash'] = list(parent_hash) + list(element_parent_hash)
+
+        element_parent_hash, element_dependencies = collect_dependencies(
+            args, kwargs)
+        element_parent_hash = [parent for parent_index, parent in enumerate(
+            element_parent_hash) if parent not in element_parent_hash[:parent_index]]
+        elements.append((args, kwargs, element_parent_hash, set_hash(
+            parent_hash=[str(parent) for parent in element_parent_hash] + [str(index)])))
+        dependencies.append(element_dependencies)
+    return elements, dependencies
+
+
+def chunk_elements(elements, chunk_size=None, max_chunks=32):
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(elements) // max_chunks))
+    return [elements[i:i + chunk_size] for i in range(0, len(elements), chunk_size)]
+
+
 def set_gremlin_port_ip(graph_config):
     if graph_config == {}:
         gremlin_ip_port = 'ws://127.0.0.1:8182/gremlin'
@@ -235,8 +652,8 @@ def set_gremlin_port_ip(graph_config):
 
 def set_AWS_ARN():
     try:
-        import boto3
-        client = boto3.client('sts')
+        from twingraph.awsmodules.clients import get_client
+        client = get_client('sts')
         response_dict = client.get_caller_identity()
         response = response_dict['Arn']
     except:
@@ -246,7 +663,7 @@ def set_AWS_ARN():
 
 def lambda_create_component(component_docker_ids, comp_name, lambda_config):
     lambd_functions.create_lambd_function(
-        comp_name, component_docker_ids, lambda_config['iam_role'], lambda_config['architecture'], lambda_config['storage_size'], lambda_config['memory_size'], lambda_config["timeout"])
+        comp_name, component_docker_ids, lambda_config['iam_role'], lambda_config['architecture'], lambda_config['storage_size'], lambda_config['memory_size'], lambda_config["timeout"], lambda_config.get('region_name', None))
 
 
 def batch_create_component(component_docker_ids, comp_name, batch_config):
@@ -0,0 +1,218 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Components return ComponentResult handles. The hash of a handle is known as
+# soon as the component is called, while its outputs may only be available
+# later (e.g. when the component runs on an executor). When a handle, or one
+# of its output fields (handle.outputs.<field>), is passed as an argument to
+# another component, the dependency edge is recorded automatically and the
+# value is substituted before the function runs.
+
+import asyncio
+import inspect
+
+
+class ComponentResult(dict):
+    def __init__(self, child_hash, outputs=None, future=None):
+        dict.__init__(self)
+        self.hash = child_hash
+        self._future = future
+        if future is None:
+            self._set_outputs(outputs)
+
+    def _set_outputs(self, outputs):
+        dict.update(self, {'outputs': outputs, 'hash': self.hash})
+        self._future = None
+
+    def done(self):
+        return self._future is None or self._future.done()
+
+    def result(self, timeout=None):
+        if self._future is not None:
+            self._set_outputs(self._future.result(timeout))
+        return self
+
+    def exception(self, timeout=None):
+        return None if self._future is None else self._future.exception(timeout)
+
+    def add_done_callback(self, callback):
+        if self._future is None:
+            callback(self)
+        else:
+            self._future.add_done_callback(lambda _: callback(self))
+
+    @property
+    def outputs(self):
+        return OutputRefs(self)
+
+    def __getitem__(self, key):
+        if key == 'hash':
+            return self.hash
+        return dict.__getitem__(self.result(), key)
+
+    def get(self, key=None, default=None):
+        # Without a key this waits for the outputs like Celery's AsyncResult.get()
+        if key is None:
+            return self.result()
+        return dict.get(self.result(), key, default)
+
+    def keys(self):
+        return dict.keys(self.result())
+
+    def values(self):
+        return dict.values(self.result())
+
+    def items(self):
+        return dict.items(self.result())
+
+    def __iter__(self):
+        return dict.__iter__(self.result())
+
+    def __len__(self):
+        return dict.__len__(self.result())
+
+    def __contains__(self, key):
+        return dict.__contains__(self.result(), key)
+
+    def __repr__(self):
+        if not self.done():
+            return 'ComponentResult(hash=' + repr(self.hash) + ', pending)'
+        return dict.__repr__(self.result())
+
+    def __reduce__(self):
+        # Handles cross process boundaries (Celery, process pools) as the
+        # plain {'outputs', 'hash'} dictionary.
+        return (dict, (dict(self.result()),))
+
+
+class ItemFuture:
+    # One element of a future resolving to a list, e.g. of a chunk of Func.map
+    def __init__(self, future, index):
+        self.future = future
+        self.index = index
+
+    @property
+    def node(self):
+        return getattr(self.future, 'node', None)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)[self.index]
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+    def add_done_callback(self, callback):
+        self.future.add_done_callback(lambda _: callback(self))
+
+
+class OutputRef:
+    def __init__(self, handle, field):
+        self.handle = handle
+        self.field = field
+
+    @property
+    def hash(self):
+        return self.handle.hash
+
+    def resolve(self):
+        return self.handle['outputs'][self.field]
+
+    def __repr__(self):
+        return 'OutputRef(hash=' + repr(self.hash) + ', field=' + repr(self.field) + ')'
+
+
+class OutputRefs:
+    def __init__(self, handle):
+        self.handle = handle
+
+    @property
+    def hash(self):
+        return self.handle.hash
+
+    def resolve(self):
+        return self.handle['outputs']
+
+    def __getattr__(self, field):
+        if field.startswith('__'):
+            raise AttributeError(field)
+        return OutputRef(self.handle, field)
+
+    def __getitem__(self, field):
+        return OutputRef(self.handle, field)
+
+
+def is_handle(val):
+    return isinstance(val, (ComponentResult, OutputRef, OutputRefs))
+
+
+def _walk(val, visit):
+    if is_handle(val):
+        return visit(val)
+    if isinstance(val, (list, tuple)) and not hasattr(val, '_fields'):
+        return type(val)(_walk(sub_val, visit) for sub_val in val)
+    if isinstance(val, dict) and not isinstance(val, ComponentResult):
+        return {key: _walk(sub_val, visit) for key, sub_val in val.items()}
+    return val
+
+
+def find_handles(args, kwargs):
+    handles = []
+
+    def visit(val):
+        handles.append(val.handle if not isinstance(
+            val, ComponentResult) else val)
+        return val
+
+    _walk((list(args), kwargs), visit)
+    return handles
+
+
+def resolve_handles(args, kwargs):
+    def visit(val):
+        if isinstance(val, ComponentResult):
+            return dict(val.result())
+        return val.resolve()
+
+    return _walk(tuple(args), visit), _walk(kwargs, visit)
+
+
+def handle_hashes(handles):
+    return [handle.hash for handle in handles]
+
+
+def _is_awaitable(val):
+    return inspect.isawaitable(val) and not is_handle(val)
+
+
+async def await_arguments(args, kwargs):
+    # Arguments may be pending asyncio tasks/futures of other component calls,
+    # e.g. Func_B.aio(asyncio.ensure_future(Func_A.aio(...))), they are
+    # awaited concurrently before the component is dispatched.
+    awaitables = []
+
+    def visit_awaitable(val):
+        if _is_awaitable(val):
+            awaitables.append(val)
+        return val
+
+    _walk_awaitables((list(args), kwargs), visit_awaitable)
+    unique_awaitables = {id(val): val for val in awaitables}
+    results = dict(zip(unique_awaitables.keys(), await asyncio.gather(*unique_awaitables.values())))
+
+    def replace_awaitable(val):
+        return results[id(val)] if _is_awaitable(val) else val
+
+    return _walk_awaitables(tuple(args), replace_awaitable), _walk_awaitables(kwargs, replace_awaitable)
+
+
+def _walk_awaitables(val, visit):
+    if isinstance(val, (list, tuple)) and not hasattr(val, '_fields'):
+        return type(val)(_walk_awaitables(sub_val, visit) for sub_val in val)
+    if isinstance(val, dict) and not isinstance(val, ComponentResult):
+        return {key: _walk_awaitables(sub_val, visit) for key, sub_val in val.items()}
+    return visit(val)
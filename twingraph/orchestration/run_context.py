@@ -0,0 +1,31 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# The pipeline run a task belongs to. The Celery workers of a run inherit
+# TWINGRAPH_RUN_ID, while the shared worker fleet sets it per task - on the
+# thread of the task, as the I/O workers run tasks of several runs at once.
+# The working directory of the pipeline is kept the same way, relative
+# paths given to TwinGraph are resolved against it with task_path.
+
+import os
+import threading
+
+_context = threading.local()
+
+
+def set_run_id(run_id):
+    _context.run_id = run_id
+
+
+def current_run_id(default=None):
+    return getattr(_context, 'run_id', None) or os.environ.get('TWINGRAPH_RUN_ID', default)
+
+
+def set_task_dir(task_dir):
+    _context.task_dir = task_dir
+
+
+def task_path(path):
+    return os.path.join(getattr(_context, 'task_dir', None) or os.getcwd(), path)
@@ -0,0 +1,293 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# In-container entrypoint for components executed on Docker, Kubernetes and
+# AWS Batch. It can be installed into the component image and started with
+# `python -m twingraph.runner`, or shipped as a bootstrap (see
+# bootstrap_command) into images that do not have TwinGraph installed - hence
+# only the standard library is needed at import time.
+#
+# The task envelope is a JSON document with the component name, its source
+# (or the hash and URI of the source) and the serialized inputs (or their
+# URI); it is read from --task-file, from stdin (--stdin) or from the
+# TWINGRAPH_TASK environment variable. The outputs (or the remote traceback)
+# are written as a framed record with the schema of the 'outputs' namedtuple
+# through the channel selected by the envelope.
+
+import base64
+import functools
+import hashlib
+import json
+import marshal
+import os
+import sys
+import tempfile
+import traceback
+import zlib
+from collections import namedtuple
+from typing import NamedTuple
+
+from twingraph.serialization.serializers import encode_payload, decode_payload
+from twingraph.storage.object_store import resolve_uri, store_uri
+
+RESULT_START = '<<<TWINGRAPH_RESULT>>>'
+RESULT_END = '<<<END_TWINGRAPH_RESULT>>>'
+
+# Result channels: 'stdout' (sentinel-delimited frame in the logs), 'file'
+# (frame written to RESULT_PATH, read by the driver without the logs) and
+# 'termination' (Kubernetes termination message, limited to 4096 bytes).
+RESULT_PATH = '/tmp/twingraph_result'
+TERMINATION_LOG_PATH = '/dev/termination-log'
+TERMINATION_MESSAGE_LIMIT = 4096
+
+CODE_CACHE_DIR = os.environ.get('TWINGRAPH_CODE_CACHE_DIR', os.path.join(
+    tempfile.gettempdir(), 'twingraph-code-cache'))
+
+_code_cache = {}
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def encode_envelope(envelope):
+    return base64.b64encode(zlib.compress(json.dumps(envelope).encode())).decode()
+
+
+def decode_envelope(raw_envelope):
+    raw_envelope = raw_envelope.strip()
+    if isinstance(raw_envelope, bytes):
+        raw_envelope = raw_envelope.decode()
+    if not raw_envelope.startswith('{'):
+        raw_envelope = zlib.decompress(
+            base64.b64decode(raw_envelope)).decode()
+    return json.loads(raw_envelope)
+
+
+def load_compiled_code(envelope):
+    code_hash = envelope.get('code_hash', None)
+    if code_hash is None:
+        code_hash = source_hash(envelope['code'])
+    if code_hash in _code_cache:
+        return _code_cache[code_hash]
+
+    cache_path = os.path.join(
+        CODE_CACHE_DIR, code_hash + '.' + sys.implementation.cache_tag)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            _code_cache[code_hash] = marshal.load(cache_file)
+        return _code_cache[code_hash]
+    except Exception:
+        pass
+
+    if 'code' in envelope:
+        source = envelope['code']
+    else:
+        source = resolve_uri(envelope['code_uri'], envelope.get(
+            'endpoint_url', None)).decode()
+    code = compile(source, '<twingraph:' + envelope['name'] + '>', 'exec')
+    _code_cache[code_hash] = code
+
+    try:
+        os.makedirs(CODE_CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + '.' + str(os.getpid())
+        with open(tmp_path, 'wb') as cache_file:
+            marshal.dump(code, cache_file)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        pass
+    return code
+
+
+def load_inputs(envelope):
+    if 'inputs_uri' in envelope:
+        frame = resolve_uri(envelope['inputs_uri'],
+                            envelope.get('endpoint_url', None))
+    else:
+        frame = base64.b64decode(envelope['inputs'])
+    return decode_payload(frame)
+
+
+def array_task(envelope):
+    # Array jobs (AWS Batch) and Indexed Jobs (Kubernetes) share one envelope,
+    # each child picks its inputs by AWS_BATCH_JOB_ARRAY_INDEX or
+    # JOB_COMPLETION_INDEX.
+    if 'array' not in envelope and 'array_uri' not in envelope:
+        return envelope
+    if 'array' in envelope:
+        array = envelope['array']
+    else:
+        array = json.loads(resolve_uri(
+            envelope['array_uri'], envelope.get('endpoint_url', None)).decode())
+    index = int(os.environ.get('AWS_BATCH_JOB_ARRAY_INDEX', os.environ.get(
+        'JOB_COMPLETION_INDEX', envelope.get('array_index', 0))))
+    task = {key: val for key, val in envelope.items() if key not in (
+        'array', 'array_uri')}
+    task.update(array[index])
+    return task
+
+
+def run_task(envelope):
+    namespace = {'__name__': '__twingraph__',
+                 'NamedTuple': NamedTuple, 'sys': sys}
+    exec(load_compiled_code(envelope), namespace)
+    inputs, input_stats = load_inputs(envelope)
+    return namespace[envelope['name']](**inputs), input_stats
+
+
+def output_schema(result):
+    return {'typename': type(result).__name__,
+            'fields': list(result._fields),
+            'types': [type(val).__name__ for val in result]}
+
+
+def encode_record(record, serialization_format='json', compression=None):
+    frame, stats = encode_payload(record, serialization_format, compression)
+    return RESULT_START + base64.b64encode(frame).decode() + RESULT_END, stats
+
+
+def encode_result(result, serialization_format='json', compression=None):
+    if not hasattr(result, '_fields'):
+        raise Exception(
+            "Components need to return a NamedTuple called 'outputs', got " + type(result).__name__)
+    return encode_record({'schema': output_schema(result), 'values': list(result)}, serialization_format, compression)
+
+
+def decode_result(output_str):
+    end = output_str.rfind(RESULT_END)
+    start = output_str.rfind(RESULT_START, 0, end)
+    if start < 0 or end < 0:
+        return None
+    record, stats = decode_payload(base64.b64decode(
+        output_str[start + len(RESULT_START):end]))
+    if 'error' in record:
+        raise Exception('Component failed remotely:\n' + record['error'])
+    if 'channel' in record:
+        # The result did not fit in the requested channel, see write_result
+        return None
+    schema = record['schema']
+    outputs = namedtuple(schema['typename'], schema['fields'])
+    return outputs(*record['values']), stats, schema
+
+
+def write_result(result_str, envelope):
+    channel = envelope.get('output_channel', 'stdout')
+    if channel == 'termination' and len(result_str) > TERMINATION_MESSAGE_LIMIT:
+        # Kubernetes truncates termination messages, the driver falls back to
+        # the sentinel in the logs instead.
+        with open(envelope.get('output_path', TERMINATION_LOG_PATH), 'w') as result_file:
+            result_file.write(encode_record({'channel': 'stdout'})[0])
+        channel = 'stdout'
+
+    if channel == 'stdout':
+        print('\n' + result_str, flush=True)
+    else:
+        with open(envelope.get('output_path', RESULT_PATH if channel == 'file' else TERMINATION_LOG_PATH), 'w') as result_file:
+            result_file.write(result_str)
+
+
+def read_envelope(argv):
+    if '--task-file' in argv:
+        with open(argv[argv.index('--task-file') + 1], 'rb') as task_file:
+            return decode_envelope(task_file.read())
+    if '--stdin' in argv:
+        return decode_envelope(sys.stdin.buffer.read())
+    return decode_envelope(os.environ['TWINGRAPH_TASK'])
+
+
+def execute_envelope(envelope):
+    output_format = envelope.get('output_format', 'json')
+    output_compression = envelope.get('output_compression', None)
+    try:
+        result, _ = run_task(envelope)
+        result_str, _ = encode_result(
+            result, output_format, output_compression)
+        return result_str, 0
+    except Exception:
+        traceback.print_exc()
+        result_str, _ = encode_record(
+            {'error': traceback.format_exc()}, output_format, output_compression)
+        return result_str, 1
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    envelope = array_task(read_envelope(argv))
+    result_str, exit_code = execute_envelope(envelope)
+    write_result(result_str, envelope)
+    return exit_code
+
+
+def handle_lambda_event(event):
+    # AWS Lambda: the result frame is returned in the response payload, and
+    # for asynchronous (Event) invocations also posted to result_uri, which
+    # the driver awaits.
+    envelope = decode_envelope(event['task'])
+    result_str, _ = execute_envelope(envelope)
+    if 'result_uri' in envelope:
+        store_uri(envelope['result_uri'], result_str.encode(),
+                  envelope.get('endpoint_url', None))
+    return {'result': result_str}
+
+
+_BOOTSTRAP_LOADER = '''
+import sys, types
+for package in ('twingraph', 'twingraph.serialization', 'twingraph.storage'):
+    if package not in sys.modules:
+        sys.modules[package] = types.ModuleType(package)
+        sys.modules[package].__path__ = []
+for name, source in MODULES:
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    exec(compile(source, name, 'exec'), module.__dict__)
+'''
+
+
+def bootstrap_source():
+    import inspect
+    from twingraph.serialization import serializers
+    from twingraph.storage import object_store
+
+    modules = [(module.__name__, inspect.getsource(module)) for module in (
+        serializers, object_store, sys.modules[__name__])]
+    modules[-1] = ('twingraph.runner', modules[-1][1])
+    return 'MODULES = ' + repr(modules) + '\n' + _BOOTSTRAP_LOADER
+
+
+@functools.lru_cache(maxsize=None)
+def bootstrap_blob():
+    # The runner and its dependencies are shipped as one compressed blob, so
+    # the command line is independent of the component and needs no quoting.
+    return base64.b64encode(zlib.compress(bootstrap_source().encode(), 9)).decode()
+
+
+@functools.lru_cache(maxsize=None)
+def bootstrap_command(python='python'):
+    return (python, '-c', "import base64,sys,zlib;exec(zlib.decompress(base64.b64decode('" + bootstrap_blob() + "')));sys.exit(sys.modules['twingraph.runner'].main())")
+
+
+def bootstrap_loader_command(bootstrap_uri, python='python', endpoint_url=None):
+    # The bootstrap (the compressed blob, not base64 encoded) is read from the
+    # payload store, which keeps the command line short; S3 needs boto3 in the
+    # image, as for resolving payload URIs with the bootstrapped runner.
+    from urllib.parse import urlparse
+    parsed_uri = urlparse(bootstrap_uri)
+    if parsed_uri.scheme in ('', 'file'):
+        read = 'open(' + repr(parsed_uri.path) + ",'rb').read()"
+    else:
+        read = "__import__('boto3').client('s3',endpoint_url=" + repr(endpoint_url) + ').get_object(Bucket=' + repr(
+            parsed_uri.netloc) + ',Key=' + repr(parsed_uri.path.lstrip('/')) + ")['Body'].read()"
+    return [python, '-c', 'import sys,zlib;exec(zlib.decompress(' + read + "));sys.exit(sys.modules['twingraph.runner'].main())"]
+
+
+def runner_command(runner_config={}):
+    python = runner_config.get('python', 'python')
+    if runner_config.get('installed', False):
+        return [python, '-m', 'twingraph.runner']
+    return list(bootstrap_command(python))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# This module only depends on the standard library at import time - optional
+# formats (msgpack, numpy, zstandard, lz4) are imported lazily - so that its
+# source can be shipped verbatim into component containers that do not have
+# TwinGraph installed.
+
+import io
+import json
+import pickle
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b'TGS1'
+
+SerializationStats = namedtuple(
+    'SerializationStats', ['format', 'compression', 'bytes', 'compressed_bytes', 'seconds'])
+
+_serializers = {}
+_compressors = {}
+
+
+def register_serializer(name, dumps, loads):
+    _serializers[name] = (dumps, loads)
+
+
+def register_compressor(name, compress, decompress):
+    _compressors[name] = (compress, decompress)
+
+
+def available_serializers():
+    return sorted(_serializers.keys())
+
+
+def available_compressors():
+    return sorted(_compressors.keys())
+
+
+def _json_default(obj):
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '_asdict'):
+        return obj._asdict()
+    raise TypeError('Object of type ' + type(obj).__name__ +
+                    ' is not JSON serializable')
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=_json_default).encode()
+
+
+def _json_loads(data):
+    return json.loads(bytes(data).decode())
+
+
+def _msgpack_dumps(obj):
+    import msgpack
+    return msgpack.packb(obj, use_bin_type=True, default=_json_default)
+
+
+def _msgpack_loads(data):
+    import msgpack
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# Pickle protocol 5 frame: <number of buffers> <buffer lengths> <pickle> <buffers>
+# The out-of-band buffers (e.g. numpy array memory) are written as raw bytes
+# and handed back to pickle as zero-copy memoryview slices on load.
+def _pickle_dumps(obj):
+    buffers = []
+    pickled = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    raw_buffers = [buffer.raw() for buffer in buffers]
+    header = struct.pack('<IQ', len(raw_buffers), len(pickled)) + b''.join(
+        struct.pack('<Q', raw_buffer.nbytes) for raw_buffer in raw_buffers)
+    return b''.join([header, pickled] + [raw_buffer.tobytes() for raw_buffer in raw_buffers])
+
+
+def _pickle_loads(data):
+    view = memoryview(data)
+    num_buffers, pickle_len = struct.unpack_from('<IQ', view, 0)
+    offset = struct.calcsize('<IQ')
+    buffer_lens = struct.unpack_from('<' + 'Q' * num_buffers, view, offset)
+    offset += 8 * num_buffers
+    pickled = view[offset:offset + pickle_len]
+    offset += pickle_len
+    buffers = []
+    for buffer_len in buffer_lens:
+        buffers.append(view[offset:offset + buffer_len])
+        offset += buffer_len
+    return pickle.loads(pickled, buffers=buffers)
+
+
+# NPY frame: a JSON index followed by NPY-formatted arrays, so that a dictionary
+# of inputs/outputs can mix arrays with plain JSON values.
+def _npy_dumps(obj):
+    import numpy as np
+
+    if isinstance(obj, np.ndarray):
+        obj, single_array = {'': obj}, True
+    else:
+        single_array = False
+
+    if not isinstance(obj, dict):
+        raise TypeError('NPY serialization expects an array or a dictionary')
+
+    index = {'single_array': single_array, 'entries': {}}
+    blobs = io.BytesIO()
+    for key, val in obj.items():
+        if isinstance(val, np.ndarray):
+            start = blobs.tell()
+            np.lib.format.write_array(blobs, val, allow_pickle=False)
+            index['entries'][key] = ['npy', start, blobs.tell() - start]
+        else:
+            index['entries'][key] = ['json', val]
+
+    index_bytes = json.dumps(index, default=_json_default).encode()
+    return struct.pack('<Q', len(index_bytes)) + index_bytes + blobs.getvalue()
+
+
+def _npy_loads(data):
+    import numpy as np
+
+    view = memoryview(data)
+    (index_len,) = struct.unpack_from('<Q', view, 0)
+    index = json.loads(bytes(view[8:8 + index_len]).decode())
+    blobs = view[8 + index_len:]
+    obj = {}
+    for key, entry in index['entries'].items():
+        if entry[0] == 'npy':
+            obj[key] = np.lib.format.read_array(
+                io.BytesIO(blobs[entry[1]:entry[1] + entry[2]]), allow_pickle=False)
+        else:
+            obj[key] = entry[1]
+    return obj[''] if index['single_array'] else obj
+
+
+def _zlib_compress(data):
+    import zlib
+    return zlib.compress(data)
+
+
+def _zlib_decompress(data):
+    import zlib
+    return zlib.decompress(data)
+
+
+def _zstd_compress(data):
+    import zstandard
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _lz4_compress(data):
+    import lz4.frame
+    return lz4.frame.compress(data)
+
+
+def _lz4_decompress(data):
+    import lz4.frame
+    return lz4.frame.decompress(data)
+
+
+register_serializer('json', _json_dumps, _json_loads)
+register_serializer('msgpack', _msgpack_dumps, _msgpack_loads)
+register_serializer('pickle', _pickle_dumps, _pickle_loads)
+register_serializer('npy', _npy_dumps, _npy_loads)
+
+register_compressor('zlib', _zlib_compress, _zlib_decompress)
+register_compressor('zstd', _zstd_compress, _zstd_decompress)
+register_compressor('lz4', _lz4_compress, _lz4_decompress)
+
+
+def _pack_name(name):
+    encoded = name.encode()
+    return struct.pack('<B', len(encoded)) + encoded
+
+
+def _unpack_name(view, offset):
+    (name_len,) = struct.unpack_from('<B', view, offset)
+    return bytes(view[offset + 1:offset + 1 + name_len]).decode(), offset + 1 + name_len
+
+
+def encode_payload(obj, serialization_format='json', compression=None):
+    if serialization_format not in _serializers:
+        raise Exception('Unknown serialization format ' + str(serialization_format) +
+                        ', available formats: ' + str(available_serializers()))
+    if compression and compression not in _compressors:
+        raise Exception('Unknown compression ' + str(compression) +
+                        ', available compressions: ' + str(available_compressors()))
+
+    start_time = time.perf_counter()
+    data = _serializers[serialization_format][0](obj)
+    num_bytes = len(data)
+    if compression:
+        data = _compressors[compression][0](data)
+
+    frame = MAGIC + _pack_name(serialization_format) + \
+        _pack_name(compression or '') + data
+    stats = SerializationStats(serialization_format, compression, num_bytes,
+                               len(data), time.perf_counter() - start_time)
+    return frame, stats
+
+
+def decode_payload(frame):
+    start_time = time.perf_counter()
+    view = memoryview(frame)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise Exception('Payload is not a TwinGraph serialized frame')
+
+    serialization_format, offset = _unpack_name(view, len(MAGIC))
+    compression, offset = _unpack_name(view, offset)
+    data = view[offset:]
+    compressed_bytes = len(data)
+    if compression:
+        data = _compressors[compression][1](data)
+
+    obj = _serializers[serialization_format][1](data)
+    stats = SerializationStats(serialization_format, compression or None, len(data),
+                               compressed_bytes, time.perf_counter() - start_time)
+    return obj, stats
+
+
+def register_kombu_serializer(serialization_format='json', compression=None, name='twingraph'):
+    from kombu.serialization import register
+
+    def _encode(obj):
+        return encode_payload(obj, serialization_format, compression)[0]
+
+    def _decode(data):
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        return decode_payload(data)[0]
+
+    register(name, _encode, _decode,
+             content_type='application/x-' + name, content_encoding='binary')
+    return name
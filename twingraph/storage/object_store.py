@@ -0,0 +1,116 @@
+######################################################################
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved. #
+# SPDX-License-Identifier: MIT-0                                     #
+######################################################################
+
+# Like the serializers, this module only needs the standard library at import
+# time (boto3 is imported lazily for S3) so that it can be shipped into
+# component containers to resolve payload URIs.
+
+import hashlib
+import os
+import tempfile
+from urllib.parse import urlparse
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class LocalObjectStore:
+    # Works on a local directory or on a volume shared with the containers,
+    # e.g. a bind mount, NFS/EFS or a Kubernetes persistent volume.
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def uri(self, key):
+        return 'file://' + self._path(key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, data, key=None):
+        key = key or content_key(data)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_descriptor, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(path))
+            with os.fdopen(file_descriptor, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        return self.uri(key)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as data_file:
+            return data_file.read()
+
+
+class S3ObjectStore:
+    # endpoint_url can point to any S3 compatible service, for example a local
+    # MinIO server (http://localhost:9000) for testing.
+    def __init__(self, bucket, prefix='', endpoint_url=None, region_name=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        try:
+            from twingraph.awsmodules.clients import get_client
+            self.client = get_client('s3', region_name, endpoint_url)
+        except ImportError:
+            # shipped into a container without TwinGraph (runner bootstrap)
+            import boto3
+            self.client = boto3.client(
+                's3', endpoint_url=endpoint_url, region_name=region_name)
+
+    def _object_key(self, key):
+        return self.prefix + '/' + key if self.prefix else key
+
+    def uri(self, key):
+        return 's3://' + self.bucket + '/' + self._object_key(key)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(
+                Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception:
+            return False
+
+    def put(self, data, key=None):
+        key = key or content_key(data)
+        if not self.exists(key):
+            self.client.put_object(
+                Bucket=self.bucket, Key=self._object_key(key), Body=data)
+        return self.uri(key)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body'].read()
+
+
+def get_object_store(uri, endpoint_url=None, region_name=None):
+    parsed_uri = urlparse(uri)
+    if parsed_uri.scheme in ('', 'file'):
+        return LocalObjectStore(parsed_uri.path)
+    elif parsed_uri.scheme == 's3':
+        return S3ObjectStore(parsed_uri.netloc, parsed_uri.path, endpoint_url, region_name)
+    raise Exception('Unsupported object store URI ' + uri)
+
+
+def split_uri(uri):
+    base_uri, key = uri.rsplit('/', 1)
+    if urlparse(uri).scheme in ('', 'file'):
+        # Local objects are sharded into sub-directories by key prefix.
+        base_uri = base_uri.rsplit('/', 1)[0]
+    return base_uri, key
+
+
+def resolve_uri(uri, endpoint_url=None, region_name=None):
+    base_uri, key = split_uri(uri)
+    return get_object_store(base_uri, endpoint_url, region_name).get(key)
+
+
+def store_uri(uri, data, endpoint_url=None, region_name=None):
+    base_uri, key = split_uri(uri)
+    return get_object_store(base_uri, endpoint_url, region_name).put(data, key)